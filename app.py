@@ -7,16 +7,25 @@ import time
 
 from channel import channel_factory
 from common import const
-from config import load_config
+from common.reply_cache import save_reply_cache
+from common.session_store import flush_session_stores
+from config import load_config, start_config_watcher
 from plugins import *
 import threading
 
 
+_channel = None  # 当前运行的通道，退出时等待其处理完已排队的消息
+
+
 def sigterm_handler_wrap(_signo):
     old_handler = signal.getsignal(_signo)
 
     def func(_signo, _stack_frame):
         logger.info("signal {} received, exiting...".format(_signo))
+        if _channel is not None and hasattr(_channel, "shutdown"):
+            _channel.shutdown()
+        flush_session_stores()
+        save_reply_cache()
         conf().save_user_datas()
         if callable(old_handler):  #  check old_handler
             return old_handler(_signo, _stack_frame)
@@ -26,11 +35,20 @@ def sigterm_handler_wrap(_signo):
 
 
 def start_channel(channel_name: str):
+    global _channel
     channel = channel_factory.create_channel(channel_name)
+    _channel = channel
     if channel_name in ["wx", "wxy", "terminal", "wechatmp","wechatmp_service", "wechatcom_app", "wework",
                         "wechatcom_service", "gewechat", "web", "wx849", const.FEISHU, const.DINGTALK]:
         PluginManager().load_plugins()
 
+    if conf().get("metrics_port"):
+        try:
+            from common.metrics import start_metrics_server
+            start_metrics_server(conf().get("metrics_host", "127.0.0.1"), conf().get("metrics_port"))
+        except Exception as e:
+            logger.error("[Metrics] failed to start metrics endpoint: {}".format(e))
+
     if conf().get("use_linkai"):
         try:
             from common import linkai_client
@@ -44,6 +62,8 @@ def run():
     try:
         # load config
         load_config()
+        if conf().get("config_hot_reload", False):
+            start_config_watcher()
         # ctrl + c
         sigterm_handler_wrap(signal.SIGINT)
         # kill signal
@@ -8,6 +8,9 @@ from bridge.reply import Reply
 
 
 class Bot(object):
+    # 可选实现 async def async_reply(self, query, context) -> Reply，
+    # ChatChannel的异步流水线(async_pipeline)会直接在通道事件循环上await该方法，未实现时在线程池中调用reply
+
     def reply(self, query, context: Context = None) -> Reply:
         """
         bot auto-reply content
@@ -1,4 +1,4 @@
-from common.expired_dict import ExpiredDict
+from common.session_store import build_session_store
 from config import conf
 from common.log import logger
 
@@ -66,11 +66,8 @@ class CozeSession(object):
 
 class CozeSessionManager(object):
     def __init__(self, sessioncls, **session_args):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
+        # 会话存储由session_store配置决定，内存LRU或SQLite持久化，按会话类区分命名空间
+        self.sessions = build_session_store("{}.{}".format(sessioncls.__module__, sessioncls.__name__))
         self.sessioncls = sessioncls
         self.session_args = session_args
 
@@ -95,6 +92,7 @@ class CozeSessionManager(object):
         #     logger.debug("prompt tokens used={}".format(total_tokens))
         # except Exception as e:
         #     logger.warning("Exception when counting tokens precisely for prompt: {}".format(str(e)))
+        self.save_session(session)
         return session
 
     def session_reply(self, reply, user_id, session_id, total_tokens=None):
@@ -106,8 +104,14 @@ class CozeSessionManager(object):
             logger.debug("raw total_tokens={}, savesession tokens={}".format(total_tokens, tokens_cnt))
         except Exception as e:
             logger.warning("Exception when counting tokens precisely for session: {}".format(str(e)))
+        self.save_session(session)
         return session
 
+    def save_session(self, session):
+        """会话被修改后调用，sqlite存储据此写回"""
+        if session.get_session_id() is not None:
+            self.sessions.put(session.get_session_id(), session)
+
     # def get_session(self, session_id, user_id):
     #     session = self._build_session(session_id, user_id)
     #     return session
@@ -1,3 +1,5 @@
+import functools
+
 from bot.session_manager import Session
 from common.log import logger
 from common import const
@@ -16,8 +18,53 @@ class ChatGPTSession(Session):
     def __init__(self, session_id, system_prompt=None, model="gpt-3.5-turbo"):
         super().__init__(session_id, system_prompt)
         self.model = model
+        self._token_cache = {}  # id(message) -> (message, 消息内容, tokens)，每条消息只编码一次，内容被修改后重新计算
+        self._token_cache_model = model
         self.reset()
 
+    def reset(self):
+        super().reset()
+        self._token_cache = {}
+
+    def __getstate__(self):
+        # token缓存以id(message)为key，反序列化后失效，持久化时不保存
+        state = self.__dict__.copy()
+        state["_token_cache"] = {}
+        return state
+
+    def add_query(self, query):
+        super().add_query(query)
+        self._count_on_add(self.messages[-1])
+
+    def add_reply(self, reply):
+        super().add_reply(reply)
+        self._count_on_add(self.messages[-1])
+
+    def _count_on_add(self, message):
+        try:
+            self.message_tokens(message)
+        except Exception as e:
+            logger.debug("Exception when counting tokens for message: {}".format(e))
+
+    def message_tokens(self, message):
+        """单条消息的token数，结果按消息对象缓存"""
+        if self._token_cache_model != self.model:
+            self._token_cache = {}
+            self._token_cache_model = self.model
+        items = tuple(message.items())
+        cached = self._token_cache.get(id(message))
+        if cached is not None and cached[0] is message and cached[1] == items:
+            return cached[2]
+        tokens = num_tokens_for_message(message, self.model)
+        self._token_cache[id(message)] = (message, items, tokens)
+        return tokens
+
+    def _forget(self, message):
+        cached = self._token_cache.pop(id(message), None)
+        if cached is not None and cached[0] is message and cached[1] == tuple(message.items()):
+            return cached[2]
+        return num_tokens_for_message(message, self.model)
+
     def discard_exceeding(self, max_tokens, cur_tokens=None):
         precise = True
         try:
@@ -27,13 +74,14 @@ class ChatGPTSession(Session):
             if cur_tokens is None:
                 raise e
             logger.debug("Exception when counting tokens precisely for query: {}".format(e))
+        # 总数只计算一次，之后每丢弃一条消息减去它缓存的token数
         while cur_tokens > max_tokens:
             if len(self.messages) > 2:
-                self.messages.pop(1)
+                popped = self.messages.pop(1)
             elif len(self.messages) == 2 and self.messages[1]["role"] == "assistant":
-                self.messages.pop(1)
+                popped = self.messages.pop(1)
                 if precise:
-                    cur_tokens = self.calc_tokens()
+                    cur_tokens -= self._forget(popped)
                 else:
                     cur_tokens = cur_tokens - max_tokens
                 break
@@ -44,58 +92,71 @@ class ChatGPTSession(Session):
                 logger.debug("max_tokens={}, total_tokens={}, len(messages)={}".format(max_tokens, cur_tokens, len(self.messages)))
                 break
             if precise:
-                cur_tokens = self.calc_tokens()
+                cur_tokens -= self._forget(popped)
             else:
                 cur_tokens = cur_tokens - max_tokens
         return cur_tokens
 
     def calc_tokens(self):
-        return num_tokens_from_messages(self.messages, self.model)
-
-
-# refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
-def num_tokens_from_messages(messages, model):
-    """Returns the number of tokens used by a list of messages."""
+        if len(self._token_cache) > 2 * len(self.messages) + 8:
+            # 消息被外部直接删除时清理缓存，避免无限增长
+            live = {id(m) for m in self.messages}
+            self._token_cache = {k: v for k, v in self._token_cache.items() if k in live}
+        return sum(self.message_tokens(m) for m in self.messages) + _token_counter(self.model)[3]
 
-    if model in ["wenxin", "xunfei"] or model.startswith(const.GEMINI):
-        return num_tokens_by_character(messages)
 
+@functools.lru_cache(maxsize=None)
+def _encoding_for_model(model):
     import tiktoken
 
-    if model in ["gpt-3.5-turbo-0301", "gpt-35-turbo", "gpt-3.5-turbo-1106", "moonshot", const.LINKAI_35]:
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    elif model in ["gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613",
-                   "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613", "gpt-35-turbo-16k", "gpt-4-turbo-preview",
-                   "gpt-4-1106-preview", const.GPT4_TURBO_PREVIEW, const.GPT4_VISION_PREVIEW, const.GPT4_TURBO_01_25,
-                   const.GPT_4o, const.GPT_4O_0806, const.GPT_4o_MINI, const.LINKAI_4o, const.LINKAI_4_TURBO]:
-        return num_tokens_from_messages(messages, model="gpt-4")
-    elif model.startswith("claude-3"):
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
     try:
-        encoding = tiktoken.encoding_for_model(model)
+        return tiktoken.encoding_for_model(model)
     except KeyError:
         logger.debug("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model == "gpt-3.5-turbo":
-        tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
-        tokens_per_name = -1  # if there's a name, the role is omitted
-    elif model == "gpt-4":
-        tokens_per_message = 3
-        tokens_per_name = 1
-    else:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@functools.lru_cache(maxsize=256)
+def _token_counter(model):
+    """
+    解析模型对应的计数方式，结果按模型名缓存
+    :return: (encoding, tokens_per_message, tokens_per_name, reply_priming)，按字符计数的模型encoding为None
+    """
+    if model in ["wenxin", "xunfei"] or model.startswith(const.GEMINI):
+        return None, 0, 0, 0
+    if model in ["gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613",
+                 "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613", "gpt-35-turbo-16k", "gpt-4-turbo-preview",
+                 "gpt-4-1106-preview", const.GPT4_TURBO_PREVIEW, const.GPT4_VISION_PREVIEW, const.GPT4_TURBO_01_25,
+                 const.GPT_4o, const.GPT_4O_0806, const.GPT_4o_MINI, const.LINKAI_4o, const.LINKAI_4_TURBO, "gpt-4"]:
+        # every message follows <|start|>{role/name}\n{content}<|end|>\n
+        return _encoding_for_model("gpt-4"), 3, 1, 3
+    if model not in ["gpt-3.5-turbo", "gpt-3.5-turbo-0301", "gpt-35-turbo", "gpt-3.5-turbo-1106", "moonshot", const.LINKAI_35] \
+            and not model.startswith("claude-3"):
         logger.debug(f"num_tokens_from_messages() is not implemented for model {model}. Returning num tokens assuming gpt-3.5-turbo.")
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
+    # if there's a name, the role is omitted
+    return _encoding_for_model("gpt-3.5-turbo"), 4, -1, 3
+
+
+def num_tokens_for_message(message, model):
+    """Returns the number of tokens used by a single message, without the reply priming."""
+    encoding, tokens_per_message, tokens_per_name, _ = _token_counter(model)
+    if encoding is None:
+        return len(message["content"])
+    num_tokens = tokens_per_message
+    for key, value in message.items():
+        num_tokens += len(encoding.encode(value))
+        if key == "name":
+            num_tokens += tokens_per_name
     return num_tokens
 
 
+# refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+def num_tokens_from_messages(messages, model):
+    """Returns the number of tokens used by a list of messages."""
+    reply_priming = _token_counter(model)[3]  # every reply is primed with <|start|>assistant<|message|>
+    return sum(num_tokens_for_message(message, model) for message in messages) + reply_priming
+
+
 def num_tokens_by_character(messages):
     """Returns the number of tokens used by a list of messages."""
     tokens = 0
@@ -4,6 +4,9 @@ import os
 import mimetypes
 import threading
 import json
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 
 import requests
@@ -15,6 +18,8 @@ from bot.dify.dify_session import DifySession, DifySessionManager
 from bridge.context import ContextType, Context
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.expired_dict import ExpiredDict
+from common import http_client
 from common import const, memory
 from common.utils import parse_markdown_text, print_red
 from common.tmp_dir import TmpDir
@@ -22,6 +27,50 @@ from config import conf
 
 UNKNOWN_ERROR_MSG = "我暂时遇到了一些问题，请您稍后重试~"
 
+# 缓存和线程池在首次使用时按配置创建，配置重新加载后按新的配置重建
+_upload_cache = None  # 已上传文件的缓存 (api_base, user, 内容SHA-256) -> upload_file_id，过期时间应不超过dify保留上传文件的时间
+_uploading = {}  # 正在上传的key -> threading.Event
+_prefetching = {}  # 图片路径 -> 后台预上传的Future，完成后删除
+_upload_lock = threading.Lock()
+_upload_executor = None
+_media_executor = None
+
+
+def _get_upload_cache() -> ExpiredDict:
+    global _upload_cache
+    ttl = conf().get("dify_upload_cache_ttl", 3600)
+    with _upload_lock:
+        if _upload_cache is None or _upload_cache.expires_in_seconds != ttl:
+            _upload_cache = ExpiredDict(ttl, maxsize=5000, refresh_on_read=False)
+        return _upload_cache
+
+
+def _get_upload_executor() -> ThreadPoolExecutor:
+    global _upload_executor
+    with _upload_lock:
+        if _upload_executor is None:
+            _upload_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dify_upload")
+        return _upload_executor
+
+
+def _get_media_executor() -> ThreadPoolExecutor:
+    global _media_executor
+    workers = conf().get("dify_media_workers", 4)
+    with _upload_lock:
+        if _media_executor is None or _media_executor._max_workers != workers:
+            old_executor = _media_executor
+            _media_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dify_media")
+            if old_executor is not None:
+                old_executor.shutdown(wait=False)
+        return _media_executor
+
+
+def _prefetch_done(path, future):
+    with _upload_lock:
+        if _prefetching.get(path) is future:
+            del _prefetching[path]
+
+
 class DifyBot(Bot):
     def __init__(self):
         super().__init__()
@@ -50,17 +99,11 @@ class DifyBot(Bot):
                 query = conf().get('image_create_prefix', ['画'])[0] + query
             logger.info("[DIFY] query={}".format(query))
             session_id = context["session_id"]
-            # TODO: 适配除微信以外的其他channel
-            channel_type = conf().get("channel_type", "wx849")
-            user = None
-            if channel_type in ["wx849", "wework", "gewechat"]:
-                user = context["msg"].other_user_nickname if context.get("msg") else "default"
-            elif channel_type in ["wechatcom_app", "wechatmp", "wechatmp_service", "wechatcom_service", "web"]:
-                user = context["msg"].other_user_id if context.get("msg") else "default"
-            else:
+            user = self._get_dify_user(context)
+            if user is None:
+                channel_type = conf().get("channel_type", "wx849")
                 return Reply(ReplyType.ERROR, f"unsupported channel type: {channel_type}, now dify only support wx, wechatcom_app, wechatmp, wechatmp_service channel")
             logger.debug(f"[DIFY] dify_user={user}")
-            user = user if user else "default" # 防止用户名为None，当被邀请进的群未设置群名称时用户名为None
             session = self.sessions.get_session(session_id, user)
             if context.get("isgroup", False):
                 # 群聊：根据是否是共享会话群来决定是否设置用户信息
@@ -82,6 +125,7 @@ class DifyBot(Bot):
             logger.debug(f"[DIFY] session={session} query={query}")
 
             reply, err = self._reply(query, session, context)
+            self.sessions.save_session(session)  # 用户信息和conversation_id可能已更新
             if err != None:
                 dify_error_reply = conf().get("dify_error_reply", None)
                 error_msg = dify_error_reply if dify_error_reply else err
@@ -91,6 +135,105 @@ class DifyBot(Bot):
             reply = Reply(ReplyType.ERROR, "Bot不支持处理{}类型的消息".format(context.type))
             return reply
 
+    def _get_dify_user(self, context: Context):
+        """dify的user字段，不支持的通道返回None"""
+        # TODO: 适配除微信以外的其他channel
+        channel_type = conf().get("channel_type", "wx849")
+        if channel_type in ["wx849", "wework", "gewechat"]:
+            user = context["msg"].other_user_nickname if context.get("msg") else "default"
+        elif channel_type in ["wechatcom_app", "wechatmp", "wechatmp_service", "wechatcom_service", "web"]:
+            user = context["msg"].other_user_id if context.get("msg") else "default"
+        else:
+            return None
+        return user if user else "default" # 防止用户名为None，当被邀请进的群未设置群名称时用户名为None
+
+    def prefetch_image(self, context: Context):
+        """
+        收到图片消息时在后台提前上传，后续的文本提问直接使用缓存的upload_file_id，不必等待上传
+        """
+        if not self._get_dify_conf(context, "image_recognition", False):
+            return
+        user = self._get_dify_user(context)
+        if user is None:
+            return
+        msg = context.get("msg")
+        path = context.content
+
+        def upload():
+            try:
+                if msg:
+                    msg.prepare()
+                self._upload_image(path, user)
+            except Exception as e:
+                logger.warning(f"[DIFY] prefetch upload failed: {e}")
+
+        future = _get_upload_executor().submit(upload)
+        with _upload_lock:
+            _prefetching[path] = future
+        # 已完成的Future会立即回调，因此回调总在登记之后执行
+        future.add_done_callback(functools.partial(_prefetch_done, path))
+
+    def _upload_image(self, path, user):
+        """
+        上传图片并返回upload_file_id，按(api_base, user, 内容SHA-256)缓存
+        同一张图片正在上传时等待该次上传完成，不重复上传
+        """
+        with open(path, 'rb') as file:
+            data = file.read()
+        key = (self.api_base, user, hashlib.sha256(data).hexdigest())
+        upload_cache = _get_upload_cache()
+        file_id = upload_cache.get(key)
+        if file_id:
+            logger.debug(f"[DIFY] upload cache hit, file_id={file_id}")
+            return file_id
+        with _upload_lock:
+            uploading = _uploading.get(key)
+            if uploading is None:
+                uploading = _uploading[key] = threading.Event()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            uploading.wait(conf().get("request_timeout", 180))
+            file_id = upload_cache.get(key)
+            if file_id:
+                return file_id
+        try:
+            file_id = self._do_upload(path, data, user)
+            if file_id:
+                upload_cache[key] = file_id
+            return file_id
+        finally:
+            if owner:
+                with _upload_lock:
+                    _uploading.pop(key, None)
+                uploading.set()
+
+    def _do_upload(self, path, data, user):
+        dify_client = DifyClient(self.api_key, self.api_base)
+        file_name = os.path.basename(path)
+        file_type, _ = mimetypes.guess_type(file_name)
+        files = {
+            'file': (file_name, data, file_type)
+        }
+        response = dify_client.file_upload(user=user, files=files)
+        if response.status_code != 200 and response.status_code != 201:
+            error_info = f"[DIFY] response text={response.text} status_code={response.status_code} when upload file"
+            logger.warning(error_info)
+            return None
+        # {
+        #     'id': 'f508165a-10dc-4256-a7be-480301e630e6',
+        #     'name': '0.png',
+        #     'size': 17023,
+        #     'extension': 'png',
+        #     'mime_type': 'image/png',
+        #     'created_by': '0d501495-cfd4-4dd4-a78b-a15ed4ed77d1',
+        #     'created_at': 1722781568
+        # }
+        file_upload_data = response.json()
+        logger.debug("[DIFY] upload file {}".format(file_upload_data))
+        return file_upload_data['id']
+
     def _handle_model_command(self, model):
         """处理模型切换命令"""
         if model in self.supported_app_types:
@@ -126,6 +269,8 @@ class DifyBot(Bot):
         try:
             session.count_user_message() # 限制一个conversation中消息数，防止conversation过长
             # 使用内部状态而不是配置
+            if self.current_app_type in ['chatbot', 'chatflow', 'agent'] and self._get_dify_conf(context, "dify_streaming", False):
+                return self._handle_streaming(query, session, context)
             if self.current_app_type == 'chatbot' or self.current_app_type == 'chatflow':
                 return self._handle_chatbot(query, session, context)
             elif self.current_app_type == 'agent':
@@ -183,79 +328,62 @@ class DifyBot(Bot):
         answer = rsp_data['answer']
         parsed_content = parse_markdown_text(answer)
 
+        # 设置dify conversation_id, 依靠dify管理上下文
+        if session.get_conversation_id() == '':
+            session.set_conversation_id(rsp_data['conversation_id'])
+
         # {"answer": "![image](/files/tools/dbf9cd7c-2110-4383-9ba8-50d9fd1a4815.png?timestamp=1713970391&nonce=0d5badf2e39466042113a4ba9fd9bf83&sign=OVmdCxCEuEYwc9add3YNFFdUpn4VdFKgl84Cg54iLnU=)"}
+        # parsed_content 没有数据时，直接不回复
+        if not parsed_content:
+            return None, None
         at_prefix = ""
         channel = context.get("channel")
-        is_group = context.get("isgroup", False)
-        if is_group:
+        if context.get("isgroup", False):
             at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
-        for item in parsed_content[:-1]:
-            reply = None
-            if item['type'] == 'text':
-                content = at_prefix + item['content']
-                reply = Reply(ReplyType.TEXT, content)
-            elif item['type'] == 'image':
-                image_url = self._fill_file_base_url(item['content'])
-                image = self._download_image(image_url)
-                if image:
-                    reply = Reply(ReplyType.IMAGE, image)
-                else:
-                    reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
-            elif item['type'] == 'file':
-                file_url = self._fill_file_base_url(item['content'])
-                file_path = self._download_file(file_url)
-                if file_path:
-                    reply = Reply(ReplyType.FILE, file_path)
-                else:
-                    reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+        final_reply = None
+        for index, reply in enumerate(self._iter_item_replies(parsed_content)):
+            if index == len(parsed_content) - 1:
+                final_reply = reply
+                break
+            if reply and reply.type == ReplyType.TEXT:
+                reply = Reply(ReplyType.TEXT, at_prefix + reply.content)
             logger.debug(f"[DIFY] reply={reply}")
             if reply and channel:
-                channel.send(reply, context)
-        # parsed_content 没有数据时，直接不回复
-        if not parsed_content:
-            return None, None
-        final_item = parsed_content[-1]
-        final_reply = None
-        if final_item['type'] == 'text':
-            content = final_item['content']
-            if is_group:
-                at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
-                content = at_prefix + content
-            final_reply = Reply(ReplyType.TEXT, final_item['content'])
-        elif final_item['type'] == 'image':
-            image_url = self._fill_file_base_url(final_item['content'])
-            image = self._download_image(image_url)
-            if image:
-                final_reply = Reply(ReplyType.IMAGE, image)
-            else:
-                final_reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
-        elif final_item['type'] == 'file':
-            file_url = self._fill_file_base_url(final_item['content'])
-            file_path = self._download_file(file_url)
-            if file_path:
-                final_reply = Reply(ReplyType.FILE, file_path)
-            else:
-                final_reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+                self._send_part(channel, reply, context)
+        return final_reply, None
 
-        # 设置dify conversation_id, 依靠dify管理上下文
-        if session.get_conversation_id() == '':
-            session.set_conversation_id(rsp_data['conversation_id'])
+    @staticmethod
+    def _send_part(channel, reply, context: Context):
+        """发送回复中间的部分，并在context中标记，返回的最后一段不是完整回复，不能写入回复缓存"""
+        context["reply_parts_sent"] = True
+        channel.send(reply, context)
 
-        return final_reply, None
+    def _iter_item_replies(self, items):
+        """
+        按原顺序返回parse_markdown_text各项对应的回复，图片和文件提交到线程池并发下载，
+        前面的项准备好后立即返回，不必等待后面的下载完成
+        """
+        media_executor = _get_media_executor()
+        futures = [media_executor.submit(self._markdown_item_reply, item) if item['type'] in ['image', 'file'] else None
+                   for item in items]
+        try:
+            for item, future in zip(items, futures):
+                yield future.result() if future else self._markdown_item_reply(item)
+        finally:
+            for future in futures:
+                if future:
+                    future.cancel()
 
     def _download_file(self, url):
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            parsed_url = urlparse(url)
             logger.debug(f"Downloading file from {url}")
-            url_path = unquote(parsed_url.path)
+            url_path = unquote(urlparse(url).path)
             # 从路径中提取文件名
             file_name = url_path.split('/')[-1]
-            logger.debug(f"Saving file as {file_name}")
             file_path = os.path.join(TmpDir().path(), file_name)
+            logger.debug(f"Saving file as {file_name}")
             with open(file_path, 'wb') as file:
-                file.write(response.content)
+                self._stream_media(url, file)
             return file_path
         except Exception as e:
             logger.error(f"Error downloading {url}: {e}")
@@ -263,13 +391,8 @@ class DifyBot(Bot):
 
     def _download_image(self, url):
         try:
-            pic_res = requests.get(url, stream=True)
-            pic_res.raise_for_status()
             image_storage = io.BytesIO()
-            size = 0
-            for block in pic_res.iter_content(1024):
-                size += len(block)
-                image_storage.write(block)
+            size = self._stream_media(url, image_storage)
             logger.debug(f"[WX] download image success, size={size}, img_url={url}")
             image_storage.seek(0)
             return image_storage
@@ -277,6 +400,23 @@ class DifyBot(Bot):
             logger.error(f"Error downloading {url}: {e}")
         return None
 
+    def _stream_media(self, url, output):
+        """分块下载到output，超过dify_media_max_size_mb时中止，返回下载的字节数"""
+        max_size = conf().get("dify_media_max_size_mb", 50) * 1024 * 1024
+        timeout = (conf().get("http_connect_timeout", 10), conf().get("dify_media_timeout", 60))
+        with http_client.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            content_length = int(response.headers.get("Content-Length") or 0)
+            if max_size and content_length > max_size:
+                raise Exception(f"media too large: {content_length} bytes")
+            size = 0
+            for block in response.iter_content(64 * 1024):
+                size += len(block)
+                if max_size and size > max_size:
+                    raise Exception(f"media too large: more than {max_size} bytes")
+                output.write(block)
+        return size
+
     def _handle_agent(self, query: str, session: DifySession, context: Context):
         api_key = self.api_key
         api_base = self.api_base
@@ -313,10 +453,11 @@ class DifyBot(Bot):
                     at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
                     msg['content'] = at_prefix + msg['content']
                 reply = Reply(ReplyType.TEXT, msg['content'])
-                channel.send(reply, context)
+                self._send_part(channel, reply, context)
             elif msg['type'] == 'message_file':
                 url = self._fill_file_base_url(msg['content']['url'])
                 reply = Reply(ReplyType.IMAGE_URL, url)
+                context["reply_parts_sent"] = True  # 在线程中发送，先标记，避免返回时尚未标记
                 thread = threading.Thread(target=channel.send, args=(reply, context))
                 thread.start()
         final_msg = msgs[-1]
@@ -331,6 +472,60 @@ class DifyBot(Bot):
             session.set_conversation_id(conversation_id)
         return reply, None
 
+    def _handle_streaming(self, query: str, session: DifySession, context: Context):
+        """
+        流式请求chatbot/chatflow/agent应用，每完成一段就发送上一段，最后一段(文本或文件)作为返回值走正常的回复流程
+        """
+        chat_client = ChatClient(self.api_key, self.api_base)
+        payload = self._get_payload(query, session, 'streaming')
+        files = self._get_upload_files(session, context)
+        response = chat_client.create_chat_message(
+            inputs=payload['inputs'],
+            query=payload['query'],
+            user=payload['user'],
+            response_mode=payload['response_mode'],
+            conversation_id=payload['conversation_id'],
+            files=files
+        )
+        if response.status_code != 200:
+            error_info = f"[DIFY] payload={payload} response text={response.text} status_code={response.status_code}"
+            logger.warning(error_info)
+            friendly_error_msg = self._handle_error_response(response.text, response.status_code)
+            return None, friendly_error_msg
+
+        channel = context.get("channel")
+        at_prefix = ""
+        if context.get("isgroup", False):
+            at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
+        final_reply = None
+        for kind, content, is_last in self._iter_stream_segments(response, session):
+            if kind == 'message_file':
+                replies = [Reply(ReplyType.IMAGE_URL, self._fill_file_base_url(content['url']))]
+            else:
+                replies = [reply for reply in self._iter_item_replies(parse_markdown_text(content)) if reply]
+            if is_last and replies:
+                final_reply = replies.pop()  # 最后一段不加@前缀，由通道装饰回复时统一处理
+            for reply in replies:
+                if reply.type == ReplyType.TEXT:
+                    reply = Reply(ReplyType.TEXT, at_prefix + reply.content)
+                logger.debug(f"[DIFY] stream segment reply={reply}")
+                if channel:
+                    self._send_part(channel, reply, context)
+        return final_reply, None
+
+    def _markdown_item_reply(self, item):
+        if item['type'] == 'text':
+            return Reply(ReplyType.TEXT, item['content']) if item['content'].strip() else None
+        if item['type'] == 'image':
+            image_url = self._fill_file_base_url(item['content'])
+            image = self._download_image(image_url)
+            return Reply(ReplyType.IMAGE, image) if image else Reply(ReplyType.TEXT, f"图片链接：{image_url}")
+        if item['type'] == 'file':
+            file_url = self._fill_file_base_url(item['content'])
+            file_path = self._download_file(file_url)
+            return Reply(ReplyType.FILE, file_path) if file_path else Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+        return None
+
     def _handle_workflow(self, query: str, session: DifySession, context: Context):
         payload = self._get_workflow_payload(query, session)
         api_key = self.api_key
@@ -376,41 +571,26 @@ class DifyBot(Bot):
             return None
         # 清理图片缓存
         memory.USER_IMAGE_CACHE[session_id] = None
-        api_key = self.api_key
-        api_base = self.api_base
-        dify_client = DifyClient(api_key, api_base)
         msg = img_cache.get("msg")
         path = img_cache.get("path")
+        with _upload_lock:
+            prefetch = _prefetching.get(path)
+        if prefetch is not None:
+            # 后台预上传时prepare()已把消息标记为准备完成，但文件可能还在下载，等待预上传结束后再读取
+            try:
+                prefetch.result(timeout=conf().get("request_timeout", 180))
+            except Exception as e:
+                logger.warning(f"[DIFY] wait for prefetch upload failed: {e}")
         msg.prepare()
 
-        with open(path, 'rb') as file:
-            file_name = os.path.basename(path)
-            file_type, _ = mimetypes.guess_type(file_name)
-            files = {
-                'file': (file_name, file, file_type)
-            }
-            response = dify_client.file_upload(user=session.get_user(), files=files)
-
-        if response.status_code != 200 and response.status_code != 201:
-            error_info = f"[DIFY] response text={response.text} status_code={response.status_code} when upload file"
-            logger.warning(error_info)
-            return None, error_info
-        # {
-        #     'id': 'f508165a-10dc-4256-a7be-480301e630e6',
-        #     'name': '0.png',
-        #     'size': 17023,
-        #     'extension': 'png',
-        #     'mime_type': 'image/png',
-        #     'created_by': '0d501495-cfd4-4dd4-a78b-a15ed4ed77d1',
-        #     'created_at': 1722781568
-        # }
-        file_upload_data = response.json()
-        logger.debug("[DIFY] upload file {}".format(file_upload_data))
+        file_id = self._upload_image(path, session.get_user())
+        if not file_id:
+            return None
         return [
             {
                 "type": "image",
                 "transfer_method": "local_file",
-                "upload_file_id": file_upload_data['id']
+                "upload_file_id": file_id
             }
         ]
 
@@ -454,20 +634,92 @@ class DifyBot(Bot):
             logger.warning("Received an empty SSE event.")
             return None
 
-    # TODO: 异步返回events
-    def _handle_sse_response(self, response: requests.Response):
-        events = []
+    def _iter_sse_events(self, response: requests.Response):
+        """逐行解析SSE事件，每收到一个事件就返回，不等待整个响应结束"""
         for line in response.iter_lines():
             if line:
-                decoded_line = line.decode('utf-8')
-                event = self._parse_sse_event(decoded_line)
+                event = self._parse_sse_event(line.decode('utf-8'))
                 if event:
-                    events.append(event)
+                    yield event
+
+    @staticmethod
+    def _find_segment_end(text):
+        """
+        返回text中第一个完整段落的结束位置和分隔符，分隔符为//n或空行，代码块内的空行不算
+        没有完整段落时返回(-1, '')
+        """
+        start = 0
+        while True:
+            candidates = [(text.find(sep, start), sep) for sep in ("//n", "\n\n")]
+            candidates = [c for c in candidates if c[0] >= 0]
+            if not candidates:
+                return -1, ''
+            index, sep = min(candidates)
+            if sep == "//n" or text.count("```", 0, index) % 2 == 0:
+                return index, sep
+            start = index + len(sep)
+
+    def _iter_stream_segments(self, response: requests.Response, session: DifySession):
+        """
+        增量解析流式响应，每完成一段就返回(类型, 内容, 是否为最后一段)，类型为text或message_file
+        最近的一段留到下一段产生或回复结束时才返回，保证最后一段(包括文件)标记为最后一段，由通道按正常流程发送
+        """
+        held = None
+        for segment in self._iter_stream_parts(response, session):
+            if held is not None:
+                yield held + (False,)
+            held = segment
+        if held is not None:
+            yield held + (True,)
+
+    def _iter_stream_parts(self, response: requests.Response, session: DifySession):
+        """
+        返回流式响应中完成的各段(类型, 内容)，回复结束时缓冲区中剩余的文本作为最后一段
+        conversation_id在第一条事件到达时即写入session
+        """
+        buffer = ''
+        for event in self._iter_sse_events(response):
+            if session.get_conversation_id() == '' and event.get('conversation_id'):
+                session.set_conversation_id(event['conversation_id'])
+            event_name = event.get('event')
+            if event_name == 'agent_message' or event_name == 'message':
+                buffer += event.get('answer', '')
+                index, sep = self._find_segment_end(buffer)
+                while index >= 0:
+                    if buffer[:index].strip():
+                        yield 'text', buffer[:index]
+                    buffer = buffer[index + len(sep):]
+                    index, sep = self._find_segment_end(buffer)
+            elif event_name == 'agent_thought':
+                if buffer.strip():
+                    yield 'text', buffer
+                buffer = ''
+            elif event_name == 'message_file':
+                if buffer.strip():
+                    yield 'text', buffer
+                buffer = ''
+                if event.get('type') != 'image':
+                    logger.warning("[DIFY] unsupported message file type: {}".format(event))
+                yield 'message_file', event
+            elif event_name == 'message_replace':
+                # 内容审查替换了回复，丢弃尚未发送的部分
+                buffer = event.get('answer', '')
+            elif event_name == 'error':
+                logger.error("[DIFY] error: {}".format(event))
+                raise Exception(event)
+            elif event_name == 'message_end':
+                logger.debug("[DIFY] message_end usage: {}".format(event.get('metadata', {}).get('usage')))
+                break
+        if session.get_conversation_id() == '':
+            raise Exception("conversation_id not found")
+        if buffer.strip():
+            yield 'text', buffer
 
+    def _handle_sse_response(self, response: requests.Response):
         merged_message = []
         accumulated_agent_message = ''
         conversation_id = None
-        for event in events:
+        for event in self._iter_sse_events(response):
             event_name = event['event']
             if event_name == 'agent_message' or event_name == 'message':
                 accumulated_agent_message += event['answer']
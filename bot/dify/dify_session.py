@@ -1,4 +1,4 @@
-from common.expired_dict import ExpiredDict
+from common.session_store import build_session_store
 from config import conf
 
 
@@ -60,11 +60,8 @@ class DifySession(object):
 
 class DifySessionManager(object):
     def __init__(self, sessioncls, **session_kwargs):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
+        # 会话存储由session_store配置决定，内存LRU或SQLite持久化，按会话类区分命名空间
+        self.sessions = build_session_store("{}.{}".format(sessioncls.__module__, sessioncls.__name__))
         self.sessioncls = sessioncls
         self.session_kwargs = session_kwargs
 
@@ -84,6 +81,11 @@ class DifySessionManager(object):
         session = self._build_session(session_id, user)
         return session
 
+    def save_session(self, session):
+        """会话被修改后调用，sqlite存储据此写回"""
+        if session.get_session_id() is not None:
+            self.sessions.put(session.get_session_id(), session)
+
     def clear_session(self, session_id):
         if session_id in self.sessions:
             del self.sessions[session_id]
@@ -1,4 +1,4 @@
-from common.expired_dict import ExpiredDict
+from common.session_store import build_session_store
 from common.log import logger
 from config import conf
 
@@ -38,11 +38,8 @@ class Session(object):
 
 class SessionManager(object):
     def __init__(self, sessioncls, **session_args):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
+        # 会话存储由session_store配置决定，内存LRU或SQLite持久化，按会话类区分命名空间
+        self.sessions = build_session_store("{}.{}".format(sessioncls.__module__, sessioncls.__name__))
         self.sessioncls = sessioncls
         self.session_args = session_args
 
@@ -58,9 +55,15 @@ class SessionManager(object):
             self.sessions[session_id] = self.sessioncls(session_id, system_prompt, **self.session_args)
         elif system_prompt is not None:  # 如果有新的system_prompt，更新并重置session
             self.sessions[session_id].set_system_prompt(system_prompt)
+            self.sessions.put(session_id, self.sessions[session_id])
         session = self.sessions[session_id]
         return session
 
+    def save_session(self, session):
+        """会话被修改后调用，更新会话存储中的大小估算，sqlite存储据此写回"""
+        if session.session_id is not None:
+            self.sessions.put(session.session_id, session)
+
     def session_query(self, query, session_id):
         session = self.build_session(session_id)
         session.add_query(query)
@@ -70,6 +73,7 @@ class SessionManager(object):
             logger.debug("prompt tokens used={}".format(total_tokens))
         except Exception as e:
             logger.warning("Exception when counting tokens precisely for prompt: {}".format(str(e)))
+        self.save_session(session)
         return session
 
     def session_reply(self, reply, session_id, total_tokens=None):
@@ -81,6 +85,7 @@ class SessionManager(object):
             logger.debug("raw total_tokens={}, savesession tokens={}".format(total_tokens, tokens_cnt))
         except Exception as e:
             logger.warning("Exception when counting tokens precisely for session: {}".format(str(e)))
+        self.save_session(session)
         return session
 
     def clear_session(self, session_id):
@@ -0,0 +1,262 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bot.bot_factory import create_bot
+from bridge.context import Context
+from bridge.reply import Reply, ReplyType
+from common.log import logger
+from common.metrics import metrics
+from config import conf
+
+
+class BackendHealth(object):
+    """单个bot后端最近若干次请求的耗时和成功情况"""
+
+    def __init__(self, window=50):
+        self.samples = deque(maxlen=window)  # (耗时秒, 是否成功)
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+
+    def record(self, seconds, ok, failure_threshold, cooldown):
+        self.samples.append((seconds, ok))
+        if ok:
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= failure_threshold:
+                # 连续失败，暂时摘除，冷却结束后重新尝试
+                self.cooldown_until = time.monotonic() + cooldown
+                self.consecutive_failures = 0
+
+    def available(self):
+        return time.monotonic() >= self.cooldown_until
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def p95(self):
+        """成功请求耗时的p95(秒)，样本不足时返回None"""
+        latencies = sorted(seconds for seconds, ok in self.samples if ok)
+        if len(latencies) < 5:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def snapshot(self):
+        p95 = self.p95()
+        return {"requests": len(self.samples), "error_rate": round(self.error_rate(), 3),
+                "p95_ms": round(p95 * 1000) if p95 is not None else None, "available": self.available()}
+
+
+def _copy_context(context: Context) -> Context:
+    """复制context，kwargs中的dict和list也复制一份，避免并发的后端请求互相修改"""
+    if context is None:
+        return None
+    kwargs = {}
+    for key, value in context.kwargs.items():
+        kwargs[key] = value.copy() if isinstance(value, (dict, list)) else value
+    return Context(context.type, context.content, kwargs)
+
+
+class BufferedChannel(object):
+    """
+    交给单个后端请求的通道，后端自行发送的部分回复先缓存，该请求的结果被采用后按顺序发出，之后的发送直接转发
+    未被采用的请求(出错、超时或对冲落败)发送的内容全部丢弃，避免用户收到重复或交错的回复
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.lock = threading.Lock()
+        self.buffered = []  # [(reply, context)]
+        self.state = "buffering"  # buffering, forwarding, discarded
+
+    def send(self, reply, context):
+        with self.lock:
+            if self.state == "buffering":
+                self.buffered.append((reply, context))
+            elif self.state == "forwarding":
+                self.channel.send(reply, context)
+
+    def commit(self):
+        """采用该请求的结果，发出已缓存的部分回复"""
+        with self.lock:
+            buffered, self.buffered = self.buffered, []
+            self.state = "forwarding"
+            for reply, context in buffered:
+                self.channel.send(reply, context)
+
+    def discard(self):
+        with self.lock:
+            self.buffered = []
+            self.state = "discarded"
+
+    def __getattr__(self, name):
+        return getattr(self.channel, name)
+
+
+class _Attempt(object):
+    """一次后端请求：后端类型、开始时间、健康记录锁、独立的context和缓冲通道"""
+
+    def __init__(self, bot_type, context: Context):
+        self.bot_type = bot_type
+        self.started = time.monotonic()
+        self.recorded = threading.Lock()
+        self.context = _copy_context(context)
+        self.channel = None
+        if self.context is not None and self.context.get("channel") is not None:
+            self.channel = self.context["channel"] = BufferedChannel(self.context["channel"])
+
+    def commit(self, context: Context):
+        if self.channel is not None:
+            self.channel.commit()
+        if context is not None and self.context.get("reply_parts_sent"):
+            context["reply_parts_sent"] = True
+
+    def discard(self):
+        if self.channel is not None:
+            self.channel.discard()
+
+
+class BotRouter(object):
+    """
+    多个chat bot后端之间的路由，按配置顺序优先，出错、超时或明显变慢时切换到更健康的后端
+    chat_backend_hedge开启时，请求超过当前后端p95耗时仍未返回，会同时向下一个后端发起请求，采用先返回的结果
+    """
+
+    def __init__(self, bot_types):
+        self.bot_types = list(bot_types)
+        self.bots = {}
+        self.health = {bot_type: BackendHealth() for bot_type in self.bot_types}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.bot_types)), thread_name_prefix="bot_router")
+        metrics.register_gauge("bot_backends", self.stats)
+
+    def get_bot(self, bot_type):
+        bot = self.bots.get(bot_type)
+        if bot is None:
+            with self.lock:
+                bot = self.bots.get(bot_type)
+                if bot is None:
+                    logger.info("[BotRouter] create bot {}".format(bot_type))
+                    bot = self.bots[bot_type] = create_bot(bot_type)
+        return bot
+
+    def ranked(self):
+        """
+        按优先顺序返回后端：可用的排在前面；可用后端中按配置顺序，
+        但p95耗时超过最快后端chat_backend_latency_slack倍或错误率超过50%的后端排到后面
+        """
+        available = [t for t in self.bot_types if self.health[t].available()]
+        cooling = [t for t in self.bot_types if t not in available]
+        latencies = [self.health[t].p95() for t in available]
+        known = [latency for latency in latencies if latency is not None]
+        fastest = min(known) if known else None
+        slack = conf().get("chat_backend_latency_slack", 2.0)
+
+        def degraded(bot_type, latency):
+            if self.health[bot_type].error_rate() > 0.5:
+                return True
+            return fastest is not None and latency is not None and latency > fastest * slack
+
+        healthy = [t for t, latency in zip(available, latencies) if not degraded(t, latency)]
+        slow = [t for t in available if t not in healthy]
+        return healthy + slow + cooling
+
+    def _record(self, bot_type, recorded, seconds, ok):
+        """每个请求只记录一次：超时和线程结束时都会尝试记录，先拿到recorded锁的一方记录"""
+        if not recorded.acquire(blocking=False):
+            return
+        self.health[bot_type].record(seconds, ok, conf().get("chat_backend_failure_threshold", 3),
+                                     conf().get("chat_backend_cooldown", 30))
+
+    def _call(self, bot_type, query, context, recorded):
+        start = time.perf_counter()
+        ok = False
+        try:
+            with metrics.timer("bot", bot_type):
+                reply = self.get_bot(bot_type).reply(query, context)
+            ok = reply is not None and reply.type != ReplyType.ERROR
+            return reply
+        finally:
+            self._record(bot_type, recorded, time.perf_counter() - start, ok)
+
+    def _hedge_delay(self, bot_type):
+        if not conf().get("chat_backend_hedge", False):
+            return None
+        p95 = self.health[bot_type].p95()
+        minimum = conf().get("chat_backend_hedge_min_ms", 3000) / 1000
+        return max(p95, minimum) if p95 is not None else None
+
+    def reply(self, query, context: Context) -> Reply:
+        """
+        依次尝试各后端，出错或超时后切换到下一个；开启对冲时当前请求超过p95仍未返回就同时请求下一个后端
+        所有后端都失败时返回最后一个错误回复
+        对冲和切换时多个后端可能同时处理，各自使用独立的context副本和缓冲通道，只发出被采用的请求自行发送的部分回复
+        """
+        timeout = conf().get("chat_backend_timeout", 120)
+        candidates = self.ranked()
+        pending = {}  # future -> _Attempt
+        next_index = 0
+        latest = None
+        launch_next = True
+        last_reply = None
+        while True:
+            if launch_next and next_index < len(candidates):
+                bot_type = candidates[next_index]
+                next_index += 1
+                if pending:
+                    logger.info("[BotRouter] hedge request to {}".format(bot_type))
+                attempt = _Attempt(bot_type, context)
+                latest = self.executor.submit(self._call, bot_type, query, attempt.context, attempt.recorded)
+                pending[latest] = attempt
+            launch_next = False
+            if not pending:
+                return last_reply
+
+            now = time.monotonic()
+            wait_for = min(attempt.started + timeout for attempt in pending.values()) - now
+            hedge_at = None
+            if latest in pending and next_index < len(candidates):
+                delay = self._hedge_delay(pending[latest].bot_type)
+                if delay is not None:
+                    hedge_at = pending[latest].started + delay
+                    wait_for = min(wait_for, hedge_at - now)
+            done, _ = wait(list(pending), timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                attempt = pending.pop(future)
+                try:
+                    reply = future.result()
+                except Exception as e:
+                    logger.warning("[BotRouter] {} failed: {}, failover".format(attempt.bot_type, e))
+                    attempt.discard()
+                    launch_next = True
+                    continue
+                if reply is not None and reply.type != ReplyType.ERROR:
+                    for other in pending.values():
+                        other.discard()
+                    attempt.commit(context)
+                    return reply
+                logger.warning("[BotRouter] {} returned error reply, failover".format(attempt.bot_type))
+                attempt.discard()
+                last_reply = reply
+                launch_next = True
+
+            now = time.monotonic()
+            for future, attempt in list(pending.items()):
+                if now - attempt.started >= timeout:
+                    # 超时的请求不再等待，记为失败，线程结束后不再重复记录，之后发送的内容也丢弃
+                    logger.warning("[BotRouter] {} timed out after {}s, failover".format(attempt.bot_type, timeout))
+                    self._record(attempt.bot_type, attempt.recorded, timeout, False)
+                    attempt.discard()
+                    pending.pop(future)
+                    launch_next = True
+            if hedge_at is not None and now >= hedge_at:
+                launch_next = True
+
+    def stats(self):
+        return {bot_type: "{requests}/{error_rate}/{p95_ms}/{available}".format(**self.health[bot_type].snapshot())
+                for bot_type in self.bot_types}
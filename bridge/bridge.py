@@ -1,14 +1,23 @@
+import asyncio
+
 from bot.bot_factory import create_bot
+from bridge.bot_router import BotRouter
 from bridge.context import Context
 from bridge.reply import Reply
 from common import const
 from common.log import logger
+from common.metrics import metrics
+from common.reply_cache import get_reply_cache
 from common.singleton import singleton
-from config import conf
+from config import add_config_listener, conf
 from translate.factory import create_translator
 from voice.factory import create_voice
 
 
+# 决定bot路由的配置项，热加载配置时这些项变化才需要重建bot
+ROUTING_SETTINGS = ["bot_type", "model", "use_azure_chatgpt", "use_linkai", "linkai_api_key", "voice_to_text", "text_to_voice", "translate", "chat_backends"]
+
+
 @singleton
 class Bridge(object):
     def __init__(self):
@@ -71,8 +80,27 @@ class Bridge(object):
                 if not conf().get("text_to_voice") or conf().get("text_to_voice") in ["openai", const.TTS_1, const.TTS_1_HD]:
                     self.btype["text_to_voice"] = const.LINKAI
 
+        # 配置了多个chat后端时，由BotRouter在后端之间路由和故障切换，第一个后端作为默认的chat bot
+        old_router = getattr(self, "router", None)
+        if old_router is not None:
+            old_router.executor.shutdown(wait=False)
+        self.router = None
+        chat_backends = conf().get("chat_backends") or []
+        if len(chat_backends) > 1:
+            self.btype["chat"] = chat_backends[0]
+            self.router = BotRouter(chat_backends)
+            logger.info("[Bridge] route chat requests across backends: {}".format(chat_backends))
+
         self.bots = {}
         self.chat_bots = {}
+        add_config_listener(self._on_config_reload)
+
+    def _on_config_reload(self, old_config, new_config):
+        """配置重新加载后，影响bot路由的配置项有变化时重建路由"""
+        changed = [key for key in ROUTING_SETTINGS if old_config.get(key) != new_config.get(key)]
+        if changed:
+            logger.info("[Bridge] routing settings changed: {}, reset bot".format(changed))
+            self.reset_bot()
 
     # 模型对应的接口
     def get_bot(self, typename):
@@ -83,7 +111,10 @@ class Bridge(object):
             elif typename == "voice_to_text":
                 self.bots[typename] = create_voice(self.btype[typename])
             elif typename == "chat":
-                self.bots[typename] = create_bot(self.btype[typename])
+                if self.router is not None:
+                    self.bots[typename] = self.router.get_bot(self.btype[typename])
+                else:
+                    self.bots[typename] = create_bot(self.btype[typename])
             elif typename == "translate":
                 self.bots[typename] = create_translator(self.btype[typename])
         return self.bots[typename]
@@ -92,7 +123,50 @@ class Bridge(object):
         return self.btype[typename]
 
     def fetch_reply_content(self, query, context: Context) -> Reply:
-        return self.get_bot("chat").reply(query, context)
+        bot_type = self.get_bot_type("chat")
+        cache, key, reply = self._lookup_reply_cache(query, context, bot_type)
+        if reply:
+            return reply
+        reply = self._fetch_chat_reply(query, context, bot_type)
+        if key and not context.get("reply_parts_sent"):
+            cache.put(key, query, reply)
+        return reply
+
+    async def async_fetch_reply_content(self, query, context: Context, executor=None) -> Reply:
+        """
+        fetch_reply_content的异步版本，同样经过回复缓存和多后端路由
+        未配置多后端且chat bot实现了async_reply时直接await，否则在executor中调用同步接口
+        """
+        bot_type = self.get_bot_type("chat")
+        cache, key, reply = self._lookup_reply_cache(query, context, bot_type)
+        if reply:
+            return reply
+        async_reply = getattr(self.get_bot("chat"), "async_reply", None) if self.router is None else None
+        if async_reply is not None:
+            with metrics.timer("bot", bot_type):
+                reply = await async_reply(query, context)
+        else:
+            reply = await asyncio.get_running_loop().run_in_executor(executor, self._fetch_chat_reply, query, context, bot_type)
+        if key and not context.get("reply_parts_sent"):
+            cache.put(key, query, reply)
+        return reply
+
+    def _lookup_reply_cache(self, query, context: Context, bot_type):
+        """返回(缓存, 缓存key, 命中的回复)，不可缓存时key为None"""
+        cache = get_reply_cache()
+        if not cache or not cache.cacheable(query, context, bot_type):
+            return cache, None, None
+        key = cache.make_key(query, context, bot_type)
+        reply = cache.get(key)
+        if reply:
+            logger.debug("[Bridge] reply cache hit, query={}".format(query))
+        return cache, key, reply
+
+    def _fetch_chat_reply(self, query, context: Context, bot_type) -> Reply:
+        if self.router is not None:
+            return self.router.reply(query, context)
+        with metrics.timer("bot", bot_type):
+            return self.get_bot("chat").reply(query, context)
 
     def fetch_voice_to_text(self, voiceFile) -> Reply:
         return self.get_bot("voice_to_text").voiceToText(voiceFile)
@@ -2,6 +2,8 @@
 Message sending channel abstract class
 """
 
+import asyncio
+
 from bridge.bridge import Bridge
 from bridge.context import Context
 from bridge.reply import *
@@ -34,9 +36,22 @@ class Channel(object):
         """
         raise NotImplementedError
 
+    async def async_send(self, reply: Reply, context: Context):
+        """
+        async version of send, used by the async pipeline of ChatChannel
+        channels with native async send should override it, otherwise send runs in an executor
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.send, reply, context)
+
     def build_reply_content(self, query, context: Context = None) -> Reply:
         return Bridge().fetch_reply_content(query, context)
 
+    async def async_build_reply_content(self, query, context: Context = None, executor=None) -> Reply:
+        """
+        async version of build_reply_content, blocking bot calls run in the given executor
+        """
+        return await Bridge().async_fetch_reply_content(query, context, executor)
+
     def build_voice_to_text(self, voice_file) -> Reply:
         return Bridge().fetch_voice_to_text(voice_file)
 
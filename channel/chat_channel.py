@@ -1,17 +1,26 @@
+import asyncio
+import functools
+import heapq
 import os
-import re
 import threading
 import time
 from asyncio import CancelledError
 from concurrent.futures import Future, ThreadPoolExecutor
 
+from bridge.bridge import Bridge
 from bridge.context import *
 from bridge.reply import *
 from channel.channel import Channel
 from common.dequeue import Dequeue
+from common.expired_dict import ExpiredDict
+from common.fair_queue import DeficitRoundRobin
+from common.message_journal import MessageJournal
+from common.metrics import metrics
+from common.trigger_matcher import get_trigger_matcher, strip_mention
 from common import memory
 from plugins import *
 from common.log import logger
+from config import get_appdata_dir
 
 try:
     from voice.audio_convert import any_to_wav
@@ -20,6 +29,20 @@ except Exception as e:
 
 handler_pool = ThreadPoolExecutor(max_workers=8)  # 处理消息的线程池
 
+QUEUE_OVERFLOW_POLICIES = ["drop_oldest", "drop_newest", "reply_busy"]
+FAIR_QUEUE_WEIGHTS = {"admin": 8, "vip": 4, "private": 2, "group": 1}
+
+
+def _resize_handler_pool():
+    """按配置的handler_pool_size重建线程池，配置在模块导入之后才加载，因此在通道初始化时调用"""
+    global handler_pool
+    max_workers = conf().get("handler_pool_size", 8)
+    if max_workers and max_workers != handler_pool._max_workers:
+        old_pool = handler_pool
+        handler_pool = ThreadPoolExecutor(max_workers=max_workers)
+        old_pool.shutdown(wait=False)
+        logger.info("[chat_channel] handler pool resized to {}".format(max_workers))
+
 
 # 抽象类, 它包含了与消息通道无关的通用处理逻辑
 class ChatChannel(Channel):
@@ -30,13 +53,26 @@ class ChatChannel(Channel):
     lock = threading.Lock()  # 用于控制对sessions的访问
 
     def __init__(self):
+        # 调度状态属于各自的消费线程，每个通道实例单独创建
+        self.ready_cond = threading.Condition(self.lock)  # 有session就绪时唤醒消费线程
+        self.drain_cond = threading.Condition(self.lock)  # 排队或处理中的消息减少时唤醒等待清空队列的shutdown
+        self.ready_sessions = DeficitRoundRobin(conf().get("fair_queue_weights", FAIR_QUEUE_WEIGHTS))  # 就绪队列，记录有待处理消息的session_id，按会话类别加权轮询
+        self.queue_counters = {"queued": 0, "in_flight": 0, "dropped": 0, "busy_replied": 0, "coalesced": 0}  # 队列深度等统计，需持有lock修改
+        self.coalesce_deadlines = {}  # 合并窗口中的session_id -> (窗口截止时间, 最长等待截止时间)，窗口结束前不加入就绪队列
+        self.coalesce_heap = []  # (窗口截止时间, session_id)的小顶堆，窗口延长后旧条目在出堆时忽略
+        self.busy_notified = ExpiredDict(60)  # reply_busy策略下已提示过的session，避免刷屏
         self._running = True
+        self._accepting = True  # 关闭时先停止接收新消息，处理完已排队的消息后再退出
+        self.journal = self._open_journal()
+        metrics.register_gauge("chat_channel", self.get_queue_stats)
+        _resize_handler_pool()
         _thread = threading.Thread(target=self.consume)
         _thread.setDaemon(True)
         _thread.start()
         self._thread = _thread
 
     # 根据消息构造context，消息内容相关的触发项写在这里
+    @metrics.timed("compose")
     def _compose_context(self, ctype: ContextType, content, **kwargs):
         context = Context(ctype, content)
         context.kwargs = kwargs
@@ -47,11 +83,12 @@ class ChatChannel(Channel):
         # origin_ctype用于第二步文本回复时，判断是否需要匹配前缀，如果是私聊的语音，就不需要匹配前缀
         if "origin_ctype" not in context:
             context["origin_ctype"] = ctype
+        # 触发规则按配置版本预编译，配置变化后自动重建
+        matcher = get_trigger_matcher()
         # context首次传入时，receiver是None，根据类型设置receiver
         first_in = "receiver" not in context
         # 群名匹配过程，设置session_id和receiver
         if first_in:  # context首次传入时，receiver是None，根据类型设置receiver
-            config = conf()
             cmsg = context["msg"]
             user_data = conf().get_user_data(cmsg.from_user_id)
             context["openai_api_key"] = user_data.get("openai_api_key")
@@ -61,24 +98,10 @@ class ChatChannel(Channel):
                 group_id = cmsg.other_user_id
                 context["group_name"] = group_name
 
-                group_name_white_list = config.get("group_name_white_list", [])
-                group_name_keyword_white_list = config.get("group_name_keyword_white_list", [])
-                if any(
-                        [
-                            group_name in group_name_white_list,
-                            "ALL_GROUP" in group_name_white_list,
-                            check_contain(group_name, group_name_keyword_white_list),
-                        ]
-                ):
-                    group_chat_in_one_session = conf().get("group_chat_in_one_session", [])
+                if matcher.group_allowed(group_name):
                     session_id = f"{cmsg.actual_user_id}@@{group_id}" # 当群聊未共享session时，session_id为user_id与group_id的组合，用于区分不同群聊以及单聊
                     context["is_shared_session_group"] = False  # 默认为非共享会话群
-                    if any(
-                            [
-                                group_name in group_chat_in_one_session,
-                                "ALL_GROUP" in group_chat_in_one_session,
-                            ]
-                    ):
+                    if matcher.group_shared(group_name):
                         session_id = group_id
                         context["is_shared_session_group"] = True  # 如果是共享会话群，设置为True
                 else:
@@ -93,44 +116,39 @@ class ChatChannel(Channel):
             context = e_context["context"]
             if e_context.is_pass() or context is None:
                 return context
-            if cmsg.from_user_id == self.user_id and not config.get("trigger_by_self", True):
+            if cmsg.from_user_id == self.user_id and not matcher.trigger_by_self:
                 logger.debug("[chat_channel]self message skipped")
                 return None
 
         # 消息内容匹配过程，并处理content
         if ctype == ContextType.TEXT:
-            nick_name_black_list = conf().get("nick_name_black_list", [])
             if context.get("isgroup", False):  # 群聊
-                # 校验关键字
-                match_prefix = check_prefix(content, conf().get("group_chat_prefix"))
-                match_contain = check_contain(content, conf().get("group_chat_keyword"))
                 flag = False
                 if context["msg"].to_user_id != context["msg"].actual_user_id:
-                    if match_prefix is not None or match_contain is not None:
+                    # 校验关键字，大部分群消息不会触发，先判断前缀再扫描关键词
+                    match_prefix = matcher.group_chat_prefix.match(content)
+                    if match_prefix is not None or matcher.group_chat_keyword.contains(content):
                         flag = True
                         if match_prefix:
                             content = content.replace(match_prefix, "", 1).strip()
                     if context["msg"].is_at:
                         nick_name = context["msg"].actual_user_nickname
-                        if nick_name and nick_name in nick_name_black_list:
+                        if nick_name and nick_name in matcher.nick_name_black_set:
                             # 黑名单过滤
                             logger.warning(f"[chat_channel] Nickname {nick_name} in In BlackList, ignore")
                             return None
 
                         logger.info("[chat_channel]receive group at")
-                        if not conf().get("group_at_off", False):
+                        if not matcher.group_at_off:
                             flag = True
                         self.name = self.name if self.name is not None else ""  # 部分渠道self.name可能没有赋值
-                        pattern = f"@{re.escape(self.name)}(\u2005|\u0020)"
-                        subtract_res = re.sub(pattern, r"", content)
+                        subtract_res = strip_mention(content, self.name)
                         if isinstance(context["msg"].at_list, list):
                             for at in context["msg"].at_list:
-                                pattern = f"@{re.escape(at)}(\u2005|\u0020)"
-                                subtract_res = re.sub(pattern, r"", subtract_res)
+                                subtract_res = strip_mention(subtract_res, at)
                         if subtract_res == content and context["msg"].self_display_name:
                             # 前缀移除后没有变化，使用群昵称再次移除
-                            pattern = f"@{re.escape(context['msg'].self_display_name)}(\u2005|\u0020)"
-                            subtract_res = re.sub(pattern, r"", content)
+                            subtract_res = strip_mention(content, context["msg"].self_display_name)
                         content = subtract_res
                 if not flag:
                     if context["origin_ctype"] == ContextType.VOICE:
@@ -138,12 +156,12 @@ class ChatChannel(Channel):
                     return None
             else:  # 单聊
                 nick_name = context["msg"].from_user_nickname
-                if nick_name and nick_name in nick_name_black_list:
+                if nick_name and nick_name in matcher.nick_name_black_set:
                     # 黑名单过滤
                     logger.warning(f"[chat_channel] Nickname '{nick_name}' in In BlackList, ignore")
                     return None
 
-                match_prefix = check_prefix(content, conf().get("single_chat_prefix", [""]))
+                match_prefix = matcher.single_chat_prefix.match(content)
                 if match_prefix is not None:  # 判断如果匹配到自定义前缀，则返回过滤掉前缀+空格后的内容
                     content = content.replace(match_prefix, "", 1).strip()
                 elif self.channel_type == 'wechatcom_app':
@@ -154,26 +172,40 @@ class ChatChannel(Channel):
                 else:
                     return None
             content = content.strip()
-            img_match_prefix = check_prefix(content, conf().get("image_create_prefix",[""]))
+            img_match_prefix = matcher.image_create_prefix.match(content)
             if img_match_prefix:
                 content = content.replace(img_match_prefix, "", 1)
                 context.type = ContextType.IMAGE_CREATE
             else:
                 context.type = ContextType.TEXT
             context.content = content.strip()
-            if "desire_rtype" not in context and conf().get(
-                    "always_reply_voice") and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
+            if "desire_rtype" not in context and matcher.always_reply_voice and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
                 context["desire_rtype"] = ReplyType.VOICE
         elif context.type == ContextType.VOICE:
-            if "desire_rtype" not in context and conf().get(
-                    "voice_reply_voice") and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
+            if "desire_rtype" not in context and matcher.voice_reply_voice and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
                 context["desire_rtype"] = ReplyType.VOICE
         return context
 
+    @metrics.timed("handle")
     def _handle(self, context: Context):
         if context is None or not context.content:
             return
 
+        independent_context = self._copy_context(context)
+
+        # reply的构建步骤
+        reply = self._generate_reply(independent_context)
+
+        logger.debug("[chat_channel] ready to decorate reply: {}".format(reply))
+
+        # reply的包装步骤
+        if reply and reply.content:
+            reply = self._decorate_reply(independent_context, reply)
+
+            # reply的发送步骤
+            self._send_reply(independent_context, reply)
+
+    def _copy_context(self, context: Context) -> Context:
         # 创建上下文的深拷贝，确保完全独立
         # 由于Context对象没有copy方法，我们需要手动创建一个新的Context对象
         independent_context = Context(
@@ -200,18 +232,53 @@ class ChatChannel(Channel):
         receiver = independent_context.get("receiver", "unknown")
         is_group = independent_context.get("isgroup", False)
         logger.debug(f"[chat_channel] Processing message - session_id: {session_id}, receiver: {receiver}, isgroup: {is_group}")
-        
-        # reply的构建步骤
-        reply = self._generate_reply(independent_context)
+        return independent_context
+
+    # 异步流水线，开启async_pipeline且通道有运行中的事件循环时使用，bot没有async_reply实现时才放到线程池中执行
+    @metrics.timed("handle")
+    async def _handle_async(self, context: Context):
+        if context is None or not context.content:
+            return
+
+        independent_context = self._copy_context(context)
+        reply = await self._generate_reply_async(independent_context)
 
         logger.debug("[chat_channel] ready to decorate reply: {}".format(reply))
 
-        # reply的包装步骤
         if reply and reply.content:
-            reply = self._decorate_reply(independent_context, reply)
+            reply = await self._run_blocking(self._decorate_reply, independent_context, reply)
+            await self._send_reply_async(independent_context, reply)
 
-            # reply的发送步骤
-            self._send_reply(independent_context, reply)
+    async def _generate_reply_async(self, context: Context, reply: Reply = Reply()) -> Reply:
+        if context.type not in [ContextType.TEXT, ContextType.IMAGE_CREATE]:
+            # 语音、图片等消息的处理包含文件转换等阻塞操作，整体放到线程池中执行
+            return await self._run_blocking(self._generate_reply, context, reply)
+        if "isgroup" not in context:
+            context["isgroup"] = False
+        # 插件是同步实现，可能包含阻塞的网络请求，放到线程池中执行
+        e_context = await self._run_blocking(
+            PluginManager().emit_event,
+            EventContext(
+                Event.ON_HANDLE_CONTEXT,
+                {"channel": self, "context": context, "reply": reply},
+            ),
+        )
+        reply = e_context["reply"]
+        if not e_context.is_pass():
+            logger.debug("[chat_channel] ready to handle context: type={}, content={}".format(context.type, context.content))
+            original_channel = context.get("original_channel")
+            original_receiver = context.get("original_receiver")
+            context["channel"] = e_context["channel"]
+            if original_channel and "original_channel" not in context:
+                context["original_channel"] = original_channel
+            if original_receiver and "original_receiver" not in context:
+                context["original_receiver"] = original_receiver
+            reply = await super().async_build_reply_content(context.content, context, handler_pool)
+        return reply
+
+    async def _run_blocking(self, func, *args):
+        """在处理消息的线程池中执行阻塞调用，避免阻塞通道的事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(handler_pool, functools.partial(func, *args))
 
     def _generate_reply(self, context: Context, reply: Reply = Reply()) -> Reply:
         # 确保上下文中包含 isgroup 键
@@ -274,6 +341,7 @@ class ChatChannel(Channel):
                     "path": context.content,
                     "msg": context.get("msg")
                 }
+                self._prefetch_image(context)
             elif context.type == ContextType.ACCEPT_FRIEND:  # 好友申请，匹配字符串
                 reply = self._build_friend_request_reply(context)
             elif context.type == ContextType.XML:
@@ -301,6 +369,16 @@ class ChatChannel(Channel):
                 return
         return reply
 
+    def _prefetch_image(self, context: Context):
+        """让支持的bot(如dify)在后台提前上传图片，后续提问时不必等待上传"""
+        try:
+            bot = Bridge().get_bot("chat")
+            if hasattr(bot, "prefetch_image"):
+                bot.prefetch_image(context)
+        except Exception as e:
+            logger.warning("[chat_channel] prefetch image failed: {}".format(e))
+
+    @metrics.timed("decorate")
     def _decorate_reply(self, context: Context, reply: Reply) -> Reply:
         if reply and reply.type:
             e_context = PluginManager().emit_event(
@@ -330,16 +408,17 @@ class ChatChannel(Channel):
                     if not segments_to_process:
                         reply.content = ""
                     else:
+                        settings = conf().snapshot()
                         decorated_segments = []
                         for i, segment_content in enumerate(segments_to_process):
                             current_segment_for_decoration = segment_content
 
                             if context.get("isgroup", False):
-                                decorated_segment_payload = conf().get("group_chat_reply_prefix", "") + current_segment_for_decoration + conf().get("group_chat_reply_suffix", "")
-                                if i == 0 and not conf().get("no_need_at", False):
+                                decorated_segment_payload = settings.get("group_chat_reply_prefix", "") + current_segment_for_decoration + settings.get("group_chat_reply_suffix", "")
+                                if i == 0 and not settings.get("no_need_at", False):
                                     decorated_segment_payload = "@" + context["msg"].actual_user_nickname + "\n" + decorated_segment_payload
                             else:
-                                decorated_segment_payload = conf().get("single_chat_reply_prefix", "") + current_segment_for_decoration + conf().get("single_chat_reply_suffix", "")
+                                decorated_segment_payload = settings.get("single_chat_reply_prefix", "") + current_segment_for_decoration + settings.get("single_chat_reply_suffix", "")
                             decorated_segments.append(decorated_segment_payload)
                         reply.content = "//n".join(decorated_segments)
 
@@ -372,44 +451,68 @@ class ChatChannel(Channel):
                     return
 
                 logger.debug("[chat_channel] ready to send reply: {}, context: {}".format(reply, context))
-                if reply.type == ReplyType.TEXT and "//n" in reply.content:
-                    all_segments = reply.content.split("//n")
-                    segments_to_send = [s for s in all_segments if s.strip()]
+                replies = self._split_reply(reply)
+                for i, segment_reply in enumerate(replies):
+                    self._send(segment_reply, context)
+                    if i < len(replies) - 1:
+                        time.sleep(0.3)
 
-                    if not segments_to_send:
-                        logger.debug("[chat_channel] All segments are empty after splitting by //n, skipping send.")
-                        return
+    async def _send_reply_async(self, context: Context, reply: Reply):
+        if reply and reply.type:
+            e_context = await self._run_blocking(
+                PluginManager().emit_event,
+                EventContext(
+                    Event.ON_SEND_REPLY,
+                    {"channel": self, "context": context, "reply": reply},
+                ),
+            )
+            reply = e_context["reply"]
+            if not e_context.is_pass() and reply and reply.type:
+                if not reply.content and reply.type == ReplyType.TEXT:
+                    logger.debug("[chat_channel] Text reply content is empty after decoration, skipping send.")
+                    return
 
-                    for i, segment_text in enumerate(segments_to_send):
-                        segment_reply = Reply(ReplyType.TEXT, segment_text)
-                        self._send(segment_reply, context)
-                        if i < len(segments_to_send) - 1:
-                            time.sleep(0.3)
-                else:
-                    self._send(reply, context)
+                logger.debug("[chat_channel] ready to send reply: {}, context: {}".format(reply, context))
+                replies = self._split_reply(reply)
+                for i, segment_reply in enumerate(replies):
+                    await self._send_async(segment_reply, context)
+                    if i < len(replies) - 1:
+                        await asyncio.sleep(0.3)
+
+    def _split_reply(self, reply: Reply) -> list:
+        """文本回复按//n拆分为多条消息发送"""
+        if reply.type == ReplyType.TEXT and "//n" in reply.content:
+            segments_to_send = [s for s in reply.content.split("//n") if s.strip()]
+            if not segments_to_send:
+                logger.debug("[chat_channel] All segments are empty after splitting by //n, skipping send.")
+            return [Reply(ReplyType.TEXT, segment_text) for segment_text in segments_to_send]
+        return [reply]
+
+    def _reply_channel(self, context: Context):
+        # 1. 最优先使用context中保存的原始通道信息
+        if "original_channel" in context and context["original_channel"]:
+            original_channel = context["original_channel"]
+            logger.debug(f"[chat_channel] 使用保存的原始通道 {original_channel.__class__.__name__} 发送回复")
+
+            # 确保使用原始接收者信息
+            if "original_receiver" in context:
+                logger.debug(f"[chat_channel] 使用原始接收者: {context['original_receiver']}")
+            return original_channel
+
+        # 2. 其次尝试使用context.channel
+        elif hasattr(context, 'channel') and context.channel:
+            # 使用接收消息时的原始通道发送回复
+            logger.debug(f"[chat_channel] 使用context.channel原始通道 {context.channel.__class__.__name__} 发送回复")
+            return context.channel
+        # 如果没有原始通道，才使用当前通道
+        logger.debug(f"[chat_channel] 无原始通道，使用当前通道 {self.__class__.__name__} 发送回复")
+        return self
 
     def _send(self, reply: Reply, context: Context, retry_cnt=0):
         try:
-            # 1. 最优先使用context中保存的原始通道信息
-            if "original_channel" in context and context["original_channel"]:
-                original_channel = context["original_channel"]
-                logger.debug(f"[chat_channel] 使用保存的原始通道 {original_channel.__class__.__name__} 发送回复")
-                
-                # 确保使用原始接收者信息
-                if "original_receiver" in context:
-                    logger.debug(f"[chat_channel] 使用原始接收者: {context['original_receiver']}")
-                
-                original_channel.send(reply, context)
-                
-            # 2. 其次尝试使用context.channel
-            elif hasattr(context, 'channel') and context.channel:
-                # 使用接收消息时的原始通道发送回复
-                logger.debug(f"[chat_channel] 使用context.channel原始通道 {context.channel.__class__.__name__} 发送回复")
-                context.channel.send(reply, context)
-            else:
-                # 如果没有原始通道，才使用当前通道
-                logger.debug(f"[chat_channel] 无原始通道，使用当前通道 {self.__class__.__name__} 发送回复")
-                self.send(reply, context)
+            channel = self._reply_channel(context)
+            with metrics.timer("send", channel.__class__.__name__):
+                channel.send(reply, context)
         except Exception as e:
             logger.error("[chat_channel] sendMsg error: {}".format(str(e)))
             if isinstance(e, NotImplementedError):
@@ -419,6 +522,20 @@ class ChatChannel(Channel):
                 time.sleep(3 + 3 * retry_cnt)
                 self._send(reply, context, retry_cnt + 1)
 
+    async def _send_async(self, reply: Reply, context: Context, retry_cnt=0):
+        try:
+            channel = self._reply_channel(context)
+            with metrics.timer("send", channel.__class__.__name__):
+                await channel.async_send(reply, context)
+        except Exception as e:
+            logger.error("[chat_channel] sendMsg error: {}".format(str(e)))
+            if isinstance(e, NotImplementedError):
+                return
+            logger.exception(e)
+            if retry_cnt < 2:
+                await asyncio.sleep(3 + 3 * retry_cnt)
+                await self._send_async(reply, context, retry_cnt + 1)
+
     # 处理好友申请
     def _build_friend_request_reply(self, context):
         if isinstance(context.content, dict) and "Content" in context.content:
@@ -437,7 +554,7 @@ class ChatChannel(Channel):
     def _fail_callback(self, session_id, exception, **kwargs):  # 线程异常结束时的回调函数
         logger.exception("Worker return exception: {}".format(exception))
 
-    def _thread_pool_callback(self, session_id, **kwargs):
+    def _thread_pool_callback(self, session_id, semaphore=None, **kwargs):
         def func(worker: Future):
             try:
                 worker_exception = worker.exception()
@@ -449,21 +566,67 @@ class ChatChannel(Channel):
                 logger.info("Worker cancelled, session_id = {}".format(session_id))
             except Exception as e:
                 logger.exception("Worker raise exception: {}".format(e))
-            
-            # Ensure semaphore release is robust and handles cases where session might be gone
+            # 无论成功失败都确认日志，只有进程在处理完成前退出的消息才会在重启后重放
+            self._ack(kwargs.get("context"))
+
+            # 释放提交任务时获取的信号量，并在session仍有待处理消息时重新加入就绪队列
             with self.lock:
-                if session_id in self.sessions and self.sessions[session_id] and len(self.sessions[session_id]) > 1:
+                self.queue_counters["in_flight"] -= 1
+                self.ready_cond.notify()
+                self.drain_cond.notify_all()
+                if semaphore is not None:
                     try:
-                        self.sessions[session_id][1].release()
+                        semaphore.release()
                         logger.debug(f"[chat_channel] Semaphore released in callback for session {session_id}")
-                    except ValueError as ve: 
+                    except ValueError as ve:
                         logger.error(f"[chat_channel] Semaphore for session {session_id} likely released too many times in callback. Error: {ve}")
-                    except Exception as e:
-                        logger.error(f"[chat_channel] Error releasing semaphore in callback for session {session_id}: {e}")
+                if session_id in self.futures:
+                    self.futures[session_id] = [t for t in self.futures[session_id] if not t.done()]
+                    if not self.futures[session_id]:
+                        del self.futures[session_id]
+                if session_id in self.sessions:
+                    context_queue, session_semaphore = self.sessions[session_id]
+                    if not context_queue.empty():
+                        self._mark_ready(session_id)
+                    else:
+                        self._release_session_if_idle(session_id)
                 else:
-                    logger.warning(f"[chat_channel] Session {session_id} or its semaphore no longer exists in _thread_pool_callback. Cannot release.")
+                    logger.debug(f"[chat_channel] Session {session_id} no longer exists in _thread_pool_callback.")
         return func
 
+    def _release_session_if_idle(self, session_id):
+        """session没有排队和执行中的消息时删除，调用方需持有self.lock"""
+        context_queue, semaphore = self.sessions[session_id]
+        if context_queue.empty() and semaphore._value == semaphore._initial_value and session_id not in self.futures:
+            logger.debug(f"[chat_channel] Deleting empty session {session_id}")
+            del self.sessions[session_id]
+
+    def _mark_ready(self, session_id):
+        """将session加入就绪队列并唤醒消费线程，调用方需持有self.lock"""
+        if session_id in self.coalesce_deadlines:
+            return  # 合并窗口结束后由消费线程加入就绪队列
+        self.ready_sessions.push(session_id, self._flow_class(session_id))
+        self.ready_cond.notify()
+
+    def _flow_class(self, session_id):
+        """根据session队首的消息确定调度类别: admin, vip, private, group，调用方需持有self.lock"""
+        context_queue = self.sessions[session_id][0]
+        if context_queue.empty():
+            return "private"
+        context = context_queue.queue[0]
+        if self._is_admin_command(context):
+            return "admin"
+        vip_users = conf().snapshot().fair_queue_vip_users
+        cmsg = context.get("msg")
+        if vip_users and cmsg:
+            if context.get("isgroup", False):
+                user_keys = [cmsg.actual_user_id, cmsg.actual_user_nickname]
+            else:
+                user_keys = [cmsg.from_user_id, cmsg.from_user_nickname]
+            if any(key and key in vip_users for key in user_keys):
+                return "vip"
+        return "group" if context.get("isgroup", False) else "private"
+
     def produce(self, context: Context):
         # 备份原始通道信息，确保后续处理过程中不会丢失
         if hasattr(context, 'channel') and context.channel:
@@ -478,128 +641,353 @@ class ChatChannel(Channel):
             logger.debug(f"[chat_channel] 保存原始接收者信息: {context['original_receiver']}")
             
         session_id = context.get("session_id", 0)
+        if self.journal and "journal_ids" not in context:
+            context["journal_ids"] = [self.journal.append(context)]
+        if not self._accepting:
+            logger.warning("[chat_channel] channel is shutting down, context of session {} is kept in journal only".format(session_id))
+            return
         with self.lock:
             if session_id not in self.sessions:
                 self.sessions[session_id] = [
                     Dequeue(),
-                    threading.BoundedSemaphore(conf().get("concurrency_in_session", 4)),
+                    threading.BoundedSemaphore(conf().snapshot().get("concurrency_in_session", 4)),
                 ]
-            if context.type == ContextType.TEXT and context.content.startswith("#"):
-                self.sessions[session_id][0].putleft(context)  # 优先处理管理命令
+            admitted, busy = True, False
+            if self._is_admin_command(context):
+                self.sessions[session_id][0].putleft(context)  # 优先处理管理命令，不受队列上限限制
+            else:
+                admitted, busy = self._admit(session_id)
+                if admitted:
+                    self.sessions[session_id][0].put(context)
+            if admitted:
+                context["enqueue_time"] = time.time()
+                self.queue_counters["queued"] += 1
+                if self._should_coalesce(context):
+                    self._delay_session(session_id)
+                else:
+                    self._mark_ready(session_id)
             else:
-                self.sessions[session_id][0].put(context)
+                self._release_session_if_idle(session_id)
+                if busy:
+                    self.queue_counters["busy_replied"] += 1
+        if not admitted:
+            self._ack(context)
+        if busy:
+            self._reply_busy(context)
+
+    def _admit(self, session_id):
+        """
+        检查队列上限，按queue_overflow_policy处理溢出，调用方需持有self.lock
+        :return: (是否接收新消息, 是否需要回复繁忙提示)
+        """
+        settings = conf().snapshot()
+        session_limit = settings.max_queued_contexts_in_session or 0
+        global_limit = settings.max_queued_contexts or 0
+        context_queue = self.sessions[session_id][0]
+        session_full = session_limit > 0 and context_queue.qsize() >= session_limit
+        global_full = global_limit > 0 and self.queue_counters["queued"] >= global_limit
+        if not session_full and not global_full:
+            return True, False
+
+        policy = settings.get("queue_overflow_policy", "drop_oldest")
+        if policy not in QUEUE_OVERFLOW_POLICIES:
+            logger.warning("[chat_channel] unknown queue_overflow_policy: {}, use drop_oldest".format(policy))
+            policy = "drop_oldest"
+        self.queue_counters["dropped"] += 1
+        if policy == "drop_oldest":
+            # 会话队列满时丢弃本会话最早的消息，全局队列满时丢弃积压最多的会话中最早的消息，管理命令不会被丢弃
+            victim_queue = context_queue
+            if not session_full or context_queue.empty():
+                victim_queue = max((q for q, _ in self.sessions.values()), key=lambda q: q.qsize())
+            dropped = self._pop_oldest_droppable(victim_queue)
+            if dropped is not None:
+                self.queue_counters["queued"] -= 1
+                self._ack(dropped)
+                logger.warning("[chat_channel] queue full, drop oldest context of session {}".format(dropped.get("session_id")))
+                return True, False
+        logger.warning("[chat_channel] queue full, drop new context of session {}, policy={}".format(session_id, policy))
+        if policy == "reply_busy" and session_id not in self.busy_notified:
+            self.busy_notified[session_id] = True
+            return False, True
+        return False, False
+
+    @staticmethod
+    def _is_admin_command(context: Context):
+        """管理命令优先处理，不参与合并，队列满时也不会被丢弃"""
+        return context.type == ContextType.TEXT and context.content.startswith("#")
+
+    def _pop_oldest_droppable(self, context_queue):
+        """取出队列中最早的非管理命令消息，没有时返回None，调用方需持有self.lock"""
+        with context_queue.mutex:
+            for index, context in enumerate(context_queue.queue):
+                if not self._is_admin_command(context):
+                    del context_queue.queue[index]
+                    return context
+        return None
+
+    def _coalesce_window(self):
+        return max(conf().snapshot().coalesce_window_ms or 0, 0) / 1000.0
+
+    def _should_coalesce(self, context: Context):
+        """只合并普通文本消息，管理命令立即处理"""
+        if self._coalesce_window() <= 0:
+            return False
+        return context.type == ContextType.TEXT and not self._is_admin_command(context)
+
+    def _delay_session(self, session_id):
+        """
+        开启或延长session的合并窗口，窗口内陆续到达的文本消息在派发前合并为一条，调用方需持有self.lock
+        每条新消息把窗口顺延coalesce_window_ms，但总等待不超过coalesce_max_wait_ms
+        """
+        now = time.monotonic()
+        window = self._coalesce_window()
+        max_wait = max(conf().snapshot().get("coalesce_max_wait_ms", 3000) / 1000.0, window)
+        _, hard_deadline = self.coalesce_deadlines.get(session_id, (None, now + max_wait))
+        deadline = min(now + window, hard_deadline)
+        self.coalesce_deadlines[session_id] = (deadline, hard_deadline)
+        self.ready_sessions.discard(session_id)
+        heapq.heappush(self.coalesce_heap, (deadline, session_id))
+        self.ready_cond.notify()
+
+    def _release_due_sessions(self):
+        """
+        把合并窗口已结束的session加入就绪队列，调用方需持有self.lock
+        :return: 距离下一个窗口结束的秒数，没有等待中的窗口时返回None
+        """
+        now = time.monotonic()
+        while self.coalesce_heap and self.coalesce_heap[0][0] <= now:
+            deadline, session_id = heapq.heappop(self.coalesce_heap)
+            entry = self.coalesce_deadlines.get(session_id)
+            if entry is None or entry[0] != deadline:
+                continue  # 窗口已被延长或已取消
+            del self.coalesce_deadlines[session_id]
+            if session_id not in self.sessions:
+                continue
+            if self.sessions[session_id][0].empty():
+                self._release_session_if_idle(session_id)
+            else:
+                self._mark_ready(session_id)
+        if self.coalesce_heap:
+            return max(self.coalesce_heap[0][0] - now, 0)
+        return None
+
+    def _coalesce(self, context: Context, context_queue):
+        """
+        将队列中紧随其后、同一发送者在合并窗口内连续发送的文本消息合并到context，调用方需持有self.lock
+        触发前缀和@判断已在_compose_context中完成，这里合并的都是需要回复的消息
+        """
+        if not self._should_coalesce(context):
+            return context
+        window = self._coalesce_window()
+        contents = [context.content]
+        last_time = context.get("enqueue_time", 0)
+        while not context_queue.empty():
+            following = context_queue.queue[0]
+            if not self._should_coalesce(following) or self._sender_of(following) != self._sender_of(context):
+                break
+            if following.get("enqueue_time", 0) - last_time > window:
+                break
+            context_queue.get_nowait()
+            if following.get("journal_ids"):
+                context["journal_ids"] = context.get("journal_ids", []) + following["journal_ids"]
+            contents.append(following.content)
+            last_time = following.get("enqueue_time", 0)
+            self.queue_counters["queued"] -= 1
+            self.queue_counters["coalesced"] += 1
+        if len(contents) > 1:
+            logger.info("[chat_channel] coalesced {} messages of session {}".format(len(contents), context.get("session_id")))
+            context.content = "\n".join(contents)
+        return context
+
+    @staticmethod
+    def _sender_of(context: Context):
+        cmsg = context.get("msg")
+        if not cmsg:
+            return None
+        return cmsg.actual_user_id if context.get("isgroup", False) else cmsg.from_user_id
+
+    def _reply_busy(self, context: Context):
+        reply = Reply(ReplyType.INFO, conf().get("queue_busy_reply", "当前消息较多，请稍后再试~"))
+        handler_pool.submit(lambda: self._send_reply(context, self._decorate_reply(context, reply)))
+
+    def _open_journal(self):
+        if not conf().get("message_journal", False):
+            return None
+        path = conf().get("message_journal_path") or os.path.join(get_appdata_dir(), "message_journal.db")
+        try:
+            return MessageJournal(path, flush_interval=conf().get("message_journal_flush_interval", 0.5))
+        except Exception as e:
+            logger.error("[chat_channel] failed to open message journal {}: {}".format(path, e))
+            return None
 
-    # 消费者函数，单独线程，用于从消息队列中取出消息并处理
+    def _ack(self, context: Context):
+        if self.journal and context is not None and context.get("journal_ids"):
+            try:
+                self.journal.ack(context["journal_ids"])
+            except Exception as e:
+                logger.warning("[chat_channel] failed to ack message journal: {}".format(e))
+
+    def replay_journal(self):
+        """
+        重放上次运行时已接收但未处理完成的消息，通道登录完成、可以发送消息后调用
+        只重放不超过message_journal_max_age秒的消息，更早的消息直接丢弃
+        """
+        if not self.journal:
+            return 0
+        entries = self.journal.pending(conf().get("message_journal_max_age", 300))
+        for journal_id, context in entries:
+            context["journal_ids"] = [journal_id]
+            context["replayed"] = True
+            self.produce(context)
+        if entries:
+            logger.info("[chat_channel] replayed {} contexts from message journal".format(len(entries)))
+        return len(entries)
+
+    def get_queue_stats(self) -> dict:
+        """返回消息队列的深度统计，用于监控和调优线程池与队列上限"""
+        with self.lock:
+            stats = dict(self.queue_counters)
+            stats["sessions"] = len(self.sessions)
+            stats["ready_sessions"] = len(self.ready_sessions)
+            stats["coalescing_sessions"] = len(self.coalesce_deadlines)
+            stats["max_session_depth"] = max((q.qsize() for q, _ in self.sessions.values()), default=0)
+        stats["pool_size"] = handler_pool._max_workers
+        return stats
+
+    # 消费者函数，单独线程，只处理就绪队列中有待处理消息的session，没有消息时阻塞等待produce唤醒
     def consume(self):
         while self._running:
-            with self.lock:
+            with self.ready_cond:
+                # 处理中的消息达到上限时不再派发，让排队的消息留在就绪队列中按权重调度，而不是堆积在线程池的FIFO队列里
+                while self._running:
+                    timeout = self._release_due_sessions()
+                    if self.ready_sessions and self.queue_counters["in_flight"] < self._max_in_flight():
+                        break
+                    self.ready_cond.wait(timeout)
                 if not self._running:
                     break
-                session_ids = list(self.sessions.keys())
-            for session_id in session_ids:
-                if not self._running:
-                    break 
-                with self.lock:
-                    if session_id not in self.sessions:
-                        continue
-                    context_queue, semaphore = self.sessions[session_id]
-                
+                session_id = self.ready_sessions.pop()
+                if session_id not in self.sessions:
+                    continue
+                context_queue, semaphore = self.sessions[session_id]
                 if context_queue.empty():
-                    if self._running:
-                        with self.lock:
-                            if session_id in self.sessions and \
-                               (session_id not in self.futures or not self.futures.get(session_id)):
-                                logger.debug(f"[chat_channel] Deleting empty session {session_id} (pre-semaphore acquire check due to empty queue)")
-                                del self.sessions[session_id]
-                                if session_id in self.futures and not self.futures[session_id]:
-                                    del self.futures[session_id]
+                    self._release_session_if_idle(session_id)
+                    continue
+                # 信号量已满时不重新入队，由正在执行的任务在回调中释放信号量后重新加入就绪队列
+                if not semaphore.acquire(blocking=False):
                     continue
+                context = context_queue.get()
+                self.queue_counters["queued"] -= 1
+                context = self._coalesce(context, context_queue)
+                self.queue_counters["in_flight"] += 1
+                if not context_queue.empty():
+                    self._mark_ready(session_id)
+            logger.debug("[chat_channel] consume context: {}".format(context))
+            if "enqueue_time" in context:
+                metrics.observe("queue_wait", time.time() - context["enqueue_time"])
+            self._dispatch(session_id, context, semaphore)
+        logger.info("[chat_channel] Consume thread gracefully finished.")
 
-                acquired_semaphore = False
-                task_submitted_and_callback_attached = False
-                try:
-                    if semaphore.acquire(blocking=False):
-                        acquired_semaphore = True
-                        if not context_queue.empty():
-                            if not self._running:
-                                break 
-                            context = context_queue.get()
-                            logger.debug("[chat_channel] consume context: {}".format(context))
-                            try:
-                                future: Future = handler_pool.submit(self._handle, context)
-                                future.add_done_callback(self._thread_pool_callback(session_id, context=context))
-                                task_submitted_and_callback_attached = True
-                                with self.lock:
-                                    if session_id not in self.futures:
-                                        self.futures[session_id] = []
-                                    self.futures[session_id].append(future)
-                            except RuntimeError as e:
-                                if "cannot schedule new futures after interpreter shutdown" in str(e):
-                                    logger.warning(f"[chat_channel] Interpreter shutting down, handler_pool closed. Stopping consume thread for session ID: {session_id}. Error: {e}")
-                                    self._running = False
-                                else:
-                                    logger.error(f"[chat_channel] RuntimeError in consume: {e}. Session ID: {session_id}")
-                            except Exception as e:
-                                logger.error(f"[chat_channel] Exception submitting task to handler_pool: {e}. Session ID: {session_id}")
-                        
-                        elif semaphore._initial_value == semaphore._value + 1: 
-                            if self._running:
-                                with self.lock:
-                                    if session_id in self.futures:
-                                        self.futures[session_id] = [t for t in self.futures[session_id] if not t.done()]
-                                        if not self.futures[session_id]:
-                                            del self.futures[session_id]
-                                    
-                                    if context_queue.empty() and (session_id not in self.futures or not self.futures[session_id]):
-                                        logger.debug(f"[chat_channel] Deleting empty session {session_id}")
-                                        del self.sessions[session_id]
-                                        if session_id in self.futures and not self.futures[session_id]:
-                                            del self.futures[session_id]
-                        # else: semaphore acquired, but queue was empty and session not deleted. 
-                        # task_submitted_and_callback_attached is False. Finally block should release.
-                finally:
-                    if acquired_semaphore and not task_submitted_and_callback_attached:
-                        try:
-                            semaphore.release()
-                            logger.debug(f"[chat_channel] Semaphore released in consume finally for session {session_id} (task not submitted or submission failed)")
-                        except ValueError as ve:
-                             logger.error(f"[chat_channel] Error releasing semaphore in consume finally for session {session_id}. Error: {ve}")
-                        except Exception as e:
-                            logger.error(f"[chat_channel] Generic error releasing semaphore in consume finally for session {session_id}: {e}")
+    def _pipeline_loop(self):
+        """开启async_pipeline且通道的事件循环正在运行时返回该循环，否则返回None，使用线程池处理消息"""
+        if not conf().snapshot().async_pipeline:
+            return None
+        loop = getattr(self, "loop", None)
+        if loop is not None and loop.is_running():
+            return loop
+        return None
 
-                if not self._running:
-                    break
-            
-            if not self._running:
-                break
-            time.sleep(0.2)
-        logger.info("[chat_channel] Consume thread gracefully finished.")
+    def _max_in_flight(self):
+        if self._pipeline_loop() is not None:
+            return conf().snapshot().get("async_pipeline_max_in_flight", 64)
+        return handler_pool._max_workers
+
+    def _dispatch(self, session_id, context: Context, semaphore):
+        try:
+            loop = self._pipeline_loop()
+            if loop is not None:
+                future: Future = asyncio.run_coroutine_threadsafe(self._handle_async(context), loop)
+            else:
+                future: Future = handler_pool.submit(self._handle, context)
+        except RuntimeError as e:
+            self._release_failed_dispatch(semaphore)
+            if "cannot schedule new futures after interpreter shutdown" in str(e):
+                logger.warning(f"[chat_channel] Interpreter shutting down, handler_pool closed. Stopping consume thread for session ID: {session_id}. Error: {e}")
+                self._running = False
+            else:
+                logger.error(f"[chat_channel] RuntimeError in consume: {e}. Session ID: {session_id}")
+            return
+        except Exception as e:
+            self._release_failed_dispatch(semaphore)
+            logger.error(f"[chat_channel] Exception submitting task to handler_pool: {e}. Session ID: {session_id}")
+            return
+        with self.lock:
+            self.futures.setdefault(session_id, []).append(future)
+        future.add_done_callback(self._thread_pool_callback(session_id, semaphore=semaphore, context=context))
+
+    def _release_failed_dispatch(self, semaphore):
+        with self.lock:
+            self.queue_counters["in_flight"] -= 1
+            self.ready_cond.notify()
+            self.drain_cond.notify_all()
+        semaphore.release()
 
     # 取消session_id对应的所有任务，只能取消排队的消息和已提交线程池但未执行的任务
     def cancel_session(self, session_id):
+        futures, cancelled = [], []
         with self.lock:
             if session_id in self.sessions:
-                for future in self.futures[session_id]:
-                    future.cancel()
-                cnt = self.sessions[session_id][0].qsize()
-                if cnt > 0:
-                    logger.info("Cancel {} messages in session {}".format(cnt, session_id))
+                futures = list(self.futures.get(session_id, []))
+                cancelled = list(self.sessions[session_id][0].queue)
+                if cancelled:
+                    logger.info("Cancel {} messages in session {}".format(len(cancelled), session_id))
+                self.queue_counters["queued"] -= len(cancelled)
                 self.sessions[session_id][0] = Dequeue()
+                self.drain_cond.notify_all()
+        for context in cancelled:
+            self._ack(context)
+        # future.cancel()会同步触发回调，回调中需要获取self.lock，因此在锁外取消
+        for future in futures:
+            future.cancel()
 
     def cancel_all_session(self):
+        futures, cancelled = [], []
         with self.lock:
             for session_id in self.sessions:
-                if session_id in self.futures:
-                    for future in self.futures[session_id]:
-                        future.cancel()
-                cnt = self.sessions[session_id][0].qsize()
-                if cnt > 0:
-                    logger.info("Cancel {} messages in session {}".format(cnt, session_id))
+                futures.extend(self.futures.get(session_id, []))
+                session_cancelled = list(self.sessions[session_id][0].queue)
+                if session_cancelled:
+                    logger.info("Cancel {} messages in session {}".format(len(session_cancelled), session_id))
+                self.queue_counters["queued"] -= len(session_cancelled)
+                cancelled.extend(session_cancelled)
                 self.sessions[session_id][0] = Dequeue()
-
-    def shutdown(self):
-        logger.info("[chat_channel] Shutdown called. Signaling consume thread to stop.")
-        self._running = False
+            self.drain_cond.notify_all()
+        for context in cancelled:
+            self._ack(context)
+        for future in futures:
+            future.cancel()
+
+    def shutdown(self, drain_timeout=None):
+        """
+        先停止接收新消息，等待已排队和处理中的消息完成(最多drain_timeout秒)，再停止消费线程
+        超时未处理完的消息保留在消息日志中，下次启动时重放
+        """
+        if drain_timeout is None:
+            drain_timeout = conf().get("shutdown_drain_timeout", 10)
+        logger.info("[chat_channel] Shutdown called. Draining queued contexts for up to {}s.".format(drain_timeout))
+        deadline = time.monotonic() + drain_timeout
+        with self.ready_cond:
+            self._accepting = False
+            while self.queue_counters["queued"] + self.queue_counters["in_flight"] > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning("[chat_channel] Drain timed out, {} queued and {} in flight contexts left.".format(
+                        self.queue_counters["queued"], self.queue_counters["in_flight"]))
+                    break
+                self.drain_cond.wait(remaining)
+            logger.info("[chat_channel] Signaling consume thread to stop.")
+            self._running = False
+            self.ready_cond.notify_all()
         if hasattr(self, '_thread') and self._thread.is_alive():
             logger.debug("[chat_channel] Waiting for consume thread to join...")
             self._thread.join(timeout=5.0)
@@ -607,6 +995,8 @@ class ChatChannel(Channel):
                 logger.warning("[chat_channel] Consume thread did not stop in 5 seconds.")
             else:
                 logger.info("[chat_channel] Consume thread joined successfully.")
+        if self.journal:
+            self.journal.flush()  # 未处理完的消息写入日志，下次启动时重放
 
 
 def check_prefix(content, prefix_list):
@@ -1,4 +1,6 @@
 import asyncio
+import contextlib
+import hmac
 import os
 import re
 import json
@@ -13,14 +15,19 @@ import aiohttp
 import uuid 
 from typing import Union, BinaryIO, Optional, Tuple, List, Dict
 import urllib.parse  
-import requests
 from bridge.context import Context, ContextType  
 from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel
 from channel.chat_message import ChatMessage
 from channel.wx849.wx849_message import WX849Message  # 改为从wx849_message导入WX849Message
 from common.expired_dict import ExpiredDict
+from common import http_client
+from common.http_client import close_aiohttp_sessions, get_aiohttp_session
+from common.metrics import metrics
+from common.trigger_matcher import get_trigger_matcher
 from common.log import logger
+from common.refresh_scheduler import PRIORITY_HIGH, PRIORITY_LOW, RefreshScheduler
+from common.room_store import RoomStore
 from common.singleton import singleton
 from common.time_check import time_checker
 from common.utils import remove_markdown_symbol, split_string_by_utf8_length
@@ -293,8 +300,9 @@ class WX849Channel(ChatChannel):
 
     def __init__(self):
         super().__init__()
-        self.received_msgs = ExpiredDict(conf().get("expires_in_seconds", 3600))
-        self.recent_image_msgs = ExpiredDict(conf().get("image_expires_in_seconds", 7200)) # Added initialization
+        # 去重表只需记录消息是否出现过，设置容量上限避免消息高峰时在过期前无限增长
+        self.received_msgs = ExpiredDict(conf().get("expires_in_seconds", 3600), maxsize=20000)
+        self.recent_image_msgs = ExpiredDict(conf().get("image_expires_in_seconds", 7200), maxsize=2000) # Added initialization
         self.bot = None
         self.user_id = None
         self.name = None
@@ -302,6 +310,17 @@ class WX849Channel(ChatChannel):
         self.is_running = False
         self.is_logged_in = False
         self.group_name_cache = {}
+        self.room_store = None  # 群信息缓存，见_rooms()
+        self.room_store_lock = threading.Lock()
+        # 群信息和个人资料的后台刷新，在通道事件循环上执行，同一个群不会重复刷新
+        self.refresher = RefreshScheduler(
+            concurrency=conf().get("wx849_refresh_concurrency", 2),
+            rate=conf().get("wx849_refresh_rate", 1.0),
+            name="WX849Refresh",
+        )
+        self.group_refresh_times = {}  # 群ID -> 最近一次提交刷新的时间(time.monotonic())
+        self.callback_runner = None  # 回调服务，未开启时为None
+        self.dispatch_semaphore = None  # 限制同时处理的会话数，在通道的事件循环中创建
         self.image_cache_dir = os.path.join(os.getcwd(), "tmp", "wx849_img_cache")
         try:
             if not os.path.exists(self.image_cache_dir):
@@ -420,6 +439,16 @@ class WX849Channel(ChatChannel):
             # 设置API路径前缀
             if hasattr(self.bot, "set_api_path_prefix"):
                 self.bot.set_api_path_prefix(api_path_prefix)
+
+            # 所有接口共用一个长连接会话，按配置设置连接池大小和超时时间
+            if hasattr(self.bot, "api_session"):
+                self.bot.api_session.configure(
+                    limit=conf().get("wx849_api_pool_size", 50),
+                    timeout=conf().get("wx849_api_timeout", 60),
+                    media_timeout=conf().get("wx849_api_media_timeout", 300),
+                )
+                # 性能指标中显示每个接口的 请求数/错误数/平均耗时ms/最大耗时ms
+                metrics.register_gauge("wx849_api", self._api_stats)
                 
             # 设置bot的ignore_protection属性为True，强制忽略所有风控保护
             if hasattr(self.bot, "ignore_protection"):
@@ -616,7 +645,7 @@ class WX849Channel(ChatChannel):
                     
                     # 如果没有获取到名称，尝试获取个人资料
                     if not new_name:
-                        threading.Thread(target=lambda: asyncio.run(self._get_user_profile())).start()
+                        self.refresher.submit("profile", self._get_user_profile)
                     
                     return True, new_wxid
             except Exception as e:
@@ -959,8 +988,8 @@ class WX849Channel(ChatChannel):
         else:
             logger.info(f"[WX849] 自动登录成功，保持原有登录时间戳不变")
 
-        # 异步获取用户资料
-        threading.Thread(target=lambda: asyncio.run(self._get_user_profile())).start()
+        # 后台获取用户资料
+        self.refresher.submit("profile", self._get_user_profile)
 
     def _update_login_timestamp(self, wxid):
         """更新登录时间戳到设备信息文件"""
@@ -1029,11 +1058,209 @@ class WX849Channel(ChatChannel):
             self.name = self.wxid
             logger.error(f"[WX849] 获取用户资料失败: {e}")
 
+    def _schedule_group_refresh(self, group_id, priority=PRIORITY_HIGH):
+        """
+        提交群成员信息的后台刷新，同一个群排队或刷新中时不会重复提交
+        成员信息未过期，或距上次提交不足wx849_group_refresh_interval秒的群直接跳过，不占用刷新的限速名额
+        """
+        if self._rooms().is_fresh(group_id, conf().get("wx849_room_cache_ttl", 86400), need_members=True):
+            return False
+        now = time.monotonic()
+        last = self.group_refresh_times.get(group_id)
+        if last is not None and now - last < conf().get("wx849_group_refresh_interval", 300):
+            return False
+        if not self.refresher.submit(f"group:{group_id}", functools.partial(self._get_group_member_details, group_id), priority):
+            return False
+        self.group_refresh_times[group_id] = now
+        return True
+
+    def _prefetch_white_list_groups(self):
+        """登录后以低优先级预取白名单中缓存已过期的群，白名单可以是群名或群ID"""
+        matcher = get_trigger_matcher()
+        if matcher.group_white_list_missing or matcher.group_white_all:
+            return 0
+        rooms = self._rooms()
+        ttl = conf().get("wx849_room_cache_ttl", 86400)
+        name_to_id = {room.get("nickName"): group_id for group_id, room in list(rooms.rooms.items())}
+        count = 0
+        for name in matcher.group_white_set:
+            group_id = name if name.endswith("@chatroom") else name_to_id.get(name)
+            if group_id and not rooms.is_fresh(group_id, ttl, need_members=True):
+                count += self._schedule_group_refresh(group_id, PRIORITY_LOW)
+        if count:
+            logger.info(f"[WX849] 已提交 {count} 个白名单群的后台刷新")
+        return count
+
+    def _rooms(self) -> RoomStore:
+        """群信息缓存，首次使用时从tmp/wx849_rooms.db加载，旧版的wx849_rooms.json会被迁移一次"""
+        if self.room_store is None:
+            with self.room_store_lock:
+                if self.room_store is None:
+                    tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
+                    os.makedirs(tmp_dir, exist_ok=True)
+                    self.room_store = RoomStore(
+                        os.path.join(tmp_dir, "wx849_rooms.db"),
+                        flush_interval=conf().get("wx849_room_flush_interval", 5),
+                        legacy_json=os.path.join(tmp_dir, "wx849_rooms.json"),
+                    )
+                    metrics.register_gauge("wx849_rooms", self.room_store.stats)
+        return self.room_store
+
+    def _api_session(self):
+        """与协议服务通信的会话，登录后复用客户端的长连接会话"""
+        if self.bot is not None and hasattr(self.bot, "session"):
+            return self.bot.session()
+        return aiohttp.ClientSession()
+
+    @contextlib.asynccontextmanager
+    async def _external_session(self, url):
+        """下载外部资源的会话，使用按host共享的长连接会话，退出时不关闭"""
+        yield get_aiohttp_session(url)
+
+    def _api_stats(self):
+        api_session = getattr(self.bot, "api_session", None)
+        if api_session is None:
+            return {}
+        return {endpoint: "{requests}/{errors}/{avg_ms}/{max_ms}".format(**stats) for endpoint, stats in api_session.stats().items()}
+
+    def _max_poll_interval(self):
+        """回调服务运行时轮询间隔最多退避到wx849_poll_max_interval，否则保持每秒轮询"""
+        if self.callback_runner is None:
+            return 1
+        return max(1, conf().get("wx849_poll_max_interval", 30))
+
+    @staticmethod
+    def _is_group_message(msg: dict) -> bool:
+        # 检查多种可能的群聊标识字段
+        if msg.get("roomId"):
+            return True
+        for key in ("toUserName", "ToUserName"):
+            value = msg.get(key)
+            if isinstance(value, str) and value.endswith("@chatroom"):
+                return True
+        return False
+
+    def _conversation_key(self, cmsg: WX849Message) -> str:
+        """消息所属的会话：群聊为群ID，私聊为对方wxid"""
+        if cmsg.is_group:
+            room_id = cmsg.msg.get("roomId")
+            if room_id:
+                return room_id
+            return cmsg.from_user_id if cmsg.from_user_id.endswith("@chatroom") else cmsg.to_user_id
+        return cmsg.to_user_id if cmsg.from_user_id == self.wxid else cmsg.from_user_id
+
+    async def _dispatch_messages(self, messages):
+        """
+        将轮询或回调推送得到的一批消息经过过滤后交给私聊/群聊处理
+        同一会话的消息按顺序处理，不同会话并发处理，并发数由wx849_dispatch_concurrency限制，
+        避免一条图片消息的下载阻塞同批次中其他会话的消息
+        """
+        conversations = {}  # 会话 -> [消息]，保持批次内的先后顺序
+        for idx, msg in enumerate(messages):
+            try:
+                logger.debug(f"[WX849] 处理第 {idx+1}/{len(messages)} 条消息")
+                cmsg = WX849Message(msg, self._is_group_message(msg))
+
+                if self._should_filter_this_message(cmsg):
+                    logger.debug(f"[WX849] Message from {getattr(cmsg, 'sender_wxid', 'UnknownSender')} was filtered out by _should_filter_this_message.")
+                    continue
+                conversations.setdefault(self._conversation_key(cmsg), []).append(cmsg)
+            except Exception as e:
+                logger.error(f"[WX849] 处理消息出错: {e}")
+                logger.error(f"[WX849] 异常堆栈: {traceback.format_exc()}")
+
+        if len(conversations) <= 1:
+            for cmsgs in conversations.values():
+                await self._handle_conversation(cmsgs)
+            return
+        if self.dispatch_semaphore is None:
+            self.dispatch_semaphore = asyncio.Semaphore(max(1, conf().get("wx849_dispatch_concurrency", 8)))
+        await asyncio.gather(*(self._handle_conversation(cmsgs, self.dispatch_semaphore) for cmsgs in conversations.values()))
+
+    async def _handle_conversation(self, cmsgs, semaphore=None):
+        """按顺序处理同一会话的消息，单条消息出错不影响后续消息"""
+        if semaphore is not None:
+            async with semaphore:
+                return await self._handle_conversation(cmsgs)
+        for cmsg in cmsgs:
+            try:
+                if cmsg.is_group:
+                    await self.handle_group(cmsg)
+                else:
+                    await self.handle_single(cmsg)
+            except Exception as e:
+                logger.error(f"[WX849] 处理消息出错: {e}")
+                logger.error(f"[WX849] 异常堆栈: {traceback.format_exc()}")
+
+    def _parse_pushed_messages(self, payload) -> list:
+        """
+        解析协议服务推送的消息，兼容消息列表、{"messages": [...]}以及与Msg/Sync返回相同的{"Data": {"AddMsgs": [...]}}
+        原始的AddMsgs消息转换为与get_new_message相同的格式
+        """
+        if isinstance(payload, dict):
+            data = payload.get("Data") if isinstance(payload.get("Data"), dict) else payload
+            payload = data.get("AddMsgs") or data.get("messages") or data.get("Messages") or []
+        if not isinstance(payload, list):
+            return []
+        messages = []
+        for msg in payload:
+            if not isinstance(msg, dict):
+                continue
+            if isinstance(msg.get("FromUserName"), dict):
+                msg = self.bot._process_message(msg) if self.bot and hasattr(self.bot, "_process_message") else None
+            if msg:
+                messages.append(msg)
+        return messages
+
+    async def _handle_callback(self, request):
+        """协议服务推送消息的回调接口，使用wx849_callback_key校验"""
+        key = request.headers.get("X-Callback-Key") or request.query.get("key") or ""
+        if not hmac.compare_digest(key.encode("utf-8"), conf().get("wx849_callback_key", "").encode("utf-8")):
+            logger.warning(f"[WX849] 回调校验失败，来源: {request.remote}")
+            return web.json_response({"success": False, "message": "invalid key"}, status=403)
+        try:
+            payload = await request.json()
+        except Exception:
+            return web.json_response({"success": False, "message": "invalid json"}, status=400)
+        messages = self._parse_pushed_messages(payload)
+        if messages:
+            logger.debug(f"[WX849] 回调收到 {len(messages)} 条消息")
+            await self._dispatch_messages(messages)
+        return web.json_response({"success": True, "count": len(messages)})
+
+    def _create_callback_app(self) -> web.Application:
+        """回调服务的aiohttp应用，在wx849_callback_path上接收推送的消息"""
+        app = web.Application(client_max_size=conf().get("wx849_callback_max_size_mb", 20) * 1024 * 1024)
+        app.router.add_post(conf().get("wx849_callback_path", "/wx849/callback"), self._handle_callback)
+        return app
+
+    async def _start_callback_server(self):
+        """在通道的事件循环上启动回调服务，接收协议服务推送的消息"""
+        if not conf().get("wx849_callback_enabled", False):
+            return
+        if not conf().get("wx849_callback_key"):
+            logger.error("[WX849] 已开启wx849_callback_enabled但未设置wx849_callback_key，回调服务未启动，继续使用轮询")
+            return
+        host = conf().get("wx849_callback_host", "127.0.0.1")
+        port = conf().get("wx849_callback_port", 9919)
+        path = conf().get("wx849_callback_path", "/wx849/callback")
+        runner = web.AppRunner(self._create_callback_app(), access_log=None)
+        try:
+            await runner.setup()
+            await web.TCPSite(runner, host, port).start()
+        except Exception as e:
+            logger.error(f"[WX849] 回调服务启动失败: {e}，继续使用轮询")
+            await runner.cleanup()
+            return
+        self.callback_runner = runner
+        logger.info(f"[WX849] 回调服务已启动: http://{host}:{port}{path}")
+
     async def _message_listener(self):
         """消息监听器"""
         logger.info("[WX849] 开始监听消息...")
         error_count = 0
         login_error_count = 0  # 跟踪登录错误计数
+        poll_interval = 1
         
         while self.is_running:
             try:
@@ -1099,45 +1326,15 @@ class WX849Channel(ChatChannel):
                 
                 # 如果获取到消息，则处理
                 if messages:
-                    for idx, msg in enumerate(messages):
-                        try:
-                            logger.debug(f"[WX849] 处理第 {idx+1}/{len(messages)} 条消息")
-                            # 判断是否是群消息
-                            is_group = False
-                            # 检查多种可能的群聊标识字段
-                            if "roomId" in msg and msg["roomId"]:
-                                is_group = True
-                            elif "toUserName" in msg and msg["toUserName"] and msg["toUserName"].endswith("@chatroom"):
-                                is_group = True
-                            elif "ToUserName" in msg and msg["ToUserName"] and msg["ToUserName"].endswith("@chatroom"):
-                                is_group = True
-                            
-                            if is_group:
-                                logger.debug(f"[WX849] 识别为群聊消息")
-                            else:
-                                logger.debug(f"[WX849] 识别为私聊消息")
-                            
-                            # 创建消息对象
-                            cmsg = WX849Message(msg, is_group)
-
-                            # ADDED: Call the new filter method
-                            if self._should_filter_this_message(cmsg): # 调用新的过滤方法
-                                logger.debug(f"[WX849] Message from {getattr(cmsg, 'sender_wxid', 'UnknownSender')} was filtered out by _should_filter_this_message.")
-                                continue # 如果消息被过滤，则跳过后续处理，处理下一条消息                            
+                    if self.callback_runner is not None:
+                        logger.debug(f"[WX849] 轮询获取到 {len(messages)} 条回调未推送的消息")
+                    await self._dispatch_messages(messages)
+                    poll_interval = 1
+                else:
+                    # 没有新消息时逐步放慢轮询；回调服务运行时消息主要靠推送，轮询只作为兜底
+                    poll_interval = min(poll_interval * 2, self._max_poll_interval())
 
-                            # 处理消息
-                            if is_group:
-                                await self.handle_group(cmsg)
-                            else:
-                                await self.handle_single(cmsg)
-                        except Exception as e:
-                            logger.error(f"[WX849] 处理消息出错: {e}")
-                            # 打印完整的异常堆栈
-                            import traceback
-                            logger.error(f"[WX849] 异常堆栈: {traceback.format_exc()}")
-                
-                # 休眠一段时间
-                await asyncio.sleep(1)
+                await asyncio.sleep(poll_interval)
             except Exception as e:
                 logger.error(f"[WX849] 消息监听器出错: {e}")
                 # 打印完整的异常堆栈
@@ -1155,15 +1352,37 @@ class WX849Channel(ChatChannel):
         self._start_image_cache_cleanup_task()         
         # 定义启动任务
         async def startup_task():
+            # 登录过程中也会提交刷新任务，先启动后台刷新
+            await self.refresher.start()
+            metrics.register_gauge("wx849_refresh", self.refresher.stats)
             # 初始化机器人（登录）
             login_success = await self._initialize_bot()
             if login_success:
                 logger.info("[WX849] 登录成功，准备启动消息监听...")
                 self.is_running = True
+                # 重放上次退出前未处理完成的消息
+                self.replay_journal()
+                # 启动时一次性加载群信息缓存，避免第一条群消息时才读取，并预取白名单群的信息
+                self._rooms()
+                self._prefetch_white_list_groups()
+                # 开启回调时接收推送的消息，轮询作为兜底
+                await self._start_callback_server()
                 # 启动消息监听
                 await self._message_listener()
+                # 监听结束后停止后台刷新，关闭回调服务和共享会话
+                await self.refresher.stop()
+                if self.callback_runner is not None:
+                    await self.callback_runner.cleanup()
+                    self.callback_runner = None
+                if hasattr(self.bot, "api_session"):
+                    await self.bot.api_session.close()
+                if self.room_store is not None:
+                    self.room_store.close()
+                await close_aiohttp_sessions()
             else:
                 logger.error("[WX849] 初始化失败")
+                # 登录失败后事件循环随之结束，停止后台刷新，避免之后提交的任务一直排队
+                await self.refresher.stop()
         
         # 在新线程中运行事件循环
         def run_loop():
@@ -1250,7 +1469,7 @@ class WX849Channel(ChatChannel):
                 if wx_msg_key in self.received_msgs: 
                     logger.debug(f"[WX849] Filter: Ignored duplicate message: {wx_msg_key}")
                     return True
-                self.received_msgs[wx_msg_key] = wx_msg
+                self.received_msgs[wx_msg_key] = True
         else:
             logger.debug("[WX849] Filter: Message lacks unique msg_id for duplicate check, proceeding with caution.")
         
@@ -1275,21 +1494,18 @@ class WX849Channel(ChatChannel):
             
             # 检查前缀匹配
             if cmsg.ctype == ContextType.TEXT:
-                single_chat_prefix = conf().get("single_chat_prefix", [""])
+                single_chat_prefix = get_trigger_matcher().single_chat_prefix
                 # 日志记录前缀配置，方便调试
-                logger.debug(f"[WX849] 单聊前缀配置: {single_chat_prefix}")
-                match_prefix = None
-                for prefix in single_chat_prefix:
-                    if prefix and cmsg.content.startswith(prefix):
-                        logger.debug(f"[WX849] 匹配到前缀: {prefix}")
-                        match_prefix = prefix
-                        # 去除前缀
-                        cmsg.content = cmsg.content[len(prefix):].strip()
-                        logger.debug(f"[WX849] 去除前缀后的内容: {cmsg.content}")
-                        break
+                logger.debug(f"[WX849] 单聊前缀配置: {single_chat_prefix.prefixes}")
+                match_prefix = single_chat_prefix.match(cmsg.content, skip_empty=True)
+                if match_prefix:
+                    logger.debug(f"[WX849] 匹配到前缀: {match_prefix}")
+                    # 去除前缀
+                    cmsg.content = cmsg.content[len(match_prefix):].strip()
+                    logger.debug(f"[WX849] 去除前缀后的内容: {cmsg.content}")
                 
                 # 记录是否匹配
-                if not match_prefix and single_chat_prefix and "" not in single_chat_prefix:
+                if not match_prefix and single_chat_prefix.prefixes and not single_chat_prefix.accepts_empty:
                     logger.debug(f"[WX849] 未匹配到前缀，消息被过滤: {cmsg.content}")
                     # 如果没有匹配到前缀且配置中没有空前缀，则直接返回，不处理该消息
                     return
@@ -1327,26 +1543,16 @@ class WX849Channel(ChatChannel):
             
             # 检查白名单
             if cmsg.from_user_id and hasattr(cmsg, 'from_user_id'):
-                group_white_list = conf().get("group_name_white_list", ["ALL_GROUP"])
-                # 检查是否启用了白名单
-                if "ALL_GROUP" not in group_white_list:
+                matcher = get_trigger_matcher()
+                # 检查是否启用了白名单，未配置白名单时不限制
+                if not (matcher.group_white_list_missing or matcher.group_white_all):
                     # 获取群名
                     group_name = None
                     try:
-                        # 使用同步方式获取群名，避免事件循环嵌套
-                        chatrooms_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp", 'wx849_rooms.json')
-                        
-                        if os.path.exists(chatrooms_file):
-                            try:
-                                with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                                    chatrooms_info = json.load(f)
-                                
-                                if cmsg.from_user_id in chatrooms_info:
-                                    group_name = chatrooms_info[cmsg.from_user_id].get("nickName")
-                                    if group_name:
-                                        logger.debug(f"[WX849] 从缓存获取到群名: {group_name}")
-                            except Exception as e:
-                                logger.error(f"[WX849] 读取群聊缓存失败: {e}")
+                        # 从内存中的群信息缓存获取群名
+                        group_name = self._rooms().group_name(cmsg.from_user_id)
+                        if group_name:
+                            logger.debug(f"[WX849] 从缓存获取到群名: {group_name}")
                         
                         # 如果没有从缓存获取到群名，使用群ID作为备用
                         if not group_name:
@@ -1359,9 +1565,9 @@ class WX849Channel(ChatChannel):
                         group_name = cmsg.from_user_id
                     
                     # 检查群名是否在白名单中
-                    if group_name and group_name not in group_white_list:
+                    if group_name and group_name not in matcher.group_white_set:
                         # 使用群ID再次检查
-                        if cmsg.from_user_id not in group_white_list:
+                        if cmsg.from_user_id not in matcher.group_white_set:
                             logger.info(f"[WX849] 群聊不在白名单中，跳过处理: {group_name}")
                             return
                     
@@ -1370,12 +1576,11 @@ class WX849Channel(ChatChannel):
             # 检查前缀匹配
             trigger_proceed = False
             if cmsg.ctype == ContextType.TEXT:
-                group_chat_prefix = conf().get("group_chat_prefix", [])
-                group_chat_keyword = conf().get("group_chat_keyword", [])
+                matcher = get_trigger_matcher()
                 
                 # 日志记录前缀配置，方便调试
-                logger.debug(f"[WX849] 群聊前缀配置: {group_chat_prefix}")
-                logger.debug(f"[WX849] 群聊关键词配置: {group_chat_keyword}")
+                logger.debug(f"[WX849] 群聊前缀配置: {matcher.group_chat_prefix.prefixes}")
+                logger.debug(f"[WX849] 群聊关键词配置: {matcher.group_chat_keyword.patterns}")
                 
                 # MODIFIED: Enhanced prefix checking for normal and quote messages
                 text_to_check_for_prefix = cmsg.content
@@ -1398,42 +1603,40 @@ class WX849Channel(ChatChannel):
                     else:
                         logger.debug(f"[WX849] Quote message format did not match extraction pattern: {cmsg.content[:100]}...")
                 
-                # Loop through configured prefixes
-                for prefix in group_chat_prefix:
-                    if prefix and text_to_check_for_prefix.startswith(prefix):
-                        logger.debug(f"[WX849] Group chat matched prefix: '{prefix}' (on text: '{text_to_check_for_prefix[:50]}...')")
-                        cleaned_question_content = text_to_check_for_prefix[len(prefix):].strip()
-                        
-                        if is_quote_with_extracted_question:
-                            # Reconstruct cmsg.content with the cleaned question part, preserving the rest of the quote structure
-                            # The rest of the message starts after the original full guide + question + suffix part
-                            full_original_question_segment = guide_prefix + original_user_question_in_quote + guide_suffix
-                            if cmsg.content.startswith(full_original_question_segment):
-                                rest_of_message_after_quote_question = cmsg.content[len(full_original_question_segment):]
-                                cmsg.content = guide_prefix + cleaned_question_content + guide_suffix + rest_of_message_after_quote_question
-                                logger.debug(f"[WX849] Quote message, prefix removed. New content: {cmsg.content[:150]}...")
-                            else:
-                                # This fallback is less ideal as it might indicate an issue with segment identification
-                                logger.warning(f"[WX849] Quote message content did not start as expected with extracted segments. Attempting direct replacement of user question part.")
-                                # Attempt to replace only the original_user_question_in_quote part within the larger cmsg.content
-                                # This is safer if the rest_of_message_after_quote_question logic is not robust enough for all cases
-                                cmsg.content = cmsg.content.replace(original_user_question_in_quote, cleaned_question_content, 1)
-                                logger.debug(f"[WX849] Quote message, prefix removed via replace. New content: {cmsg.content[:150]}...")
+                # 使用预编译的前缀字典树匹配，忽略空前缀
+                prefix = matcher.group_chat_prefix.match(text_to_check_for_prefix, skip_empty=True)
+                if prefix:
+                    logger.debug(f"[WX849] Group chat matched prefix: '{prefix}' (on text: '{text_to_check_for_prefix[:50]}...')")
+                    cleaned_question_content = text_to_check_for_prefix[len(prefix):].strip()
+                    
+                    if is_quote_with_extracted_question:
+                        # Reconstruct cmsg.content with the cleaned question part, preserving the rest of the quote structure
+                        # The rest of the message starts after the original full guide + question + suffix part
+                        full_original_question_segment = guide_prefix + original_user_question_in_quote + guide_suffix
+                        if cmsg.content.startswith(full_original_question_segment):
+                            rest_of_message_after_quote_question = cmsg.content[len(full_original_question_segment):]
+                            cmsg.content = guide_prefix + cleaned_question_content + guide_suffix + rest_of_message_after_quote_question
+                            logger.debug(f"[WX849] Quote message, prefix removed. New content: {cmsg.content[:150]}...")
                         else:
-                            # For non-quote messages, the behavior is as before
-                            cmsg.content = cleaned_question_content
-                            logger.debug(f"[WX849] Non-quote message, prefix removed. New content: {cmsg.content}")
-                        
-                        trigger_proceed = True
-                        break
+                            # This fallback is less ideal as it might indicate an issue with segment identification
+                            logger.warning(f"[WX849] Quote message content did not start as expected with extracted segments. Attempting direct replacement of user question part.")
+                            # Attempt to replace only the original_user_question_in_quote part within the larger cmsg.content
+                            # This is safer if the rest_of_message_after_quote_question logic is not robust enough for all cases
+                            cmsg.content = cmsg.content.replace(original_user_question_in_quote, cleaned_question_content, 1)
+                            logger.debug(f"[WX849] Quote message, prefix removed via replace. New content: {cmsg.content[:150]}...")
+                    else:
+                        # For non-quote messages, the behavior is as before
+                        cmsg.content = cleaned_question_content
+                        logger.debug(f"[WX849] Non-quote message, prefix removed. New content: {cmsg.content}")
+                    
+                    trigger_proceed = True
                 
                 # 检查关键词匹配
-                if not trigger_proceed and group_chat_keyword:
-                    for keyword in group_chat_keyword:
-                        if keyword and keyword in cmsg.content:
-                            logger.debug(f"[WX849] 群聊匹配到关键词: {keyword}")
-                            trigger_proceed = True
-                            break
+                if not trigger_proceed:
+                    keyword = matcher.group_chat_keyword.search(cmsg.content)
+                    if keyword:
+                        logger.debug(f"[WX849] 群聊匹配到关键词: {keyword}")
+                        trigger_proceed = True
                 
                 # 检查是否@了机器人（增强版）
                 if not trigger_proceed and (cmsg.at_list or cmsg.content.find("@") >= 0):
@@ -1536,34 +1739,10 @@ class WX849Channel(ChatChannel):
         # 尝试获取机器人在群内的昵称
         if cmsg.is_group and not cmsg.self_display_name:
             try:
-                # 从缓存中查询群成员详情
-                tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
-                chatrooms_file = os.path.join(tmp_dir, 'wx849_rooms.json')
-                
-                if os.path.exists(chatrooms_file):
-                    try:
-                        with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                            chatrooms_info = json.load(f)
-                        
-                        if cmsg.from_user_id in chatrooms_info:
-                            room_info = chatrooms_info[cmsg.from_user_id]
-                            
-                            # 在成员中查找机器人的信息
-                            if "members" in room_info and isinstance(room_info["members"], list):
-                                for member in room_info["members"]:
-                                    if member.get("UserName") == self.wxid:
-                                        # 优先使用群内显示名称
-                                        if member.get("DisplayName"):
-                                            cmsg.self_display_name = member.get("DisplayName")
-                                            logger.debug(f"[WX849] 从群成员缓存中获取到机器人群内昵称: {cmsg.self_display_name}")
-                                            break
-                                        # 其次使用昵称
-                                        elif member.get("NickName"):
-                                            cmsg.self_display_name = member.get("NickName")
-                                            logger.debug(f"[WX849] 从群成员缓存中获取到机器人昵称: {cmsg.self_display_name}")
-                                            break
-                    except Exception as e:
-                        logger.error(f"[WX849] 读取群成员缓存失败: {e}")
+                # 从群成员缓存中查询机器人的群内昵称，没有群内昵称时使用微信昵称
+                cmsg.self_display_name = self._rooms().member_name(cmsg.from_user_id, self.wxid) or ""
+                if cmsg.self_display_name:
+                    logger.debug(f"[WX849] 从群成员缓存中获取到机器人群内昵称: {cmsg.self_display_name}")
                 
                 # 如果缓存中没有找到，使用机器人名称
                 if not cmsg.self_display_name:
@@ -1662,12 +1841,10 @@ class WX849Channel(ChatChannel):
             # 设置actual_user_id为发送者wxid
             cmsg.actual_user_id = cmsg.sender_wxid
             
-            # 异步获取发送者昵称并设置actual_user_nickname
-            # 但现在我们无法在同步方法中直接调用异步方法，所以先使用wxid
-            cmsg.actual_user_nickname = cmsg.sender_wxid
-            
-            # 启动异步任务获取昵称并更新actual_user_nickname
-            threading.Thread(target=lambda: asyncio.run(self._update_nickname_async(cmsg))).start()
+            # 从群成员缓存获取发送者昵称，缓存中没有时先使用wxid，并在后台刷新群成员信息
+            cmsg.actual_user_nickname = self._rooms().member_name(cmsg.from_user_id, cmsg.sender_wxid) or cmsg.sender_wxid
+            if cmsg.actual_user_nickname == cmsg.sender_wxid and cmsg.from_user_id.endswith("@chatroom"):
+                self._schedule_group_refresh(cmsg.from_user_id)
             
             logger.debug(f"[WX849] 设置实际发送者信息: actual_user_id={cmsg.actual_user_id}, actual_user_nickname={cmsg.actual_user_nickname}")
         else:
@@ -1680,14 +1857,6 @@ class WX849Channel(ChatChannel):
             cmsg.actual_user_nickname = cmsg.from_user_id
             logger.debug(f"[WX849] 设置私聊发送者信息: actual_user_id={cmsg.actual_user_id}, actual_user_nickname={cmsg.actual_user_nickname}")
 
-    async def _update_nickname_async(self, cmsg):
-        """异步更新消息中的昵称信息"""
-        if cmsg.is_group and cmsg.from_user_id.endswith("@chatroom"):
-            nickname = await self._get_chatroom_member_nickname(cmsg.from_user_id, cmsg.sender_wxid)
-            if nickname and nickname != cmsg.actual_user_nickname:
-                cmsg.actual_user_nickname = nickname
-                logger.debug(f"[WX849] 异步更新了发送者昵称: {nickname}")
-
     def _process_text_message(self, cmsg):
         """处理文本消息"""
         import xml.etree.ElementTree as ET
@@ -2207,7 +2376,7 @@ class WX849Channel(ChatChannel):
                 # --- MODIFICATION BLOCK END ---
 
                 try:
-                    async with aiohttp.ClientSession() as session:
+                    async with self._api_session() as session:
                         async with session.post(api_url, json=params, timeout=aiohttp.ClientTimeout(total=30)) as response:
                             if response.status != 200:
                                 full_error_text = await response.text()
@@ -2625,7 +2794,7 @@ class WX849Channel(ChatChannel):
                 logger.debug(f"[{self.name}] RefDownload Chunk {i+1}/{num_chunks}: URL={api_url}, Params={params}")
 
                 try:
-                    async with aiohttp.ClientSession() as session:
+                    async with self._api_session() as session:
                         # Increased timeout for potentially slow media downloads
                         async with session.post(api_url, json=params, timeout=aiohttp.ClientTimeout(total=30)) as response:
                             if response.status != 200:
@@ -3474,7 +3643,7 @@ class WX849Channel(ChatChannel):
                 data = params
             
             # 发送请求，设置超时时间
-            async with aiohttp.ClientSession() as session:
+            async with self._api_session() as session:
                 headers = {"Content-Type": content_type}
                 try:
                     # 根据内容类型选择不同的请求方式
@@ -3714,7 +3883,7 @@ class WX849Channel(ChatChannel):
         video_downloaded = False
         try:
             # 1. 异步下载视频
-            async with aiohttp.ClientSession() as session:
+            async with self._external_session(video_url) as session:
                 async with session.get(video_url, timeout=aiohttp.ClientTimeout(total=60)) as resp: # 60秒超时
                     if resp.status == 200:
                         with open(video_file_path, 'wb') as f:
@@ -3737,7 +3906,12 @@ class WX849Channel(ChatChannel):
         if not video_downloaded:
             return None
 
-        # 2. 使用 OpenCV 处理视频，提取缩略图和时长
+        # 2. 使用 OpenCV 处理视频，提取缩略图和时长，解码视频是阻塞操作，放到线程池中执行，避免阻塞通道事件循环
+        return await asyncio.get_running_loop().run_in_executor(None, self._extract_video_thumb, video_file_path, thumb_file_path)
+
+    @staticmethod
+    def _extract_video_thumb(video_file_path: str, thumb_file_path: str) -> dict:
+        """提取视频第一帧作为缩略图并计算时长，在线程池中执行"""
         duration = 0
         thumb_generated = False
         cap = None # 初始化 cap
@@ -3865,7 +4039,47 @@ class WX849Channel(ChatChannel):
                     logger.warning(f"[WX849] Failed to clean up temp thumb file {thumb_path}: {e_clean}")
 
     def send(self, reply: Reply, context: Context):
-        """发送消息"""
+        """
+        发送消息
+        开启async_pipeline时在通道事件循环上执行；未开启时与原来一样在处理消息的线程中使用临时事件循环，
+        语音转码、视频截图等耗时操作不会占用通道事件循环，影响消息监听和其他消息的发送
+        """
+        try:
+            asyncio.get_running_loop()
+            in_loop = True
+        except RuntimeError:
+            in_loop = False
+        if self._pipeline_loop() is None and not in_loop:
+            return self._run_in_temp_loop(self.async_send(reply, context))
+        return self._run_on_loop(self.async_send(reply, context))
+
+    def _run_in_temp_loop(self, coro):
+        """在当前线程的临时事件循环中执行协程，结束时关闭在该事件循环上创建的共享会话"""
+        async def _run():
+            try:
+                return await coro
+            finally:
+                if hasattr(self.bot, "api_session"):
+                    await self.bot.api_session.close()
+                await close_aiohttp_sessions()
+        return asyncio.run(_run())
+
+    def _run_on_loop(self, coro):
+        """在通道事件循环上执行协程并等待结果，通道事件循环未运行时(如登录前)使用临时事件循环"""
+        loop = getattr(self, "loop", None)
+        if loop is not None and loop.is_running():
+            try:
+                running_loop = asyncio.get_running_loop()
+            except RuntimeError:
+                running_loop = None
+            if running_loop is not loop:
+                return asyncio.run_coroutine_threadsafe(coro, loop).result()
+            # 已经在通道事件循环中，无法阻塞等待，改为后台任务
+            return loop.create_task(coro)
+        return self._run_in_temp_loop(coro)
+
+    async def async_send(self, reply: Reply, context: Context):
+        """发送消息的异步实现，阻塞操作(下载、ffmpeg等)放到线程池中执行"""
         # 获取接收者ID
         receiver = context.get("receiver")
         if not receiver:
@@ -3877,12 +4091,12 @@ class WX849Channel(ChatChannel):
         if not receiver:
             logger.error("[WX849] 发送消息失败: 无法确定接收者ID")
             return
-            
-        loop = asyncio.new_event_loop()
-        
+
+        loop = asyncio.get_running_loop()
+
         if reply.type == ReplyType.TEXT:
             reply.content = remove_markdown_symbol(reply.content)
-            result = loop.run_until_complete(self._send_message(receiver, reply.content))
+            result = await self._send_message(receiver, reply.content)
             if result and isinstance(result, dict) and result.get("Success", False):
                 logger.info(f"[WX849] 发送文本消息成功: 接收者: {receiver}")
                 if conf().get("log_level", "INFO") == "DEBUG":
@@ -3892,7 +4106,7 @@ class WX849Channel(ChatChannel):
         
         elif reply.type == ReplyType.ERROR or reply.type == ReplyType.INFO:
             reply.content = remove_markdown_symbol(reply.content)
-            result = loop.run_until_complete(self._send_message(receiver, reply.content))
+            result = await self._send_message(receiver, reply.content)
             if result and isinstance(result, dict) and result.get("Success", False):
                 logger.info(f"[WX849] 发送消息成功: 接收者: {receiver}")
                 if conf().get("log_level", "INFO") == "DEBUG":
@@ -3905,15 +4119,19 @@ class WX849Channel(ChatChannel):
             img_url = reply.content
             logger.debug(f"[WX849] 开始下载图片, url={img_url}")
             try:
-                pic_res = requests.get(img_url, stream=True)
                 # 使用临时文件保存图片
                 tmp_path = os.path.join(get_appdata_dir(), f"tmp_img_{int(time.time())}.png")
-                with open(tmp_path, 'wb') as f:
-                    for block in pic_res.iter_content(1024):
-                        f.write(block)
+
+                def _download():
+                    pic_res = http_client.get(img_url, stream=True)
+                    with open(tmp_path, 'wb') as f:
+                        for block in pic_res.iter_content(1024):
+                            f.write(block)
+
+                await loop.run_in_executor(None, _download)
                 
                 # 使用我们的自定义方法发送图片
-                result = loop.run_until_complete(self._send_image(receiver, tmp_path))
+                result = await self._send_image(receiver, tmp_path)
                 
                 if result and isinstance(result, dict) and result.get("Success", False):
                     logger.info(f"[WX849] 发送图片成功: 接收者: {receiver}")
@@ -3932,7 +4150,7 @@ class WX849Channel(ChatChannel):
             image_input = reply.content
             # 移除 os.path.exists 检查，交由 _send_image 处理
             # 使用我们的自定义方法发送本地图片或BytesIO
-            result = loop.run_until_complete(self._send_image(receiver, image_input))
+            result = await self._send_image(receiver, image_input)
             
             if result and isinstance(result, dict) and result.get("Success", False):
                 logger.info(f"[WX849] 发送图片成功: 接收者: {receiver}")
@@ -3965,7 +4183,7 @@ class WX849Channel(ChatChannel):
             except Exception as e_parse_type:
                 logger.error(f"[WX849] Error parsing app_type from XML: {e_parse_type}, using default: {app_type}. XML: {xml_content[:300]}...")
             
-            result = loop.run_until_complete(self._send_app_xml(receiver, xml_content, app_type))
+            result = await self._send_app_xml(receiver, xml_content, app_type)
             if result and isinstance(result, dict) and result.get("Success", False):
                 logger.info(f"[WX849] 发送App XML消息成功: 接收者: {receiver}, Type: {app_type}")
             else:
@@ -3975,7 +4193,7 @@ class WX849Channel(ChatChannel):
             app_input = reply.content
             # 移除 os.path.exists 检查，交由 _send_app 处理
             # 使用我们的自定义方法发送小程序
-            result = loop.run_until_complete(self._send_app(receiver, app_input))
+            result = await self._send_app(receiver, app_input)
             
             if result and isinstance(result, dict) and result.get("Success", False):
                 logger.info(f"[WX849] 发送小程序成功: 接收者: {receiver}")
@@ -3987,7 +4205,7 @@ class WX849Channel(ChatChannel):
             system_input = reply.content
             # 移除 os.path.exists 检查，交由 _send_system 处理
             # 使用我们的自定义方法发送系统消息
-            result = loop.run_until_complete(self._send_message(receiver, system_input))
+            result = await self._send_message(receiver, system_input)
             
             if result and isinstance(result, dict) and result.get("Success", False):
                 logger.info(f"[WX849] 发送系统消息成功: 接收者: {receiver}")
@@ -4009,8 +4227,7 @@ class WX849Channel(ChatChannel):
                 logger.warning(f"[WX849] session_id was unexpectedly still None for VIDEO_URL, using random: {session_id}")
 
             try:
-                # loop 变量在 send 方法的开头定义
-                loop.run_until_complete(self.send_video(to_wxid, reply.content, session_id))
+                await self.send_video(to_wxid, reply.content, session_id)
             except Exception as e:
                 # send_video 内部已有详细日志，这里可以简化或根据需要调整
                 logger.error(f"[WX849] Error occurred in send_reply while processing VIDEO_URL: {str(e)}")
@@ -4049,7 +4266,7 @@ class WX849Channel(ChatChannel):
                     "-ac", "2", processed_voice_path
                 ]
                 logger.info(f"[WX849] Attempting to preprocess voice file with ffmpeg: {' '.join(cmd)}")
-                process_result = subprocess.run(cmd, capture_output=True, text=True, check=False) # check=False to inspect manually
+                process_result = await loop.run_in_executor(None, functools.partial(subprocess.run, cmd, capture_output=True, text=True, check=False)) # check=False to inspect manually
                 if process_result.returncode == 0 and os.path.exists(processed_voice_path):
                     logger.info(f"[WX849] ffmpeg preprocessing successful. Using processed file: {processed_voice_path}")
                     effective_voice_path = processed_voice_path
@@ -4065,14 +4282,14 @@ class WX849Channel(ChatChannel):
 
             try:
                 # Reduce segment duration to 25 seconds to see if it helps with EndFlag issue
-                _total_duration_ms, segment_paths = split_audio(effective_voice_path, 20 * 1000) 
+                _total_duration_ms, segment_paths = await loop.run_in_executor(None, split_audio, effective_voice_path, 20 * 1000)
                 temp_files_to_clean.extend(segment_paths) # Add segment paths from split_audio for cleanup
 
                 if not segment_paths:
                     logger.error(f"[WX849] Voice splitting failed for {effective_voice_path}. No segments created.")
                     logger.info(f"[WX849] Attempting to send {effective_voice_path} as fallback.")
                     # Duration calculation for fallback is now inside _send_voice, so just pass path
-                    fallback_result = loop.run_until_complete(self._send_voice(receiver, effective_voice_path))
+                    fallback_result = await self._send_voice(receiver, effective_voice_path)
                     if fallback_result and isinstance(fallback_result, dict) and fallback_result.get("Success", False):
                         logger.info(f"[WX849] Fallback: Sent voice file successfully: {effective_voice_path}")
                     else:
@@ -4083,7 +4300,7 @@ class WX849Channel(ChatChannel):
 
                 for i, segment_path in enumerate(segment_paths):
                     # Duration calculation and SILK conversion are now inside _send_voice
-                    segment_result = loop.run_until_complete(self._send_voice(receiver, segment_path))
+                    segment_result = await self._send_voice(receiver, segment_path)
                     if segment_result and isinstance(segment_result, dict) and segment_result.get("Success", False):
                         logger.info(f"[WX849] Sent voice segment {i+1}/{len(segment_paths)} successfully: {segment_path}")
                     else:
@@ -4091,7 +4308,7 @@ class WX849Channel(ChatChannel):
                         # If a segment fails, we might decide to stop or continue. For now, continue.
                     
                     if i < len(segment_paths) - 1:
-                        time.sleep(0.5)
+                        await asyncio.sleep(0.5)
             
             except Exception as e_split_send:
                 logger.error(f"[WX849] Error during voice splitting or segmented sending for {effective_voice_path}: {e_split_send}")
@@ -4109,44 +4326,17 @@ class WX849Channel(ChatChannel):
 
         else:
             logger.warning(f"[WX849] 不支持的回复类型: {reply.type}")
-        
-        loop.close() 
 
     async def _get_group_member_details(self, group_id):
         """获取群成员详情"""
         try:
             logger.debug(f"[WX849] 尝试获取群 {group_id} 的成员详情")
             
-            # 检查是否已存在群成员信息，并检查是否需要更新
-            # 定义群聊信息文件路径
-            tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
-            if not os.path.exists(tmp_dir):
-                os.makedirs(tmp_dir)
-            
-            chatrooms_file = os.path.join(tmp_dir, 'wx849_rooms.json')
-            
-            # 读取现有的群聊信息（如果存在）
-            chatrooms_info = {}
-            if os.path.exists(chatrooms_file):
-                try:
-                    with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                        chatrooms_info = json.load(f)
-                    logger.debug(f"[WX849] 已加载 {len(chatrooms_info)} 个现有群聊信息")
-                except Exception as e:
-                    logger.error(f"[WX849] 加载现有群聊信息失败: {str(e)}")
-            
-            # 检查该群聊是否已存在且成员信息是否已更新
-            # 设定缓存有效期为24小时(86400秒)
-            cache_expiry = 86400
-            current_time = int(time.time())
-            
-            if (group_id in chatrooms_info and 
-                "members" in chatrooms_info[group_id] and 
-                len(chatrooms_info[group_id]["members"]) > 0 and
-                "last_update" in chatrooms_info[group_id] and
-                current_time - chatrooms_info[group_id]["last_update"] < cache_expiry):
+            # 检查该群聊是否已存在且成员信息是否已过期
+            rooms = self._rooms()
+            if rooms.is_fresh(group_id, conf().get("wx849_room_cache_ttl", 86400), need_members=True):
                 logger.debug(f"[WX849] 群 {group_id} 成员信息已存在且未过期，跳过更新")
-                return chatrooms_info[group_id]
+                return rooms.get(group_id)
             
             logger.debug(f"[WX849] 群 {group_id} 成员信息不存在或已过期，开始更新")
             
@@ -4221,23 +4411,8 @@ class WX849Channel(ChatChannel):
             else:
                 logger.warning(f"[WX849] 获取群详情失败: {group_info_response}")
             
-            # 确保在chatrooms_info中创建该群的条目
-            if group_id not in chatrooms_info:
-                chatrooms_info[group_id] = {
-                    "chatroomId": group_id,
-                    "nickName": group_name or group_id,  # 如果获取到群名则使用，否则使用群ID
-                    "chatRoomOwner": "",
-                    "members": [],
-                    "last_update": int(time.time())
-                }
-            else:
-                # 更新现有条目的群名称
-                if group_name:
-                    chatrooms_info[group_id]["nickName"] = group_name
-            
-            # 立即保存群名称信息
-            with open(chatrooms_file, 'w', encoding='utf-8') as f:
-                json.dump(chatrooms_info, f, ensure_ascii=False, indent=2)
+            # 更新群名称，群不存在时创建条目(没有群名时使用群ID)
+            rooms.update_room(group_id, nickName=group_name or None)
             
             logger.info(f"[WX849] 已更新群 {group_id} 的名称: {group_name or '未获取到'}")
             
@@ -4309,20 +4484,8 @@ class WX849Channel(ChatChannel):
                     
                     members.append(member_info)
                 
-                # 更新群聊信息
-                chatrooms_info[group_id]["members"] = members
-                chatrooms_info[group_id]["last_update"] = int(time.time())
-                chatrooms_info[group_id]["memberCount"] = member_count
-                
-                # 同时更新群主信息
-                for member in members:
-                    if member.get("ChatroomMemberFlag") == 2049:  # 群主标志
-                        chatrooms_info[group_id]["chatRoomOwner"] = member.get("UserName", "")
-                        break
-                
-                # 保存到文件
-                with open(chatrooms_file, 'w', encoding='utf-8') as f:
-                    json.dump(chatrooms_info, f, ensure_ascii=False, indent=2)
+                # 更新群聊成员信息，同时根据群主标志更新群主，由缓存在后台批量写入数据库
+                rooms.set_members(group_id, members, member_count)
                 
                 logger.info(f"[WX849] 已更新群聊 {group_id} 成员信息，成员数: {len(members)}")
                 
@@ -4342,90 +4505,44 @@ class WX849Channel(ChatChannel):
         try:
             logger.debug(f"[WX849] 尝试获取群 {group_id} 的名称")
             
+            rooms = self._rooms()
+            cache_expiry = conf().get("wx849_room_cache_ttl", 86400)
+            
             # 检查缓存中是否有群名
             cache_key = f"group_name_{group_id}"
             if hasattr(self, "group_name_cache") and cache_key in self.group_name_cache:
                 cached_name = self.group_name_cache[cache_key]
                 logger.debug(f"[WX849] 从缓存中获取群名: {cached_name}")
                 
-                # 检查是否需要更新群成员详情
-                tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
-                chatrooms_file = os.path.join(tmp_dir, 'wx849_rooms.json')
-                
-                need_update = True
-                # 设定缓存有效期为24小时(86400秒)
-                cache_expiry = 86400
-                current_time = int(time.time())
-                
-                if os.path.exists(chatrooms_file):
-                    try:
-                        with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                            chatrooms_info = json.load(f)
-                        
-                        # 检查群信息是否存在且未过期
-                        if (group_id in chatrooms_info and 
-                            "last_update" in chatrooms_info[group_id] and 
-                            current_time - chatrooms_info[group_id]["last_update"] < cache_expiry and
-                            "members" in chatrooms_info[group_id] and 
-                            len(chatrooms_info[group_id]["members"]) > 0):
-                            logger.debug(f"[WX849] 群 {group_id} 信息已存在且未过期，跳过更新")
-                            need_update = False
-                    except Exception as e:
-                        logger.error(f"[WX849] 检查群信息缓存时出错: {e}")
+                # 检查群信息是否存在且未过期
+                need_update = not rooms.is_fresh(group_id, cache_expiry, need_members=True)
+                if not need_update:
+                    logger.debug(f"[WX849] 群 {group_id} 信息已存在且未过期，跳过更新")
                 
                 # 只有需要更新时才启动线程获取群成员详情
                 if need_update:
-                    logger.debug(f"[WX849] 群 {group_id} 信息需要更新，启动更新线程")
-                    threading.Thread(target=lambda: asyncio.run(self._get_group_member_details(group_id))).start()
+                    logger.debug(f"[WX849] 群 {group_id} 信息需要更新，提交后台刷新")
+                    self._schedule_group_refresh(group_id)
                 
                 return cached_name
             
-            # 检查文件中是否已经有群信息，且未过期
-            tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
-            if not os.path.exists(tmp_dir):
-                os.makedirs(tmp_dir)
-            
-            chatrooms_file = os.path.join(tmp_dir, 'wx849_rooms.json')
-            
-            # 设定缓存有效期为24小时(86400秒)
-            cache_expiry = 86400
-            current_time = int(time.time())
-            
-            if os.path.exists(chatrooms_file):
-                try:
-                    with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                        chatrooms_info = json.load(f)
-                    
-                    # 检查群信息是否存在且未过期
-                    if (group_id in chatrooms_info and 
-                        "nickName" in chatrooms_info[group_id] and
-                        chatrooms_info[group_id]["nickName"] and
-                        chatrooms_info[group_id]["nickName"] != group_id and
-                        "last_update" in chatrooms_info[group_id] and 
-                        current_time - chatrooms_info[group_id]["last_update"] < cache_expiry):
-                        
-                        # 从文件中获取群名
-                        group_name = chatrooms_info[group_id]["nickName"]
-                        logger.debug(f"[WX849] 从文件缓存中获取群名: {group_name}")
-                        
-                        # 缓存群名
-                        if not hasattr(self, "group_name_cache"):
-                            self.group_name_cache = {}
-                        self.group_name_cache[cache_key] = group_name
-                        
-                        # 检查是否需要更新群成员详情
-                        need_update_members = not ("members" in chatrooms_info[group_id] and 
-                                                len(chatrooms_info[group_id]["members"]) > 0)
-                        
-                        if need_update_members:
-                            logger.debug(f"[WX849] 群 {group_id} 名称已缓存，但需要更新成员信息")
-                            threading.Thread(target=lambda: asyncio.run(self._get_group_member_details(group_id))).start()
-                        else:
-                            logger.debug(f"[WX849] 群 {group_id} 信息已完整且未过期，无需更新")
-                        
-                        return group_name
-                except Exception as e:
-                    logger.error(f"[WX849] 从文件获取群名出错: {e}")
+            # 检查群信息缓存中是否已经有群名，且未过期
+            cached_name = rooms.group_name(group_id)
+            if cached_name and cached_name != group_id and rooms.is_fresh(group_id, cache_expiry):
+                group_name = cached_name
+                logger.debug(f"[WX849] 从群信息缓存中获取群名: {group_name}")
+                
+                # 缓存群名
+                self.group_name_cache[cache_key] = group_name
+                
+                # 检查是否需要更新群成员详情
+                if not rooms.get(group_id).get("members"):
+                    logger.debug(f"[WX849] 群 {group_id} 名称已缓存，但需要更新成员信息")
+                    self._schedule_group_refresh(group_id)
+                else:
+                    logger.debug(f"[WX849] 群 {group_id} 信息已完整且未过期，无需更新")
+                
+                return group_name
             
             logger.debug(f"[WX849] 群 {group_id} 信息不存在或已过期，需要从API获取")
             
@@ -4455,18 +4572,8 @@ class WX849Channel(ChatChannel):
                 # 尝试使用群聊专用API
                 group_info = await self._call_api("/Group/GetChatRoomInfo", params)
                 
-                # 保存群聊详情到统一的JSON文件
+                # 保存群聊详情到群信息缓存
                 try:
-                    # 读取现有的群聊信息（如果存在）
-                    chatrooms_info = {}
-                    if os.path.exists(chatrooms_file):
-                        try:
-                            with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                                chatrooms_info = json.load(f)
-                            logger.debug(f"[WX849] 已加载 {len(chatrooms_info)} 个现有群聊信息")
-                        except Exception as e:
-                            logger.error(f"[WX849] 加载现有群聊信息失败: {str(e)}")
-                    
                     # 提取必要的群聊信息
                     if group_info and isinstance(group_info, dict):
                         # 递归函数用于查找特定key的值
@@ -4527,27 +4634,9 @@ class WX849Channel(ChatChannel):
                                 if owner_id:
                                     break
                         
-                        # 检查群聊信息是否已存在
-                        if group_id in chatrooms_info:
-                            # 更新已有群聊信息
-                            if group_name:
-                                chatrooms_info[group_id]["nickName"] = group_name
-                            if owner_id:
-                                chatrooms_info[group_id]["chatRoomOwner"] = owner_id
-                            chatrooms_info[group_id]["last_update"] = int(time.time())
-                        else:
-                            # 创建新群聊信息
-                            chatrooms_info[group_id] = {
-                                "chatroomId": group_id,
-                                "nickName": group_name or group_id,
-                                "chatRoomOwner": owner_id or "",
-                                "members": [],
-                                "last_update": int(time.time())
-                            }
-                        
-                        # 保存到文件
-                        with open(chatrooms_file, 'w', encoding='utf-8') as f:
-                            json.dump(chatrooms_info, f, ensure_ascii=False, indent=2)
+                        # 更新群聊基础信息，不存在时创建，由缓存在后台批量写入数据库
+                        rooms.update_room(group_id, nickName=group_name or None, chatRoomOwner=owner_id or None,
+                                          last_update=int(time.time()))
                         
                         logger.info(f"[WX849] 已更新群聊 {group_id} 基础信息")
                         
@@ -4558,12 +4647,12 @@ class WX849Channel(ChatChannel):
                             self.group_name_cache[cache_key] = group_name
                             
                             # 异步获取群成员详情（不阻塞当前方法）
-                            threading.Thread(target=lambda: asyncio.run(self._get_group_member_details(group_id))).start()
+                            self._schedule_group_refresh(group_id)
                             
                             return group_name
                     
                 except Exception as save_err:
-                    logger.error(f"[WX849] 保存群聊信息到文件失败: {save_err}")
+                    logger.error(f"[WX849] 保存群聊信息失败: {save_err}")
                     import traceback
                     logger.error(f"[WX849] 详细错误: {traceback.format_exc()}")
                 
@@ -4590,7 +4679,7 @@ class WX849Channel(ChatChannel):
                         self.group_name_cache[cache_key] = group_name
                         
                         # 异步获取群成员详情
-                        threading.Thread(target=lambda: asyncio.run(self._get_group_member_details(group_id))).start()
+                        self._schedule_group_refresh(group_id)
                         
                         return group_name
                     else:
@@ -4611,7 +4700,7 @@ class WX849Channel(ChatChannel):
             self.group_name_cache[cache_key] = group_id
             
             # 尽管获取群名失败，仍然尝试获取群成员详情
-            threading.Thread(target=lambda: asyncio.run(self._get_group_member_details(group_id))).start()
+            self._schedule_group_refresh(group_id)
             
             return group_id
         except Exception as e:
@@ -4625,45 +4714,14 @@ class WX849Channel(ChatChannel):
             return member_wxid
             
         try:
-            # 优先从缓存获取群成员信息
-            tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
-            chatrooms_file = os.path.join(tmp_dir, 'wx849_rooms.json')
-            
-            if os.path.exists(chatrooms_file):
-                with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                    chatrooms_info = json.load(f)
-                
-                if group_id in chatrooms_info and "members" in chatrooms_info[group_id]:
-                    for member in chatrooms_info[group_id]["members"]:
-                        if member.get("UserName") == member_wxid:
-                            # 优先使用群内显示名称(群昵称)
-                            if member.get("DisplayName"):
-                                logger.debug(f"[WX849] 获取到成员 {member_wxid} 的群昵称: {member.get('DisplayName')}")
-                                return member.get("DisplayName")
-                            # 其次使用成员昵称
-                            elif member.get("NickName"):
-                                logger.debug(f"[WX849] 获取到成员 {member_wxid} 的昵称: {member.get('NickName')}")
-                                return member.get("NickName")
-            
-            # 如果缓存中没有，尝试更新群成员信息
-            await self._get_group_member_details(group_id)
-            
-            # 再次尝试从更新后的缓存中获取
-            if os.path.exists(chatrooms_file):
-                with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                    chatrooms_info = json.load(f)
-                
-                if group_id in chatrooms_info and "members" in chatrooms_info[group_id]:
-                    for member in chatrooms_info[group_id]["members"]:
-                        if member.get("UserName") == member_wxid:
-                            # 优先使用群内显示名称
-                            if member.get("DisplayName"):
-                                logger.debug(f"[WX849] 更新后获取到成员 {member_wxid} 的群昵称: {member.get('DisplayName')}")
-                                return member.get("DisplayName")
-                            # 其次使用成员昵称
-                            elif member.get("NickName"):
-                                logger.debug(f"[WX849] 更新后获取到成员 {member_wxid} 的昵称: {member.get('NickName')}")
-                                return member.get("NickName")
+            # 优先从群成员缓存获取，群昵称优先，其次成员昵称
+            name = self._rooms().member_name(group_id, member_wxid)
+            if name:
+                logger.debug(f"[WX849] 获取到成员 {member_wxid} 的昵称: {name}")
+                return name
+            
+            # 缓存中没有时在后台刷新群成员信息，本次先返回wxid
+            self._schedule_group_refresh(group_id)
         except Exception as e:
             logger.error(f"[WX849] 获取群成员昵称出错: {e}")
         
@@ -4835,6 +4893,14 @@ class WX849Channel(ChatChannel):
             # Ensure a consistent error response structure if needed by the caller
             return {"Success": False, "Message": f"Exception in _send_app_xml: {e}"}
 
+    @staticmethod
+    def _resample_for_silk(audio):
+        """转为单声道，采样率取SILK支持的最接近的值"""
+        audio = audio.set_channels(1)
+        supported_rates = [8000, 12000, 16000, 24000] # SILK supported rates
+        closest_rate = min(supported_rates, key=lambda x: abs(x - audio.frame_rate))
+        return audio.set_frame_rate(closest_rate)
+
     async def _send_voice(self, to_user_id, voice_file_path_segment):
         """发送语音消息的异步方法 (单个MP3片段路径), 内部处理SILK转换."""
         if not PYSLIK_AVAILABLE:
@@ -4849,22 +4915,22 @@ class WX849Channel(ChatChannel):
                 logger.error(f"[WX849] Send voice failed: voice segment file not found at {voice_file_path_segment}")
                 return {"Success": False, "Message": f"Voice segment not found: {voice_file_path_segment}"}
 
+            # pydub解码重采样和SILK编码都是阻塞操作(ffmpeg子进程和CPU计算)，放到线程池中执行，避免阻塞通道事件循环
+            loop = asyncio.get_running_loop()
+
             # Load MP3 segment with pydub
             try:
                 # Ensure BytesIO is used if pydub's from_file expects a file-like object for all inputs
                 # or if voice_file_path_segment might not always be a simple path string.
                 # However, for a path string, direct usage is fine.
-                audio = AudioSegment.from_file(voice_file_path_segment, format="mp3")
+                audio = await loop.run_in_executor(None, functools.partial(AudioSegment.from_file, voice_file_path_segment, format="mp3"))
             except Exception as e_pydub_load:
                 logger.error(f"[WX849] Failed to load voice segment {voice_file_path_segment} with pydub: {e_pydub_load}")
                 logger.error(traceback.format_exc()) # Log full traceback for pydub errors
                 return {"Success": False, "Message": f"Pydub load failed: {e_pydub_load}"}
 
             # Process audio: set channels, frame rate
-            audio = audio.set_channels(1)
-            supported_rates = [8000, 12000, 16000, 24000] # SILK supported rates
-            closest_rate = min(supported_rates, key=lambda x: abs(x - audio.frame_rate))
-            audio = audio.set_frame_rate(closest_rate)
+            audio = await loop.run_in_executor(None, self._resample_for_silk, audio)
             duration_ms = len(audio)
 
             if duration_ms == 0:
@@ -4876,7 +4942,7 @@ class WX849Channel(ChatChannel):
                 if hasattr(pysilk, 'async_encode') and asyncio.iscoroutinefunction(pysilk.async_encode):
                     silk_data = await pysilk.async_encode(audio.raw_data, sample_rate=audio.frame_rate)
                 elif hasattr(pysilk, 'encode'): 
-                    silk_data = pysilk.encode(audio.raw_data, sample_rate=audio.frame_rate)
+                    silk_data = await loop.run_in_executor(None, functools.partial(pysilk.encode, audio.raw_data, sample_rate=audio.frame_rate))
                 else:
                     logger.error("[WX849] pysilk does not have a usable 'encode' or 'async_encode' method.")
                     return {"Success": False, "Message": "pysilk encode method not found"}
@@ -4910,6 +4976,7 @@ class WX849Channel(ChatChannel):
             logger.error(traceback.format_exc())
             return {"Success": False, "Message": f"General exception in _send_voice: {e}"}
 
+    @metrics.timed("compose")
     def _compose_context(self, ctype: ContextType, content, **kwargs):
         """重写父类方法，构建消息上下文"""
         try:
@@ -1,42 +1,123 @@
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
 
+_MISSING = object()
 
-class ExpiredDict(dict):
-    def __init__(self, expires_in_seconds):
-        super().__init__()
+
+class ExpiredDict(object):
+    """
+    带过期时间的LRU字典，读写都会刷新过期时间并移到末尾
+    所有key的过期时长相同，因此按访问顺序排列即按过期时间排列，过期清理只需从头部开始，均摊O(1)
+    maxsize大于0时超过容量淘汰最久未使用的key；refresh_on_read为False时过期时间只从写入时开始计算
+    """
+
+    def __init__(self, expires_in_seconds, maxsize=None, refresh_on_read=True):
         self.expires_in_seconds = expires_in_seconds if expires_in_seconds else 3600
+        self.maxsize = maxsize or 0
+        self.refresh_on_read = refresh_on_read
+        self.lock = threading.Lock()
+        self.data = OrderedDict()  # key -> (value, expire_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # 超过maxsize被淘汰的数量
+        self.expirations = 0  # 过期被清理的数量
+
+    def _purge(self, now):
+        data = self.data
+        while data:
+            key, (value, expire_at) = next(iter(data.items()))
+            if expire_at > now:
+                break
+            data.popitem(last=False)
+            self.expirations += 1
+
+    def _lookup(self, key, default):
+        with self.lock:
+            item = self.data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            now = time.monotonic()
+            if item[1] <= now:
+                del self.data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self.hits += 1
+            if self.refresh_on_read:
+                self.data[key] = (item[0], now + self.expires_in_seconds)
+                self.data.move_to_end(key)
+            return item[0]
 
     def __getitem__(self, key):
-        value, expiry_time = super().__getitem__(key)
-        if datetime.now() > expiry_time:
-            del self[key]
+        value = self._lookup(key, _MISSING)
+        if value is _MISSING:
             raise KeyError("expired {}".format(key))
-        self.__setitem__(key, value)
         return value
 
     def __setitem__(self, key, value):
-        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
-        super().__setitem__(key, (value, expiry_time))
+        with self.lock:
+            now = time.monotonic()
+            self._purge(now)
+            self.data[key] = (value, now + self.expires_in_seconds)
+            self.data.move_to_end(key)
+            if self.maxsize:
+                while len(self.data) > self.maxsize:
+                    self.data.popitem(last=False)
+                    self.evictions += 1
+
+    def __delitem__(self, key):
+        with self.lock:
+            del self.data[key]
 
     def get(self, key, default=None):
-        try:
-            return self[key]
-        except KeyError:
+        return self._lookup(key, default)
+
+    def pop(self, key, default=_MISSING):
+        with self.lock:
+            item = self.data.pop(key, _MISSING)
+        if item is _MISSING or item[1] <= time.monotonic():
+            if default is _MISSING:
+                raise KeyError(key)
             return default
+        return item[0]
 
     def __contains__(self, key):
-        try:
-            self[key]
-            return True
-        except KeyError:
-            return False
+        return self._lookup(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self.lock:
+            self._purge(time.monotonic())
+            return len(self.data)
 
     def keys(self):
-        keys = list(super().keys())
-        return [key for key in keys if key in self]
+        with self.lock:
+            self._purge(time.monotonic())
+            return list(self.data.keys())
+
+    def values(self):
+        with self.lock:
+            self._purge(time.monotonic())
+            return [value for value, _ in self.data.values()]
 
     def items(self):
-        return [(key, self[key]) for key in self.keys()]
+        with self.lock:
+            self._purge(time.monotonic())
+            return [(key, value) for key, (value, _) in self.data.items()]
 
     def __iter__(self):
-        return self.keys().__iter__()
+        return iter(self.keys())
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"size": len(self.data), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "expirations": self.expirations}
+
+    def __repr__(self):
+        return "{}({}, expires_in_seconds={}, maxsize={})".format(
+            type(self).__name__, dict(self.items()), self.expires_in_seconds, self.maxsize)
@@ -0,0 +1,81 @@
+from collections import OrderedDict, deque
+
+
+class DeficitRoundRobin(object):
+    """
+    按类别加权的差额轮询(DRR)就绪队列
+    每个key属于一个类别，类别之间按权重分配出队机会，类别内部按入队顺序轮询
+    权重可以是小数，小于1时该类别需要累积多轮才能出队一次
+    """
+
+    def __init__(self, weights: dict = None, default_weight=1):
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self.queues = {}  # 类别 -> OrderedDict(key -> True)
+        self.deficits = {}  # 类别 -> 当前差额
+        self.key_class = {}  # key -> 类别
+        self.active = deque()  # 有待出队key的类别，按轮询顺序排列
+        self._granted = False  # 队首类别本轮是否已经获得配额
+
+    def set_weights(self, weights: dict):
+        self.weights = weights or {}
+
+    def weight(self, flow_class):
+        weight = self.weights.get(flow_class, self.default_weight)
+        return weight if weight and weight > 0 else self.default_weight
+
+    def push(self, key, flow_class):
+        """key入队，已在队列中且类别不变的key保持原位置，类别变化时移到新类别队尾"""
+        if key in self.key_class:
+            if self.key_class[key] == flow_class:
+                return
+            self.discard(key)
+        queue = self.queues.get(flow_class)
+        if queue is None:
+            queue = self.queues[flow_class] = OrderedDict()
+            self.deficits[flow_class] = 0
+        if flow_class not in self.active:
+            self.active.append(flow_class)
+        queue[key] = True
+        self.key_class[key] = flow_class
+
+    def pop(self):
+        """按权重选出下一个key，队列为空时抛出KeyError"""
+        while self.active:
+            flow_class = self.active[0]
+            queue = self.queues[flow_class]
+            if not queue:
+                self._retire_head()
+                continue
+            if not self._granted:
+                self.deficits[flow_class] += self.weight(flow_class)
+                self._granted = True
+            if self.deficits[flow_class] >= 1:
+                self.deficits[flow_class] -= 1
+                key, _ = queue.popitem(last=False)
+                del self.key_class[key]
+                if not queue:
+                    self._retire_head()
+                return key
+            self.active.rotate(-1)
+            self._granted = False
+        raise KeyError("pop from an empty DeficitRoundRobin")
+
+    def discard(self, key):
+        flow_class = self.key_class.pop(key, None)
+        if flow_class is not None:
+            del self.queues[flow_class][key]
+
+    def _retire_head(self):
+        flow_class = self.active.popleft()
+        self.deficits[flow_class] = 0
+        self._granted = False
+
+    def __contains__(self, key):
+        return key in self.key_class
+
+    def __len__(self):
+        return len(self.key_class)
+
+    def __bool__(self):
+        return bool(self.key_class)
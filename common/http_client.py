@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common.log import logger
+from common.metrics import metrics
+from config import conf
+
+MAX_HOSTS = 32  # 最多为多少个host单独创建Session
+
+_lock = threading.Lock()
+_sessions = {}  # host -> PooledSession
+_aio_sessions = {}  # (id(loop), host) -> aiohttp.ClientSession
+_host_stats = {}  # host -> {"requests": n, "errors": n}
+
+
+def _host_of(url):
+    parts = urlsplit(url or "")
+    return "{}://{}".format(parts.scheme, parts.netloc) if parts.netloc else ""
+
+
+def _record(host, error=False):
+    with _lock:
+        stats = _host_stats.get(host)
+        if stats is None:
+            stats = _host_stats[host] = {"requests": 0, "errors": 0}
+        stats["requests"] += 1
+        if error:
+            stats["errors"] += 1
+
+
+class PooledSession(requests.Session):
+    """
+    长连接的requests.Session，未指定timeout时使用http_timeout，并按host记录请求数、错误数和耗时
+    Session被所有调用方和用户共用，不保存响应返回的cookie，需要cookie的请求通过cookies参数传入
+    """
+
+    def __init__(self, host, pool_size, retries, timeout):
+        super().__init__()
+        self.host = host
+        self.default_timeout = timeout
+        self.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        # 只对幂等请求和连接失败重试，避免重复提交对话请求
+        retry = Retry(total=retries, connect=retries, read=0, backoff_factor=0.3,
+                      status_forcelist=[502, 503, 504], allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+                      raise_on_status=False)
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("http://", self.adapter)
+        self.mount("https://", self.adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        host = self.host  # 共用Session的请求统计在""下，避免任意图片地址让统计无限增长
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except Exception:
+            _record(host, error=True)
+            raise
+        metrics.observe("http", time.perf_counter() - start, host)
+        _record(host, error=response.status_code >= 500)
+        return response
+
+    def connection_count(self):
+        """已建立的连接总数，增长说明连接没有被复用"""
+        try:
+            return sum(pool.num_connections for pool in self.adapter.poolmanager.pools._container.values())
+        except Exception:
+            return None
+
+
+def get_session(url=None) -> PooledSession:
+    """
+    按url的host返回共享的长连接Session，同一host的请求复用TCP/TLS连接
+    """
+    host = _host_of(url)
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+    with _lock:
+        if len(_sessions) >= MAX_HOSTS:
+            host = ""  # 下载图片等任意地址时host不可控，超过上限后共用一个Session，其内部仍按host分连接池
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = PooledSession(
+                host,
+                pool_size=conf().get("http_pool_size", 20),
+                retries=conf().get("http_retries", 2),
+                timeout=(conf().get("http_connect_timeout", 10), conf().get("http_timeout", 300)),
+            )
+            logger.debug("[HTTP] create pooled session for {}".format(host or "<default>"))
+        return session
+
+
+def request(method, url, **kwargs):
+    """与requests.request相同，使用url对应host的共享Session"""
+    return get_session(url).request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def get_aiohttp_session(url=None):
+    """
+    返回当前事件循环中url对应host的共享aiohttp.ClientSession，必须在协程中调用
+    aiohttp的Session绑定事件循环，因此按(事件循环, host)缓存；与requests的共享Session一样不保存cookie
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    key = (id(loop), _host_of(url))
+    session = _aio_sessions.get(key)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=conf().get("http_pool_size", 20), ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(connect=conf().get("http_connect_timeout", 10), sock_read=conf().get("http_timeout", 300))
+        session = aiohttp.ClientSession(connector=connector, timeout=timeout, cookie_jar=aiohttp.DummyCookieJar())
+        _aio_sessions[key] = session
+    return session
+
+
+async def close_aiohttp_sessions():
+    """关闭当前事件循环中的共享aiohttp Session"""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _aio_sessions if k[0] == loop_id]:
+        session = _aio_sessions.pop(key)
+        if not session.closed:
+            await session.close()
+
+
+def close_sessions():
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def http_stats() -> dict:
+    with _lock:
+        stats = {host: dict(values) for host, values in _host_stats.items()}
+        sessions = dict(_sessions)
+    for host, session in sessions.items():
+        stats.setdefault(host, {"requests": 0, "errors": 0})["connections"] = session.connection_count()
+    for (_, host), session in list(_aio_sessions.items()):
+        try:
+            stats.setdefault(host, {"requests": 0, "errors": 0})["aiohttp_connections"] = len(session.connector._conns)
+        except Exception:
+            pass
+    return stats
+
+
+def _http_gauge():
+    return {host or "<default>": "{}/{}/{}".format(s.get("requests", 0), s.get("errors", 0), s.get("connections"))
+            for host, s in http_stats().items()}
+
+
+# 性能指标中显示每个host的 请求数/错误数/连接数
+metrics.register_gauge("http", _http_gauge)
@@ -0,0 +1,172 @@
+import json
+import sqlite3
+import threading
+import time
+
+from bridge.context import Context, ContextType
+from channel.chat_message import ChatMessage
+from common.log import logger
+
+_SIMPLE_TYPES = (str, int, float, bool, type(None))
+
+
+def _is_simple(value):
+    if isinstance(value, _SIMPLE_TYPES):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_simple(v) for v in value)
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and _is_simple(v) for k, v in value.items())
+    return False
+
+
+# 重放时需要的ChatMessage字段，_rawmsg、_prepare_fn等运行时对象不保存
+# 图片、语音等媒体消息的content(及image_path)是本地文件路径，只保存路径不保存文件内容，
+# 首次处理前文件还未下载完成或已被临时文件清理删除时，重放的消息没有对应的文件
+MSG_FIELDS = (
+    "msg_id", "create_time", "ctype", "content", "msg_type",
+    "from_user_id", "from_user_nickname", "to_user_id", "to_user_nickname",
+    "other_user_id", "other_user_nickname", "my_msg", "self_display_name",
+    "is_group", "is_at", "actual_user_id", "actual_user_nickname", "at_list", "sender_wxid",
+    "image_path", "referenced_image_path",
+)
+
+
+def _dump_value(value):
+    if isinstance(value, ContextType):
+        return {"__ctype__": value.name}
+    return value
+
+
+def dump_context(context: Context) -> str:
+    """
+    将context序列化为json，只保留可以重建的简单字段
+    msg只保存MSG_FIELDS中的字段，channel等运行时对象在重放时由通道重新填充
+    """
+    kwargs = {}
+    for key, value in context.kwargs.items():
+        if key in ["msg", "channel", "original_channel", "journal_ids"]:
+            continue
+        if isinstance(value, ContextType) or _is_simple(value):
+            kwargs[key] = _dump_value(value)
+    msg = None
+    cmsg = context.kwargs.get("msg")
+    if isinstance(cmsg, ChatMessage):
+        msg = {}
+        for key in MSG_FIELDS:
+            value = getattr(cmsg, key, None)
+            if isinstance(value, ContextType) or _is_simple(value):
+                msg[key] = _dump_value(value)
+    return json.dumps({"type": context.type.name, "content": context.content, "kwargs": kwargs, "msg": msg}, ensure_ascii=False)
+
+
+def _load_value(value):
+    if isinstance(value, dict) and "__ctype__" in value:
+        return ContextType[value["__ctype__"]]
+    return value
+
+
+def load_context(data: str) -> Context:
+    record = json.loads(data)
+    kwargs = {key: _load_value(value) for key, value in record["kwargs"].items()}
+    if record.get("msg") is not None:
+        cmsg = ChatMessage(None)
+        for key, value in record["msg"].items():
+            setattr(cmsg, key, _load_value(value))
+        cmsg._prepared = True  # 媒体文件已在首次处理前准备好，重放时不再下载
+        kwargs["msg"] = cmsg
+    return Context(ContextType[record["type"]], record["content"], kwargs=kwargs)
+
+
+class MessageJournal(object):
+    """
+    消息预写日志，使用SQLite(WAL模式)记录已接收但尚未处理完成的context
+    消息进入队列前写入，处理完成(或被丢弃、取消)后确认删除，重启时重放未确认的消息
+    写入和确认先记在内存中，由后台线程每隔flush_interval秒在一个事务中批量提交，不阻塞接收消息；
+    提交前已确认的消息不会写入数据库，进程异常退出时最多丢失最近flush_interval秒内的记录
+    """
+
+    def __init__(self, path, flush_interval=0.5):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, created REAL, data TEXT)"
+        )
+        self.last_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM journal").fetchone()[0]
+        self.buffered = {}  # 待写入的记录 id -> (id, session_id, created, data)
+        self.acked = []  # 已写入数据库、待删除的id
+        self.stopped = threading.Event()
+        if flush_interval:
+            threading.Thread(target=self._flush_loop, args=(flush_interval,), daemon=True).start()
+
+    def append(self, context: Context):
+        """记录一条context，返回日志id，序列化失败时返回None"""
+        try:
+            data = dump_context(context)
+        except Exception as e:
+            logger.warning("[MessageJournal] skip unserializable context: {}".format(e))
+            return None
+        with self.lock:
+            self.last_id += 1
+            self.buffered[self.last_id] = (self.last_id, str(context.get("session_id", "")), time.time(), data)
+            return self.last_id
+
+    def ack(self, ids):
+        with self.lock:
+            for journal_id in ids:
+                if journal_id is None:
+                    continue
+                if self.buffered.pop(journal_id, None) is None:
+                    self.acked.append(journal_id)
+
+    def flush(self):
+        """在一个事务中提交缓冲的写入和确认"""
+        with self.lock:
+            if not self.buffered and not self.acked:
+                return
+            rows, self.buffered = list(self.buffered.values()), {}
+            acked, self.acked = self.acked, []
+            try:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT INTO journal (id, session_id, created, data) VALUES (?, ?, ?, ?)", rows)
+                self.conn.executemany("DELETE FROM journal WHERE id = ?", [(i,) for i in acked])
+                self.conn.execute("COMMIT")
+            except Exception as e:
+                self.conn.execute("ROLLBACK")
+                logger.error("[MessageJournal] flush failed: {}".format(e))
+
+    def _flush_loop(self, interval):
+        while not self.stopped.wait(interval):
+            self.flush()
+
+    def pending(self, max_age):
+        """
+        返回未确认且不超过max_age秒的记录[(id, context)]，按写入顺序排列，过期和无法解析的记录直接删除
+        """
+        self.flush()
+        with self.lock:
+            self.conn.execute("DELETE FROM journal WHERE created < ?", (time.time() - max_age,))
+            rows = self.conn.execute("SELECT id, data FROM journal ORDER BY id").fetchall()
+        entries, broken = [], []
+        for journal_id, data in rows:
+            try:
+                entries.append((journal_id, load_context(data)))
+            except Exception as e:
+                logger.warning("[MessageJournal] drop broken entry {}: {}".format(journal_id, e))
+                broken.append(journal_id)
+        self.ack(broken)
+        return entries
+
+    def __len__(self):
+        self.flush()
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+    def close(self):
+        self.stopped.set()
+        self.flush()
+        with self.lock:
+            self.conn.close()
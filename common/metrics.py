@@ -0,0 +1,180 @@
+import bisect
+import functools
+import inspect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common.log import logger
+
+# 直方图桶的上界(毫秒)，按对数间隔划分，最后一个桶容纳所有更慢的请求
+BUCKET_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000, float("inf")]
+
+
+class LatencyHistogram(object):
+    """固定分桶的延迟直方图，记录一次只需一次二分查找，分位数按桶上界估算"""
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKET_BOUNDS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKET_BOUNDS_MS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max, 2),
+        }
+
+
+class Metrics(object):
+    """
+    消息流水线各阶段的延迟统计
+    stage为阶段名(compose, plugin.ON_HANDLE_CONTEXT, bot, decorate, send, queue_wait等)，label用于区分插件名、bot类型等
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (stage, label) -> LatencyHistogram
+        self.gauges = {}  # name -> 返回dict的函数，如通道队列深度、处理中的消息数
+        self.started = time.time()
+
+    def observe(self, stage, seconds, label=None):
+        key = (stage, label)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.observe(seconds * 1000)
+
+    def timer(self, stage, label=None):
+        return _Timer(self, stage, label)
+
+    def timed(self, stage):
+        """装饰器，记录函数(包括协程函数)的执行时间"""
+
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(stage):
+                        return await func(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def register_gauge(self, name, func):
+        self.gauges[name] = func
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            stages = {}
+            for (stage, label), histogram in sorted(self.histograms.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+                name = stage if label is None else "{}[{}]".format(stage, label)
+                stages[name] = histogram.snapshot()
+        gauges = {}
+        for name, func in list(self.gauges.items()):
+            try:
+                gauges[name] = func()
+            except Exception as e:
+                gauges[name] = {"error": str(e)}
+        return {"uptime_seconds": int(time.time() - self.started), "stages": stages, "gauges": gauges}
+
+    def format_text(self) -> str:
+        snapshot = self.snapshot()
+        lines = ["运行时间: {}秒".format(snapshot["uptime_seconds"])]
+        for name, values in snapshot["gauges"].items():
+            lines.append("{}: {}".format(name, ", ".join("{}={}".format(k, v) for k, v in values.items())))
+        if not snapshot["stages"]:
+            lines.append("暂无延迟数据")
+        for name, s in snapshot["stages"].items():
+            lines.append("{} n={} avg={}ms p50={}ms p95={}ms p99={}ms max={}ms".format(
+                name, s["count"], s["avg_ms"], s["p50_ms"], s["p95_ms"], s["p99_ms"], s["max_ms"]))
+        return "\n".join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.started = time.time()
+
+
+class _Timer(object):
+    __slots__ = ("metrics", "stage", "label", "start")
+
+    def __init__(self, metrics, stage, label):
+        self.metrics = metrics
+        self.stage = stage
+        self.label = label
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, self.label)
+        return False
+
+
+metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path != "/metrics":
+            self.send_error(404)
+            return
+        if "format=text" in self.path:
+            body = metrics.format_text().encode("utf-8")
+            content_type = "text/plain; charset=utf-8"
+        else:
+            body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("[Metrics] " + format % args)
+
+
+def start_metrics_server(host, port):
+    """在后台线程中启动指标接口，GET /metrics 返回json，加上?format=text返回文本"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info("[Metrics] metrics endpoint listening on http://{}:{}/metrics".format(host, port))
+    return server
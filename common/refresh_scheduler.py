@@ -0,0 +1,118 @@
+import asyncio
+import itertools
+import threading
+
+from common.log import logger
+
+PRIORITY_HIGH = 0
+PRIORITY_LOW = 10
+
+
+class RefreshScheduler(object):
+    """
+    在事件循环上运行的后台刷新调度器，替代每次刷新都新建线程和事件循环
+    同一个key排队或执行中时不会重复提交(singleflight)；按优先级出队，同时执行的任务数受concurrency限制，
+    任务开始的间隔不小于1/rate秒，避免短时间内大量调用协议接口
+    """
+
+    def __init__(self, concurrency=2, rate=1.0, name="RefreshScheduler"):
+        self.concurrency = max(1, concurrency)
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self.name = name
+        self.lock = threading.Lock()
+        self.inflight = set()  # 排队或执行中的key
+        self.backlog = []  # 启动前提交的任务
+        self.loop = None
+        self.queue = None
+        self.workers = []
+        self.seq = itertools.count()  # 同优先级按提交顺序执行
+        self.next_start = 0.0
+        self.completed = 0
+        self.failed = 0
+        self.deduped = 0
+
+    async def start(self):
+        """在事件循环中启动工作协程，启动前提交的任务随后执行"""
+        if self.loop is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.PriorityQueue()
+        self.workers = [self.loop.create_task(self._worker()) for _ in range(self.concurrency)]
+        with self.lock:
+            backlog, self.backlog = self.backlog, []
+        for item in backlog:
+            self.queue.put_nowait(item)
+
+    def submit(self, key, func, priority=PRIORITY_HIGH) -> bool:
+        """
+        提交刷新任务，可以在任意线程调用；func为无参数的协程函数
+        同一个key已在排队或执行中时忽略，返回False
+        """
+        with self.lock:
+            if key in self.inflight:
+                self.deduped += 1
+                return False
+            self.inflight.add(key)
+            item = (priority, next(self.seq), key, func)
+            if self.loop is None:
+                self.backlog.append(item)
+                return True
+            loop, queue = self.loop, self.queue
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            queue.put_nowait(item)
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        return True
+
+    async def _throttle(self):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        start_at = max(now, self.next_start)
+        self.next_start = start_at + self.interval
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    async def _worker(self):
+        while True:
+            priority, _, key, func = await self.queue.get()
+            try:
+                await self._throttle()
+                await func()
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error("[{}] refresh {} failed: {}".format(self.name, key, e))
+            finally:
+                with self.lock:
+                    self.inflight.discard(key)
+                self.queue.task_done()
+
+    async def join(self):
+        """等待已提交的任务全部完成"""
+        await self.queue.join()
+
+    async def stop(self):
+        """停止工作协程，排队中未执行的任务被丢弃，之后可以重新提交"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        with self.lock:
+            dropped = len(self.backlog) + (self.queue.qsize() if self.queue is not None else 0)
+            self.loop = None
+            self.queue = None
+            self.backlog = []
+            self.inflight.clear()
+        if dropped:
+            logger.info("[{}] stopped, dropped {} queued refreshes".format(self.name, dropped))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"inflight": len(self.inflight), "completed": self.completed, "failed": self.failed, "deduped": self.deduped}
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from common import const
+from common.expired_dict import ExpiredDict
+from common.log import logger
+from config import conf
+
+_PUNCTUATION = re.compile(r"[\s\?？!！。\.~～,，、;；:：\"'“”‘’]+")
+
+
+def normalize_query(query: str) -> str:
+    """统一大小写，去掉空白和标点，使"怎么部署？"和"怎么部署"命中同一条缓存"""
+    return _PUNCTUATION.sub("", query or "").lower()
+
+
+class ReplyCache(object):
+    """
+    问答回复缓存，按(规范化后的问题, bot类型, 模型, 人设, 应用标识)缓存文本回复
+    只用于无会话上下文的场景：dify工作流，或reply_cache_groups中的群
+    """
+
+    def __init__(self, ttl, maxsize, path=None):
+        self.ttl = ttl
+        self.path = path
+        self.entries = ExpiredDict(ttl, maxsize=maxsize, refresh_on_read=False)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    def make_key(self, query, context: Context, bot_type):
+        app_code = context.get("app_code") or conf().get("linkai_app_code") or ""
+        if bot_type == const.DIFY:
+            # dify以api key区分应用，只参与哈希不会写入缓存
+            app_code = app_code or "{}|{}".format(conf().get("dify_api_base"), conf().get("dify_api_key"))
+        parts = [normalize_query(query), bot_type, conf().get("model") or "", conf().get("character_desc") or "", app_code]
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def cacheable(self, query, context: Context, bot_type) -> bool:
+        if context.type != ContextType.TEXT or not query or query.startswith("#"):
+            return False
+        if bot_type == const.DIFY and conf().get("dify_app_type") == const.DIFY_WORKFLOW:
+            return True  # 工作流不依赖会话，任何场景的相同问题都可以复用
+        if context.get("isgroup", False):
+            groups = conf().get("reply_cache_groups") or []
+            msg = context.get("msg")
+            group_name = getattr(msg, "other_user_nickname", None)
+            return "ALL_GROUP" in groups or group_name in groups
+        return False
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        with self.lock:
+            if entry is None or entry["created"] + self.ttl < time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["hits"] += 1
+        # 回复在装饰时会被修改，每次返回新的对象
+        return Reply(ReplyType.TEXT, entry["content"])
+
+    def put(self, key, query, reply: Reply):
+        if not reply or reply.type != ReplyType.TEXT or not isinstance(reply.content, str) or not reply.content:
+            return
+        self.entries[key] = {"query": query, "content": reply.content, "created": time.time(), "hits": 0}
+
+    def clear(self):
+        self.entries.clear()
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def top(self, n=10):
+        """命中次数最多的n个问题 [(问题, 命中次数)]"""
+        items = sorted(self.entries.values(), key=lambda entry: entry["hits"], reverse=True)
+        return [(entry["query"], entry["hits"]) for entry in items[:n]]
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+    def format_text(self) -> str:
+        stats = self.stats()
+        lines = ["回复缓存: {}条, 命中{}次, 未命中{}次, 命中率{}".format(stats["size"], stats["hits"], stats["misses"], stats["hit_rate"])]
+        for query, hits in self.top():
+            lines.append("{}次 {}".format(hits, query[:30]))
+        return "\n".join(lines)
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(dict(self.entries.items()), f, ensure_ascii=False)
+        except Exception as e:
+            logger.error("[ReplyCache] save failed: {}".format(e))
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning("[ReplyCache] load failed: {}".format(e))
+            return
+        now = time.time()
+        for key, entry in sorted(data.items(), key=lambda item: item[1].get("created", 0)):
+            if entry.get("created", 0) + self.ttl >= now:
+                self.entries[key] = entry
+        logger.info("[ReplyCache] loaded {} entries from {}".format(len(self.entries), self.path))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_reply_cache():
+    """reply_cache开启时返回全局的回复缓存，否则返回None"""
+    global _cache
+    if not conf().get("reply_cache", False):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                path = conf().get("reply_cache_path") or None
+                if path and not os.path.isabs(path):
+                    from config import get_appdata_dir
+                    path = os.path.join(get_appdata_dir(), path)
+                _cache = ReplyCache(conf().get("reply_cache_ttl", 3600), conf().get("reply_cache_max_size", 1000), path)
+    return _cache
+
+
+def save_reply_cache():
+    if _cache is not None:
+        _cache.save()
@@ -0,0 +1,156 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from common.log import logger
+
+
+class RoomStore(object):
+    """
+    群信息缓存，按群ID和(群ID, 成员wxid)索引，所有读取都在内存中完成
+    群信息格式与原wx849_rooms.json相同: {chatroomId, nickName, chatRoomOwner, members, memberCount, last_update}
+    修改后的群先记为待写回，后台线程每隔flush_interval秒在一个SQLite事务中批量写入，启动时一次性加载
+    """
+
+    def __init__(self, path, flush_interval=5, legacy_json=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.rooms = {}  # group_id -> 群信息
+        self.members = {}  # (group_id, wxid) -> 成员信息
+        self.dirty = set()  # 待写回的group_id
+        self.writes = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS rooms (group_id TEXT PRIMARY KEY, updated REAL, data TEXT)")
+        self._load()
+        if not self.rooms and legacy_json:
+            self._import_json(legacy_json)
+        self.stopped = threading.Event()
+        if flush_interval:
+            threading.Thread(target=self._flush_loop, args=(flush_interval,), daemon=True).start()
+
+    def _index(self, group_id, room):
+        # 群信息修改时整体替换，读取不需要加锁；成员列表未变化时不重建索引
+        old = self.rooms.get(group_id)
+        self.rooms[group_id] = room
+        if old is not None and old.get("members") is room.get("members"):
+            return
+        for member in (old or {}).get("members") or []:
+            if isinstance(member, dict):
+                self.members.pop((group_id, member.get("UserName")), None)
+        for member in room.get("members") or []:
+            if isinstance(member, dict) and member.get("UserName"):
+                self.members[(group_id, member["UserName"])] = member
+
+    def _load(self):
+        for group_id, data in self.conn.execute("SELECT group_id, data FROM rooms"):
+            try:
+                self._index(group_id, json.loads(data))
+            except Exception as e:
+                logger.warning("[RoomStore] drop broken room {}: {}".format(group_id, e))
+        logger.debug("[RoomStore] loaded {} rooms from {}".format(len(self.rooms), self.path))
+
+    def _import_json(self, path):
+        """从旧版的wx849_rooms.json迁移一次"""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                rooms = json.load(f)
+        except Exception as e:
+            logger.warning("[RoomStore] failed to import {}: {}".format(path, e))
+            return
+        with self.lock:
+            for group_id, room in rooms.items():
+                if isinstance(room, dict):
+                    self._index(group_id, room)
+                    self.dirty.add(group_id)
+        self.flush()
+        logger.info("[RoomStore] imported {} rooms from {}".format(len(rooms), path))
+
+    def get(self, group_id):
+        """群信息，不存在时返回None，返回值不应被修改"""
+        return self.rooms.get(group_id)
+
+    def group_name(self, group_id):
+        room = self.rooms.get(group_id)
+        return room.get("nickName") if room else None
+
+    def member(self, group_id, wxid):
+        return self.members.get((group_id, wxid))
+
+    def member_name(self, group_id, wxid):
+        """成员的群昵称，没有群昵称时返回微信昵称，都没有时返回None"""
+        member = self.members.get((group_id, wxid))
+        if not member:
+            return None
+        return member.get("DisplayName") or member.get("NickName") or None
+
+    def is_fresh(self, group_id, ttl, need_members=False) -> bool:
+        """群信息在ttl秒内更新过，need_members为True时还要求已有成员列表"""
+        room = self.rooms.get(group_id)
+        if not room or time.time() - room.get("last_update", 0) >= ttl:
+            return False
+        return not need_members or bool(room.get("members"))
+
+    def update_room(self, group_id, **fields):
+        """更新群信息中值不为None的字段(nickName、chatRoomOwner、last_update等)，不存在时创建"""
+        with self.lock:
+            room = self.rooms.get(group_id) or {"chatroomId": group_id, "nickName": group_id, "chatRoomOwner": "",
+                                                "members": [], "last_update": int(time.time())}
+            room = dict(room)
+            room.update({key: value for key, value in fields.items() if value is not None})
+            self._index(group_id, room)
+            self.dirty.add(group_id)
+            return room
+
+    def set_members(self, group_id, members, member_count=None):
+        """替换群成员列表，群主从ChatroomMemberFlag为2049的成员中识别"""
+        fields = {"members": members, "memberCount": member_count if member_count is not None else len(members),
+                  "last_update": int(time.time())}
+        for member in members:
+            if member.get("ChatroomMemberFlag") == 2049:
+                fields["chatRoomOwner"] = member.get("UserName", "")
+                break
+        return self.update_room(group_id, **fields)
+
+    def flush(self):
+        """在一个事务中写入修改过的群"""
+        with self.lock:
+            if not self.dirty:
+                return 0
+            now = time.time()
+            rows = [(group_id, now, json.dumps(self.rooms[group_id], ensure_ascii=False))
+                    for group_id in self.dirty if group_id in self.rooms]
+            self.dirty.clear()
+            try:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT OR REPLACE INTO rooms (group_id, updated, data) VALUES (?, ?, ?)", rows)
+                self.conn.execute("COMMIT")
+            except Exception as e:
+                self.conn.execute("ROLLBACK")
+                self.dirty.update(row[0] for row in rows)
+                logger.error("[RoomStore] flush failed: {}".format(e))
+                return 0
+            self.writes += len(rows)
+            return len(rows)
+
+    def _flush_loop(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("[RoomStore] flush loop error: {}".format(e))
+
+    def close(self):
+        self.stopped.set()
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"rooms": len(self.rooms), "members": len(self.members), "dirty": len(self.dirty), "writes": self.writes}
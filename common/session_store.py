@@ -0,0 +1,371 @@
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+
+from common.log import logger
+from config import conf
+
+_MISSING = object()
+_stores = weakref.WeakSet()  # 所有持久化存储，退出时统一写回
+
+
+def estimate_size(session) -> int:
+    """
+    估算会话占用的内存字节数，只统计消息内容等主要部分，用于内存上限的近似控制
+    """
+    size = 512
+    messages = getattr(session, "messages", None)
+    if messages:
+        for message in messages:
+            size += 240
+            if isinstance(message, dict):
+                content = message.get("content")
+                size += sys.getsizeof(content) if isinstance(content, str) else len(str(content))
+    return size
+
+
+class MemorySessionStore(object):
+    """
+    内存会话存储，按最近使用顺序排列(LRU)，超过max_bytes时淘汰最久未使用的会话
+    设置expires_in_seconds时会话在最后一次访问后过期，由于访问会移到末尾，过期的会话总是集中在头部，清理时只需从头部检查
+    会话大小在写入(put)时估算并缓存，会话被修改后由调用方重新put更新大小
+    """
+
+    def __init__(self, max_bytes=0, expires_in_seconds=None, on_evict=None):
+        self.max_bytes = max_bytes or 0
+        self.expires_in_seconds = expires_in_seconds or 0
+        self.on_evict = on_evict  # 淘汰(非过期、非删除)时回调(key, value)，持久化存储借此写回
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()  # key -> [value, size, expire_at]
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def _expire_at(self):
+        return time.monotonic() + self.expires_in_seconds if self.expires_in_seconds else None
+
+    def _purge_expired(self):
+        if not self.expires_in_seconds:
+            return
+        now = time.monotonic()
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if entry[2] > now:
+                break
+            self.entries.popitem(last=False)
+            self.total_bytes -= entry[1]
+
+    def _shrink(self):
+        while self.max_bytes and self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry[1]
+            self.evictions += 1
+            if self.on_evict:
+                self.on_evict(key, entry[0])
+
+    def get(self, key, default=None):
+        with self.lock:
+            self._purge_expired()
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            self.entries.move_to_end(key)
+            entry[2] = self._expire_at()
+            return entry[0]
+
+    def peek(self, key, default=None):
+        """读取会话但不更新访问顺序和过期时间"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return default if entry is None else entry[0]
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def put(self, key, value):
+        """写入会话并重新估算大小，会话被修改后调用"""
+        self[key] = value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self._purge_expired()
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            size = estimate_size(value)
+            self.entries[key] = [value, size, self._expire_at()]
+            self.total_bytes += size
+            self._shrink()
+
+    def __delitem__(self, key):
+        with self.lock:
+            entry = self.entries.pop(key)
+            self.total_bytes -= entry[1]
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return default
+            self.total_bytes -= entry[1]
+            return entry[0]
+
+    def __contains__(self, key):
+        with self.lock:
+            self._purge_expired()
+            return key in self.entries
+
+    def __len__(self):
+        with self.lock:
+            self._purge_expired()
+            return len(self.entries)
+
+    def keys(self):
+        with self.lock:
+            self._purge_expired()
+            return list(self.entries.keys())
+
+    def items(self):
+        with self.lock:
+            self._purge_expired()
+            return [(key, entry[0]) for key, entry in self.entries.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"sessions": len(self.entries), "bytes": self.total_bytes, "evictions": self.evictions}
+
+
+class SqliteSessionStore(object):
+    """
+    SQLite(WAL模式)会话存储，会话pickle后zlib压缩保存，重启后保留上下文
+    内存中只保留最近使用的会话(受max_bytes限制)，其余会话在访问时再从数据库加载
+    只读取不会写回，会话被修改后由调用方put标记为待写回，后台线程每隔flush_interval秒在一个事务中批量写回
+    session_id列保存str(key)用于查询，原始key pickle后保存在key列，keys()返回原始key
+    """
+
+    def __init__(self, path, namespace, max_bytes=0, expires_in_seconds=None, flush_interval=5):
+        self.path = path
+        self.namespace = namespace
+        self.expires_in_seconds = expires_in_seconds or 0
+        self.lock = threading.RLock()
+        self.dirty = set()  # 内存中待写回的key
+        self.pending = {}  # 已从内存淘汰、尚未写入数据库的key -> 压缩后的数据
+        self.hot = MemorySessionStore(max_bytes, expires_in_seconds, on_evict=self._on_evict)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (namespace TEXT, session_id TEXT, updated REAL, data BLOB, key BLOB, "
+            "PRIMARY KEY (namespace, session_id))"
+        )
+        if "key" not in [row[1] for row in self.conn.execute("PRAGMA table_info(sessions)")]:
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN key BLOB")
+        self.loads = 0
+        self.writes = 0
+        self.stopped = threading.Event()
+        if flush_interval:
+            threading.Thread(target=self._flush_loop, args=(flush_interval,), daemon=True).start()
+        _stores.add(self)
+
+    @staticmethod
+    def _dump(value) -> bytes:
+        return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _load(data: bytes):
+        return pickle.loads(zlib.decompress(data))
+
+    def _row(self, key, now, data):
+        return self.namespace, str(key), now, data, pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _on_evict(self, key, value):
+        # 在hot.lock内调用，只做序列化，数据库写入留给下一次批量flush
+        if key in self.dirty:
+            self.dirty.discard(key)
+            try:
+                self.pending[key] = self._dump(value)
+            except Exception as e:
+                logger.warning("[SessionStore] failed to serialize session {}: {}".format(key, e))
+
+    def _load_from_db(self, key):
+        data = self.pending.get(key)
+        if data is None:
+            row = self.conn.execute(
+                "SELECT data, updated FROM sessions WHERE namespace = ? AND session_id = ?", (self.namespace, str(key))
+            ).fetchone()
+            if row is None:
+                return _MISSING
+            data, updated = row
+            if self.expires_in_seconds and updated < time.time() - self.expires_in_seconds:
+                return _MISSING
+        try:
+            value = self._load(data)
+        except Exception as e:
+            logger.warning("[SessionStore] drop broken session {}: {}".format(key, e))
+            return _MISSING
+        self.loads += 1
+        return value
+
+    def get(self, key, default=None):
+        with self.lock:
+            value = self.hot.get(key, _MISSING)
+            if value is _MISSING:
+                value = self._load_from_db(key)
+                if value is _MISSING:
+                    return default
+                if key in self.pending:
+                    # 淘汰后尚未写入数据库，重新放回内存时仍需写回
+                    self.pending.pop(key)
+                    self.dirty.add(key)
+                self.hot[key] = value
+            return value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def put(self, key, value):
+        """写入会话并标记为待写回，会话被修改后调用"""
+        self[key] = value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.pending.pop(key, None)
+            self.hot[key] = value
+            self.dirty.add(key)
+
+    def __delitem__(self, key):
+        with self.lock:
+            self.hot.pop(key)
+            self.dirty.discard(key)
+            self.pending.pop(key, None)
+            self.conn.execute("DELETE FROM sessions WHERE namespace = ? AND session_id = ?", (self.namespace, str(key)))
+
+    def __contains__(self, key):
+        with self.lock:
+            if key in self.hot or key in self.pending:
+                return True
+            row = self.conn.execute(
+                "SELECT updated FROM sessions WHERE namespace = ? AND session_id = ?", (self.namespace, str(key))
+            ).fetchone()
+        return row is not None and not (self.expires_in_seconds and row[0] < time.time() - self.expires_in_seconds)
+
+    def __len__(self):
+        self.flush()
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM sessions WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def keys(self):
+        self.flush()
+        with self.lock:
+            rows = self.conn.execute("SELECT session_id, key FROM sessions WHERE namespace = ?", (self.namespace,)).fetchall()
+        return [pickle.loads(key) if key is not None else session_id for session_id, key in rows]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys() if key in self]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def clear(self):
+        with self.lock:
+            self.hot.clear()
+            self.dirty.clear()
+            self.pending.clear()
+            self.conn.execute("DELETE FROM sessions WHERE namespace = ?", (self.namespace,))
+
+    def flush(self):
+        """将内存中修改过的会话和已淘汰的会话在一个事务中写入数据库"""
+        with self.lock:
+            rows = []
+            now = time.time()
+            for key in list(self.dirty):
+                value = self.hot.peek(key, _MISSING)
+                if value is _MISSING:
+                    continue
+                try:
+                    rows.append(self._row(key, now, self._dump(value)))
+                except Exception as e:
+                    logger.warning("[SessionStore] failed to serialize session {}: {}".format(key, e))
+            rows.extend(self._row(key, now, data) for key, data in self.pending.items())
+            self.dirty.clear()
+            self.pending.clear()
+            if not rows and not self.expires_in_seconds:
+                return 0
+            try:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT OR REPLACE INTO sessions (namespace, session_id, updated, data, key) VALUES (?, ?, ?, ?, ?)", rows)
+                if self.expires_in_seconds:
+                    self.conn.execute("DELETE FROM sessions WHERE namespace = ? AND updated < ?", (self.namespace, now - self.expires_in_seconds))
+                self.conn.execute("COMMIT")
+            except Exception as e:
+                self.conn.execute("ROLLBACK")
+                logger.error("[SessionStore] flush failed: {}".format(e))
+                return 0
+            self.writes += len(rows)
+            return len(rows)
+
+    def _flush_loop(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("[SessionStore] flush loop error: {}".format(e))
+
+    def close(self):
+        self.stopped.set()
+        self.flush()
+        with self.lock:
+            self.conn.close()
+        _stores.discard(self)
+
+    def stats(self) -> dict:
+        stats = self.hot.stats()
+        stats.update({"dirty": len(self.dirty), "pending": len(self.pending), "loads": self.loads, "writes": self.writes})
+        return stats
+
+
+def build_session_store(namespace):
+    """
+    根据配置创建会话存储，session_store可选 memory(默认) 和 sqlite
+    namespace用于区分不同bot的会话，同一个数据库文件可以被多个bot共用
+    """
+    max_bytes = int((conf().get("session_store_max_mb") or 0) * 1024 * 1024)
+    expires_in_seconds = conf().get("expires_in_seconds")
+    if conf().get("session_store", "memory") == "sqlite":
+        path = conf().get("session_store_path")
+        if not path:
+            from config import get_appdata_dir
+            path = os.path.join(get_appdata_dir(), "sessions.db")
+        try:
+            return SqliteSessionStore(path, namespace, max_bytes, expires_in_seconds, conf().get("session_store_flush_interval", 5))
+        except Exception as e:
+            logger.error("[SessionStore] failed to open {}, fallback to memory store: {}".format(path, e))
+    return MemorySessionStore(max_bytes, expires_in_seconds)
+
+
+def flush_session_stores():
+    """退出前写回所有持久化会话存储"""
+    for store in list(_stores):
+        try:
+            store.flush()
+        except Exception as e:
+            logger.error("[SessionStore] flush on exit failed: {}".format(e))
@@ -1,7 +1,13 @@
-import heapq
+import bisect
 
 
 class SortedDict(dict):
+    """
+    按sort_func(key, value)排序的字典
+    内部维护按(优先级, key)排好序的列表，新增、删除、更新优先级时用二分查找定位，不需要重新排序；
+    有序视图keys()/items()会被缓存，只有在影响顺序的修改之后才重新生成
+    """
+
     def __init__(self, sort_func=lambda k, v: k, init_dict=None, reverse=False):
         if init_dict is None:
             init_dict = []
@@ -10,53 +16,44 @@ class SortedDict(dict):
         self.sort_func = sort_func
         self.sorted_keys = None
         self.reverse = reverse
-        self.heap = []
+        self.order = []  # [(priority, key)]，升序
+        self.priorities = {}  # key -> priority
         for k, v in init_dict:
             self[k] = v
 
+    def _remove(self, key):
+        entry = (self.priorities.pop(key), key)
+        del self.order[bisect.bisect_left(self.order, entry)]
+
+    def _set_priority(self, key, priority):
+        if key in self.priorities:
+            if self.priorities[key] == priority:
+                return
+            self._remove(key)
+        self.priorities[key] = priority
+        bisect.insort(self.order, (priority, key))
+        self.sorted_keys = None
+
     def __setitem__(self, key, value):
-        if key in self:
-            super().__setitem__(key, value)
-            for i, (priority, k) in enumerate(self.heap):
-                if k == key:
-                    self.heap[i] = (self.sort_func(key, value), key)
-                    heapq.heapify(self.heap)
-                    break
-            self.sorted_keys = None
-        else:
-            super().__setitem__(key, value)
-            heapq.heappush(self.heap, (self.sort_func(key, value), key))
-            self.sorted_keys = None
+        super().__setitem__(key, value)
+        self._set_priority(key, self.sort_func(key, value))
 
     def __delitem__(self, key):
         super().__delitem__(key)
-        for i, (priority, k) in enumerate(self.heap):
-            if k == key:
-                del self.heap[i]
-                heapq.heapify(self.heap)
-                break
+        self._remove(key)
         self.sorted_keys = None
 
     def keys(self):
         if self.sorted_keys is None:
-            self.sorted_keys = [k for _, k in sorted(self.heap, reverse=self.reverse)]
+            self.sorted_keys = [k for _, k in (reversed(self.order) if self.reverse else self.order)]
         return self.sorted_keys
 
     def items(self):
-        if self.sorted_keys is None:
-            self.sorted_keys = [k for _, k in sorted(self.heap, reverse=self.reverse)]
-        sorted_items = [(k, self[k]) for k in self.sorted_keys]
-        return sorted_items
+        return [(k, self[k]) for k in self.keys()]
 
     def _update_heap(self, key):
-        for i, (priority, k) in enumerate(self.heap):
-            if k == key:
-                new_priority = self.sort_func(key, self[key])
-                if new_priority != priority:
-                    self.heap[i] = (new_priority, key)
-                    heapq.heapify(self.heap)
-                    self.sorted_keys = None
-                break
+        """value被原地修改后调用，重新计算key的优先级"""
+        self._set_priority(key, self.sort_func(key, self[key]))
 
     def __iter__(self):
         return iter(self.keys())
@@ -0,0 +1,172 @@
+import functools
+import re
+import threading
+from collections import deque
+
+from config import conf
+
+
+class AhoCorasick(object):
+    """
+    Aho–Corasick多模式匹配自动机，一次扫描判断文本中是否包含任意关键词
+    空字符串不加入自动机，由matches_empty单独记录(与str.find("")一样视为总能匹配)
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [p for p in patterns or [] if p]
+        self.matches_empty = any(p == "" for p in patterns or [])
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]  # 节点匹配到的关键词(包含经由fail链可达的最短输出)
+        for pattern in self.patterns:
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                node = nxt
+            if self.output[node] is None:
+                self.output[node] = pattern
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                fail = self.fail[node]
+                while fail and ch not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[nxt] = self.goto[fail].get(ch, 0)
+                if self.output[nxt] is None:
+                    self.output[nxt] = self.output[self.fail[nxt]]
+
+    def search(self, text):
+        """返回文本中最先出现的关键词，没有匹配时返回None"""
+        if not self.patterns or not text:
+            return None
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node] is not None:
+                return output[node]
+        return None
+
+    def contains(self, text, skip_empty=False):
+        if self.matches_empty and not skip_empty:
+            return True
+        return self.search(text) is not None
+
+
+class PrefixMatcher(object):
+    """
+    前缀字典树，匹配结果与按列表顺序逐个startswith相同：多个前缀都匹配时返回列表中靠前的那个
+    """
+
+    def __init__(self, prefixes):
+        self.prefixes = list(prefixes or [])
+        self.accepts_empty = "" in self.prefixes
+        self.trie = [{}]
+        self.terminal = [None]  # 节点对应前缀在列表中的最小下标
+        for index, prefix in enumerate(self.prefixes):
+            node = 0
+            for ch in prefix:
+                nxt = self.trie[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.trie)
+                    self.trie[node][ch] = nxt
+                    self.trie.append({})
+                    self.terminal.append(None)
+                node = nxt
+            if self.terminal[node] is None:
+                self.terminal[node] = index
+        self.first_chars = frozenset(self.trie[0])
+
+    def match(self, content, skip_empty=False):
+        """返回匹配到的前缀，没有匹配时返回None，skip_empty为True时忽略空前缀"""
+        if not self.prefixes:
+            return None
+        best = None if skip_empty else self.terminal[0]
+        if content and content[0] in self.first_chars:
+            trie, terminal = self.trie, self.terminal
+            node = 0
+            for ch in content:
+                node = trie[node].get(ch)
+                if node is None:
+                    break
+                index = terminal[node]
+                if index is not None and (best is None or index < best):
+                    best = index
+        return None if best is None else self.prefixes[best]
+
+
+@functools.lru_cache(maxsize=1024)
+def mention_pattern(name):
+    """@昵称后跟空格或\u2005的正则，按昵称缓存编译结果"""
+    return re.compile(f"@{re.escape(name)}(\u2005|\u0020)")
+
+
+def strip_mention(content, name):
+    if not name:
+        return content
+    return mention_pattern(name).sub("", content)
+
+
+class TriggerMatcher(object):
+    """
+    按某个配置版本预编译的触发规则，群名白名单使用集合，前缀和关键词使用字典树/自动机
+    配置变更后version不同，由get_trigger_matcher重新构建
+    """
+
+    def __init__(self, config):
+        self.version = getattr(config, "version", None)
+        group_name_white_list = config.get("group_name_white_list", []) or []
+        self.group_white_list_missing = config.get("group_name_white_list") is None
+        self.group_white_all = "ALL_GROUP" in group_name_white_list
+        self.group_white_set = frozenset(group_name_white_list)
+        self.group_keyword_white = AhoCorasick(config.get("group_name_keyword_white_list", []))
+        group_chat_in_one_session = config.get("group_chat_in_one_session", []) or []
+        self.group_shared_all = "ALL_GROUP" in group_chat_in_one_session
+        self.group_shared_set = frozenset(group_chat_in_one_session)
+        self.group_chat_prefix = PrefixMatcher(config.get("group_chat_prefix"))
+        self.group_chat_keyword = AhoCorasick(config.get("group_chat_keyword"))
+        self.single_chat_prefix = PrefixMatcher(config.get("single_chat_prefix", [""]))
+        self.image_create_prefix = PrefixMatcher(config.get("image_create_prefix", [""]))
+        self.nick_name_black_set = frozenset(config.get("nick_name_black_list", []) or [])
+        self.group_at_off = config.get("group_at_off", False)
+        self.trigger_by_self = config.get("trigger_by_self", True)
+        self.always_reply_voice = config.get("always_reply_voice")
+        self.voice_reply_voice = config.get("voice_reply_voice")
+
+    def group_allowed(self, group_name, group_id=None):
+        """群名(或群ID)是否在白名单中，或群名包含白名单关键词"""
+        if self.group_white_all or group_name in self.group_white_set:
+            return True
+        if group_id is not None and group_id in self.group_white_set:
+            return True
+        return bool(group_name) and self.group_keyword_white.contains(group_name)
+
+    def group_shared(self, group_name):
+        return self.group_shared_all or group_name in self.group_shared_set
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def get_trigger_matcher() -> TriggerMatcher:
+    """返回当前配置版本对应的TriggerMatcher，配置变化后自动重建"""
+    global _matcher
+    config = conf()
+    matcher = _matcher
+    if matcher is not None and matcher.version == getattr(config, "version", None):
+        return matcher
+    with _matcher_lock:
+        if _matcher is None or _matcher.version != getattr(config, "version", None):
+            _matcher = TriggerMatcher(config)
+        return _matcher
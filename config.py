@@ -3,8 +3,11 @@
 import json
 import logging
 import os
+import itertools
 import pickle
 import copy
+import threading
+from types import MappingProxyType
 
 from common.log import logger
 
@@ -42,9 +45,22 @@ available_setting = {
     "wx849_api_port": 9011,         # wx849 channel API port
     "wx849_protocol_version": "849", # wx849 channel protocol version 
     "log_level": "INFO",                 # 日志级别, 可选 "DEBUG", "INFO", "WARNING", "ERROR"
+    "wx849_callback_enabled": False,  # 是否启动回调服务接收协议服务推送的消息，开启后轮询只作为兜底
     "wx849_callback_host": "127.0.0.1",  # WX849 channel 回调监听主机
-    "wx849_callback_port": 9919,       # WX849 channel 回调监听端口 (根据实际需要和代码确认是否添加)
-    "wx849_callback_key": "",  # WX849回调接口的验证密钥，默认为空字符串    
+    "wx849_callback_port": 9919,       # WX849 channel 回调监听端口
+    "wx849_callback_path": "/wx849/callback",  # WX849回调接口路径
+    "wx849_callback_key": "",  # WX849回调接口的验证密钥，通过X-Callback-Key请求头或key参数传递，开启回调时必须设置
+    "wx849_callback_max_size_mb": 20,  # 回调请求体的最大大小(MB)
+    "wx849_api_pool_size": 50,  # 与协议服务通信的连接池大小
+    "wx849_api_timeout": 60,  # 协议服务普通接口的超时时间(秒)
+    "wx849_api_media_timeout": 300,  # 协议服务上传下载媒体接口的超时时间(秒)
+    "wx849_room_cache_ttl": 86400,  # 群名称和群成员信息的缓存有效期(秒)，过期后重新从协议服务获取
+    "wx849_room_flush_interval": 5,  # 群信息修改后批量写入tmp/wx849_rooms.db的间隔(秒)
+    "wx849_refresh_concurrency": 2,  # 后台刷新群成员和个人资料时最多同时请求的数量
+    "wx849_group_refresh_interval": 300,  # 同一个群两次提交后台刷新的最小间隔(秒)，避免未缓存成员的消息反复触发刷新
+    "wx849_refresh_rate": 1.0,  # 后台刷新每秒最多发起的请求数，避免频繁调用协议接口导致账号风控
+    "wx849_dispatch_concurrency": 8,  # 同一批消息中最多同时处理多少个会话，同一会话内的消息仍按顺序处理
+    "wx849_poll_max_interval": 30,  # 开启回调时没有新消息的轮询间隔最多退避到多少秒
 
     # Bot触发配置
     "single_chat_prefix": ["bot", "@bot"],  # 私聊时文本需要包含该前缀才能触发机器人回复
@@ -74,6 +90,42 @@ available_setting = {
     "image_proxy": True,  # 是否需要图片代理，国内访问LinkAI时需要
     "image_create_prefix": ["画", "看", "找"],  # 开启图片回复的前缀
     "concurrency_in_session": 1,  # 同一会话最多有多少条消息在处理中，大于1可能乱序
+    "handler_pool_size": 8,  # 处理消息的线程池大小
+    "async_pipeline": False,  # 是否开启异步消息处理流水线，仅对有事件循环的通道(如wx849)生效，消息处理和发送直接在通道的事件循环上执行
+    "async_pipeline_max_in_flight": 64,  # 异步流水线同时处理中的消息数上限
+    "max_queued_contexts": 0,  # 所有会话排队等待处理的消息总数上限，0为不限制
+    "max_queued_contexts_in_session": 0,  # 单个会话排队等待处理的消息数上限，0为不限制
+    "queue_overflow_policy": "drop_oldest",  # 队列满时的处理策略，可选 drop_oldest(丢弃最早的消息), drop_newest(丢弃新消息), reply_busy(丢弃新消息并回复繁忙提示)
+    "queue_busy_reply": "当前消息较多，请稍后再试~",  # reply_busy策略下回复的提示语
+    "fair_queue_weights": {"admin": 8, "vip": 4, "private": 2, "group": 1},  # 消息调度权重，分别对应管理命令、VIP用户、私聊、群聊，权重越大获得的处理机会越多
+    "fair_queue_vip_users": [],  # 优先调度的用户id或昵称列表
+    "coalesce_window_ms": 0,  # 合并窗口(毫秒)，同一会话连续发送的文本消息在窗口内合并为一条再请求bot，0表示不合并
+    "coalesce_max_wait_ms": 3000,  # 合并窗口最长等待时间(毫秒)，避免持续发送时一直不回复
+    "message_journal": False,  # 是否开启消息日志，已接收未处理完成的消息写入SQLite，重启后重放
+    "message_journal_path": "",  # 消息日志文件路径，为空时使用appdata_dir下的message_journal.db
+    "message_journal_max_age": 300,  # 重启时只重放不超过该秒数的消息
+    "message_journal_flush_interval": 0.5,  # 消息日志批量写入SQLite的间隔秒数
+    "shutdown_drain_timeout": 10,  # 退出时等待已排队消息处理完成的最长秒数
+    "metrics_port": 0,  # 性能指标接口端口，大于0时启动 http://metrics_host:metrics_port/metrics
+    "metrics_host": "127.0.0.1",  # 性能指标接口监听地址
+    "config_hot_reload": False,  # 是否监听config.json的修改并自动重新加载配置
+    "config_watch_interval": 2,  # 检查配置文件修改的间隔(秒)
+    "http_pool_size": 20,  # 每个host保持的最大长连接数
+    "http_connect_timeout": 10,  # 建立连接的超时时间(秒)，请求未指定timeout时生效
+    "http_timeout": 300,  # 读取响应的超时时间(秒)，请求未指定timeout时生效
+    "http_retries": 2,  # 连接失败以及GET请求遇到502/503/504时的重试次数
+    "chat_backends": [],  # 多个chat bot后端的bot_type列表，按优先顺序排列，配置两个以上时启用路由和故障切换
+    "chat_backend_timeout": 120,  # 单个后端的超时时间(秒)，超时后切换到下一个后端
+    "chat_backend_failure_threshold": 3,  # 后端连续失败多少次后暂时摘除
+    "chat_backend_cooldown": 30,  # 后端被摘除后的冷却时间(秒)，之后重新尝试
+    "chat_backend_latency_slack": 2.0,  # p95耗时超过最快后端多少倍时降低优先级
+    "chat_backend_hedge": False,  # 请求超过当前后端p95耗时仍未返回时，同时请求下一个后端，采用先返回的结果
+    "chat_backend_hedge_min_ms": 3000,  # 发起对冲请求前至少等待的时间(毫秒)
+    "reply_cache": False,  # 是否缓存相同问题的回复，只对dify工作流和reply_cache_groups中的群生效
+    "reply_cache_groups": [],  # 使用回复缓存的群名称列表，ALL_GROUP表示所有群，这些群的回复不应依赖上下文
+    "reply_cache_ttl": 3600,  # 回复缓存的有效期(秒)
+    "reply_cache_max_size": 1000,  # 回复缓存的最大条数，超过后淘汰最早的
+    "reply_cache_path": "",  # 回复缓存持久化文件，相对路径位于appdata_dir下，为空时不持久化
     "image_create_size": "256x256",  # 图片大小,可选有 256x256, 512x512, 1024x1024 (dall-e-3默认为1024x1024)
     "group_chat_exit_group": False,
     "group_exit_msg": "",  # 退出群聊的消息
@@ -81,6 +133,10 @@ available_setting = {
     # chatgpt会话参数
     "expires_in_seconds": 3600,  # 无操作会话的过期时间
     "image_expires_in_seconds": 7200,  # 图片消息缓存过期时间（秒）
+    "session_store": "memory",  # 会话存储方式，可选 memory(内存LRU) 和 sqlite(SQLite持久化，重启后保留上下文)
+    "session_store_max_mb": 0,  # 内存中会话占用的上限(MB)，超过后淘汰最久未使用的会话，sqlite模式下被淘汰的会话写回数据库，0为不限制(默认)
+    "session_store_path": "",  # sqlite会话存储的文件路径，为空时使用appdata_dir下的sessions.db
+    "session_store_flush_interval": 5,  # sqlite模式下批量写回修改过的会话的间隔(秒)
     # 人格描述
     "character_desc": "你是ChatGPT, 一个由OpenAI训练的大型语言模型, 你旨在回答并解决人们的任何问题，并且可以使用多种语言与人交流。",
     "conversation_max_tokens": 1000,  # 支持上下文记忆的最多字符数
@@ -126,6 +182,11 @@ available_setting = {
     "dify_app_type": "chatflow", # dify助手类型 chatbot(对应聊天助手或对话流)/agent(对应Agent)/workflow(对应工作流，则默认为chatbot
     "dify_conversation_max_messages": 5, # dify目前不支持设置历史消息长度，暂时使用超过最大消息数清空会话的策略，缺点是没有滑动窗口，会突然丢失历史消息，当设置的值小于等于0，则不限制历史消息长度
     "dify_error_reply": "", # dify bot错误时给用户的回复
+    "dify_streaming": False,  # chatbot/chatflow/agent应用是否使用流式响应，每生成完一段(空行或//n分隔)就先发送，不必等待整个回复完成
+    "dify_upload_cache_ttl": 3600,  # 已上传图片的upload_file_id缓存时间(秒)，同一张图片在此期间不重复上传，应不超过dify保留上传文件的时间
+    "dify_media_workers": 4,  # 并发下载回复中图片和文件的线程数
+    "dify_media_max_size_mb": 50,  # 单个图片或文件的最大下载大小(MB)，0为不限制
+    "dify_media_timeout": 60,  # 下载图片和文件时读取响应的超时时间(秒)
     # coze配置
     "coze_api_base": "https://api.coze.cn",
     "coze_api_key": "xxx",
@@ -232,9 +293,13 @@ available_setting = {
 }
 
 
+_config_versions = itertools.count(1)  # 配置版本号，所有Config实例共用，保证重载配置后版本号也不会重复
+
+
 class Config(dict):
     def __init__(self, d=None):
         super().__init__()
+        self.version = next(_config_versions)  # 每次修改配置后递增，用于判断预编译的匹配规则等缓存是否过期
         if d is None:
             d = {}
         for k, v in d.items():
@@ -250,15 +315,26 @@ class Config(dict):
     def __setitem__(self, key, value):
         if key not in available_setting:
             raise Exception("key {} not in available_setting".format(key))
-        return super().__setitem__(key, value)
+        super().__setitem__(key, value)
+        self.version = next(_config_versions)
+
+    def pop(self, key, *args):
+        value = super().pop(key, *args)
+        self.version = next(_config_versions)
+        return value
 
     def get(self, key, default=None):
-        try:
-            return self[key]
-        except KeyError as e:
-            return default
-        except Exception as e:
-            raise e
+        if key not in available_setting:
+            raise Exception("key {} not in available_setting".format(key))
+        return super().get(key, default)
+
+    def snapshot(self) -> "ConfigSnapshot":
+        """返回当前版本的只读快照，配置未变化时复用同一个快照"""
+        snapshot = self.__dict__.get("_snapshot")
+        if snapshot is None or snapshot.version != self.version:
+            snapshot = ConfigSnapshot(self, self.version)
+            self._snapshot = snapshot
+        return snapshot
             
     def set(self, key, value):
         try:
@@ -292,7 +368,44 @@ class Config(dict):
             logger.info("[Config] User datas error: {}".format(e))
 
 
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class ConfigSnapshot(object):
+    """
+    某个版本配置的只读快照，通过属性读取配置项，未配置的项返回available_setting中的默认值
+    列表转为tuple、字典转为只读映射，热点路径上读取配置不需要再做校验和异常处理
+    get与Config.get相同，未配置时返回调用方传入的default
+    """
+
+    __slots__ = ("_values", "version")
+
+    def __init__(self, values: dict, version):
+        object.__setattr__(self, "_values", {k: _freeze(v) for k, v in values.items()})
+        object.__setattr__(self, "version", version)
+
+    def __getattr__(self, name):
+        values = object.__getattribute__(self, "_values")
+        if name in values:
+            return values[name]
+        if name in available_setting:
+            return _freeze(available_setting[name])
+        raise AttributeError("key {} not in available_setting".format(name))
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def __setattr__(self, name, value):
+        raise TypeError("ConfigSnapshot is immutable")
+
+
 config = Config()
+_config_listeners = []  # 配置重新加载后的回调函数，参数为(旧配置, 新配置)
 
 
 def drag_sensitive(config):
@@ -319,18 +432,25 @@ def drag_sensitive(config):
     return config
 
 
-def load_config():
-    global config
+def _config_path():
     config_path = "./config.json"
     if not os.path.exists(config_path):
-        logger.info("配置文件不存在，将使用config-template.json模板")
         config_path = "./config-template.json"
+    return config_path
+
+
+def load_config():
+    global config
+    old_config = config
+    config_path = _config_path()
+    if config_path != "./config.json":
+        logger.info("配置文件不存在，将使用config-template.json模板")
 
     config_str = read_file(config_path)
     logger.debug("[INIT] config str: {}".format(drag_sensitive(config_str)))
 
-    # 将json字符串反序列化为dict类型
-    config = Config(json.loads(config_str))
+    # 将json字符串反序列化为dict类型，先在新对象上完成加载，最后整体替换，读取方不会看到加载了一半的配置
+    new_config = Config(json.loads(config_str))
 
     # override config with environment variables.
     # Some online deployment platforms (e.g. Railway) deploy project from github directly. So you shouldn't put your secrets like api key in a config file, instead use environment variables to override the default config.
@@ -339,22 +459,70 @@ def load_config():
         if name in available_setting:
             logger.info("[INIT] override config by environ args: {}={}".format(name, value))
             try:
-                config[name] = eval(value)
+                new_config[name] = eval(value)
             except:
                 if value == "false":
-                    config[name] = False
+                    new_config[name] = False
                 elif value == "true":
-                    config[name] = True
+                    new_config[name] = True
                 else:
-                    config[name] = value
+                    new_config[name] = value
 
-    if config.get("debug", False):
+    if new_config.get("debug", False):
         logger.setLevel(logging.DEBUG)
         logger.debug("[INIT] set log level to DEBUG")
 
-    logger.info("[INIT] load config: {}".format(drag_sensitive(config)))
+    logger.info("[INIT] load config: {}".format(drag_sensitive(new_config)))
+
+    if old_config.user_datas:
+        new_config.user_datas = old_config.user_datas  # 重新加载时保留内存中尚未保存的用户数据
+    else:
+        new_config.load_user_datas()
+    config = new_config
+    for listener in list(_config_listeners):
+        try:
+            listener(old_config, new_config)
+        except Exception as e:
+            logger.exception("[Config] config listener error: {}".format(e))
+
+
+def add_config_listener(listener):
+    """注册配置重新加载后的回调，用于重建依赖配置的路由、缓存等"""
+    if listener not in _config_listeners:
+        _config_listeners.append(listener)
+
+
+def start_config_watcher(interval=None):
+    """
+    后台线程定期检查配置文件的修改时间，变化后重新加载
+    加载失败(如编辑到一半的json)时保留旧配置，等待下次修改
+    :return: threading.Event，set后停止监听
+    """
+    interval = interval or config.get("config_watch_interval", 2)
+
+    def mtime():
+        try:
+            return os.path.getmtime(_config_path())
+        except OSError:
+            return None
+
+    stopped = threading.Event()
+
+    def watch():
+        last_mtime = mtime()
+        while not stopped.wait(interval):
+            current = mtime()
+            if current == last_mtime:
+                continue
+            last_mtime = current
+            try:
+                load_config()
+                logger.info("[Config] config file changed, reloaded, version={}".format(config.version))
+            except Exception as e:
+                logger.error("[Config] reload config failed, keep the old one: {}".format(e))
 
-    config.load_user_datas()
+    threading.Thread(target=watch, daemon=True).start()
+    return stopped
 
 def save_config():
     global config
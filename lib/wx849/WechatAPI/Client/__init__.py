@@ -113,14 +113,13 @@ class WechatAPIClient(LoginMixin, MessageMixin, FriendMixin, ChatroomMixin, User
             if not self.wxid:
                 raise UserLoggedOut("请先登录")
             
-        import aiohttp
         from loguru import logger
         
         try:
             logger.debug(f"[WX849 API] 开始获取新消息，使用wxid: {self.wxid}")
             logger.debug(f"[WX849 API] API路径前缀: {self.api_path_prefix}")
             
-            async with aiohttp.ClientSession() as session:
+            async with self.session() as session:
                 # 使用正确的参数调用 Sync 接口
                 # Scene=0 适用于消息同步，根据KeyBuf持续获取新消息
                 json_param = {"wxid": self.wxid, "Scene": 0, "Synckey": self._last_key_buf}
@@ -19,7 +19,7 @@ class LoginMixin(WechatAPIClientBase):
             bool: 如果WechatAPI正在运行返回True，否则返回False。
         """
         try:
-            async with aiohttp.ClientSession() as session:
+            async with self.session() as session:
                 response = await session.get(f'http://{self.ip}:{self.port}{self.api_path_prefix}/IsRunning')
                 return await response.text() == 'OK'
         except aiohttp.client_exceptions.ClientConnectorError:
@@ -40,7 +40,7 @@ class LoginMixin(WechatAPIClientBase):
         Raises:
             根据error_handler处理错误
         """
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {'DeviceName': device_name, 'DeviceID': device_id}
             if proxy:
                 json_param['ProxyInfo'] = {'ProxyIp': f'{proxy.ip}:{proxy.port}',
@@ -81,7 +81,7 @@ class LoginMixin(WechatAPIClientBase):
         Raises:
             根据error_handler处理错误
         """
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"uuid": uuid}
             response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Login/CheckQR', data=json_param)
             if response.content_type == 'application/json':
@@ -112,7 +112,7 @@ class LoginMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid}
             response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Login/Logout', json=json_param)
             json_resp = await response.json()
@@ -144,7 +144,7 @@ class LoginMixin(WechatAPIClientBase):
         if not wxid and self.wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": wxid}
             response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Login/Awaken', json=json_param)
             json_resp = await response.json()
@@ -178,7 +178,7 @@ class LoginMixin(WechatAPIClientBase):
         if not wxid and self.wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"wxid": wxid}
             response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Login/TwiceAutoAuth', data=json_param)
             json_resp = await response.json()
@@ -199,7 +199,7 @@ class LoginMixin(WechatAPIClientBase):
             dict: 返回缓存信息，如果未提供wxid且未登录返回空字典
         """
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"wxid": wxid}
             response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Login/GetCacheInfo', data=json_param)
             json_resp = await response.json()
@@ -222,7 +222,7 @@ class LoginMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid}
             response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Login/Heartbeat', json=json_param)
             json_resp = await response.json()
@@ -246,7 +246,7 @@ class LoginMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"wxid": self.wxid}
             response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Login/HeartBeat', data=json_param)
             json_resp = await response.json()
@@ -270,7 +270,7 @@ class LoginMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid}
             response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Login/AutoHeartbeatStop', json=json_param)
             json_resp = await response.json()
@@ -293,7 +293,7 @@ class LoginMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid}
             response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Login/AutoHeartbeatStatus', json=json_param)
             json_resp = await response.json()
@@ -323,7 +323,7 @@ class LoginMixin(WechatAPIClientBase):
         if not wxid and self.wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"wxid": wxid}
             if device_id:
                 json_param["deviceId"] = device_id
@@ -357,7 +357,7 @@ class LoginMixin(WechatAPIClientBase):
         if not wxid and self.wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"wxid": wxid}
             if device_id:
                 json_param["deviceId"] = device_id
@@ -83,7 +83,7 @@ class MessageMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "ClientMsgId": client_msg_id, "CreateTime": create_time,
                           "NewMsgId": new_msg_id}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/Revoke', json=json_param)
@@ -134,7 +134,7 @@ class MessageMixin(WechatAPIClientBase):
         else:
             raise ValueError("Argument 'at' should be str or list")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Content": content, "Type": 1, "At": at_str}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/SendTxt', json=json_param)
             json_resp = await response.json()
@@ -180,7 +180,7 @@ class MessageMixin(WechatAPIClientBase):
         else:
             raise ValueError("Argument 'image' can only be str, bytes, or os.PathLike")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Base64": image}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/UploadImg', json=json_param)
             json_resp = await response.json()
@@ -314,7 +314,7 @@ class MessageMixin(WechatAPIClientBase):
         predict_time = int(file_len / 1024 / 300) if file_len > 0 else 0
         logger.info(f"开始发送视频: 对方wxid:{wxid} 预计耗时:{predict_time}秒, 时长:{duration}s, 文件大小:{file_len / 1024:.2f}KB")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {
                 "Wxid": self.wxid,
                 "ToWxid": wxid,
@@ -414,7 +414,7 @@ class MessageMixin(WechatAPIClientBase):
 
         format_dict = {"amr": 0, "wav": 4, "mp3": 4}
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Base64": voice_base64, "VoiceTime": duration,
                           "Type": format_dict[format]}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/SendVoice', json=json_param)
@@ -470,7 +470,7 @@ class MessageMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Url": url, "Title": title, "Desc": description,
                           "ThumbUrl": thumb_url}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/ShareLink', json=json_param)
@@ -495,7 +495,7 @@ class MessageMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Infourl": Infourl, "Label": Label, "Scale": Scale,
                           "X": X,"Y": Y, "Poiname": Poiname}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/ShareLocation', json=json_param)
@@ -539,7 +539,7 @@ class MessageMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Md5": md5, "TotalLen": total_length}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/SendEmoji', json=json_param)
             json_resp = await response.json()
@@ -577,7 +577,7 @@ class MessageMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "CardWxid": card_wxid, "CardAlias": card_alias,
                           "CardNickname": card_nickname}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/SendCard', json=json_param)
@@ -618,7 +618,7 @@ class MessageMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Xml": xml, "Type": type}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/SendApp', json=json_param)
             json_resp = await response.json()
@@ -654,7 +654,7 @@ class MessageMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Content": xml}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/SendCDNFile', json=json_param)
             json_resp = await response.json()
@@ -689,7 +689,7 @@ class MessageMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Content": xml}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/SendCDNImg', json=json_param)
             json_resp = await response.json()
@@ -724,7 +724,7 @@ class MessageMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Content": xml}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/SendCDNVideo', json=json_param)
             json_resp = await response.json()
@@ -760,7 +760,7 @@ class MessageMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "ToWxid": wxid, "Md5": md5, "TotalLen": total_len}
             response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/SendEmoji', json=json_param)
             json_resp = await response.json()
@@ -784,9 +784,9 @@ class MessageMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "Scene": 0, "Synckey": ""}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/Sync', json=json_param)
+            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Msg/Sync', json=json_param, timeout=aiohttp.ClientTimeout(total=10))
             json_resp = await response.json()
 
             if json_resp.get("Success"):
@@ -1,7 +1,5 @@
 from typing import Union
 
-import aiohttp
-
 from .base import *
 from .protect import protector
 from ..errors import *
@@ -35,7 +33,7 @@ class FriendMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "Scene": scene, "V1": v1, "V2": v2}
             response = await session.post(f'http://{self.ip}:{self.port}/api/Friend/PassVerify', json=json_param)
             json_resp = await response.json()
@@ -60,7 +58,7 @@ class FriendMixin(WechatAPIClientBase):
         if isinstance(wxid, list):
             wxid = ",".join(wxid)
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "RequestWxids": wxid}
             response = await session.post(f'http://{self.ip}:{self.port}/api/Friend/GetContact', json=json_param)
             json_resp = await response.json()
@@ -93,7 +91,7 @@ class FriendMixin(WechatAPIClientBase):
             wxid = ",".join(wxid)
 
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "Towxids": wxid, "Chatroom": chatroom}
             response = await session.post(f'http://{self.ip}:{self.port}/api/Friend/GetContractDetail', json=json_param)
             json_resp = await response.json()
@@ -116,7 +114,7 @@ class FriendMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid, "CurrentWxcontactSeq": wx_seq, "CurrentChatroomContactSeq": chatroom_seq}
             response = await session.post(f'http://{self.ip}:{self.port}/api/Friend/GetContractList', json=json_param)
             json_resp = await response.json()
@@ -141,7 +139,7 @@ class FriendMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {
                 "Wxid": self.wxid,
                 "CurrentWxcontactSeq": wx_seq,
@@ -1,5 +1,3 @@
-import aiohttp
-
 from .base import *
 from .protect import protector
 from ..errors import *
@@ -26,7 +24,7 @@ class PyqMixin(WechatAPIClientBase):
         if not wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": wxid,"Fristpagemd5": "", "Maxid": max_id}
             # response = await session.post(f'http://{self.ip}:{self.port}/api/Login/GetCacheInfo', data=json_param)
             response = await session.post(f'http://{self.ip}:{self.port}/api/FriendCircle/GetList', json=json_param)
@@ -59,7 +57,7 @@ class PyqMixin(WechatAPIClientBase):
         if not wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": wxid, "Fristpagemd5": "", "Maxid": max_id, "Towxid": Towxid}
             # 使用正确的GetDetail接口获取特定用户的朋友圈
             response = await session.post(f'http://{self.ip}:{self.port}/api/FriendCircle/GetDetail', json=json_param)
@@ -92,7 +90,7 @@ class PyqMixin(WechatAPIClientBase):
         if not self.wxid and not wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": wxid, "Id": id,"Content":Content,"Type":type,"ReplyCommnetId":ReplyCommnetId}
             response = await session.post(f'http://{self.ip}:{self.port}/api/FriendCircle/Comment', json=json_param)
             json_resp = await response.json()
@@ -114,7 +112,7 @@ class PyqMixin(WechatAPIClientBase):
         if not self.wxid and not wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": wxid, "Synckey": ""}
             response = await session.post(f'http://{self.ip}:{self.port}/api/FriendCircle/MmSnsSync', json=json_param)
             json_resp = await response.json()
@@ -89,9 +89,7 @@ class WechatAPIClient(LoginMixin, MessageMixin, FriendMixin, ChatroomMixin, User
         if not self.wxid:
             raise UserLoggedOut("请先登录")
             
-        import aiohttp
-        
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             # 使用正确的参数调用 Sync 接口
             # Scene=0 适用于消息同步，根据KeyBuf持续获取新消息
             json_param = {"wxid": self.wxid, "Scene": 0, "Synckey": self._last_key_buf}
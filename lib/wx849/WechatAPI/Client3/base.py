@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 
 from WechatAPI.errors import *
+from WechatAPI.http_session import ApiSession
 
 
 @dataclass
@@ -44,6 +45,7 @@ class WechatAPIClientBase:
         alias (str): 别名
         phone (str): 手机号
         ignore_protect (bool): 是否忽略保护机制
+        api_session (ApiSession): 与协议服务通信的共享会话
         api_path_prefix (str): API路径前缀
     """
     def __init__(self, ip: str, port: int):
@@ -60,9 +62,20 @@ class WechatAPIClientBase:
         # 添加API路径前缀
         self.api_path_prefix = "/VXAPI"
 
+        # 所有接口共用一个长连接会话
+        self.api_session = ApiSession()
+
         # 调用所有 Mixin 的初始化方法
         super().__init__()
 
+    def session(self):
+        """返回共享的aiohttp会话，用法: async with self.session() as session
+
+        Returns:
+            共享会话的上下文管理器，退出时不会关闭会话
+        """
+        return self.api_session.session()
+
     @staticmethod
     def error_handler(json_resp):
         """处理API响应中的错误码
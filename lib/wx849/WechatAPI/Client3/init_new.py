@@ -81,8 +81,7 @@ class WechatAPIClient(LoginMixin, MessageMixin, FriendMixin, ChatroomMixin, User
         if not self.wxid:
             raise UserLoggedOut("请先登录")
             
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             json_param = {"Wxid": self.wxid}
             response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Msg/GetNewMsg', json=json_param)
             json_resp = await response.json()
@@ -1,4 +1,3 @@
-import aiohttp
 import base64
 from .base import WechatAPIClientBase
 from ..errors import UserLoggedOut
@@ -27,7 +26,7 @@ class ToolExtensionMixin(WechatAPIClientBase):
         if not to_wxid:
             to_wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with self.session() as session:
             # 根据提供的API文档构造请求参数
             json_param = {
                 "Wxid": self.wxid,
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# 上传下载媒体的接口耗时较长，使用单独的超时时间
+MEDIA_ENDPOINT_KEYWORDS = ("Upload", "Download", "Cdn", "SendVideo", "SendVoice", "SendImage", "SendFile", "SendEmoji")
+
+
+class ApiSession:
+    """协议服务的共享aiohttp会话
+
+    一个客户端共用一个ClientSession和连接池，与协议服务保持长连接，避免每次请求都重新建立会话和连接。
+    ClientSession绑定事件循环，因此按事件循环分别创建。按接口记录请求数、错误数和耗时，
+    未指定timeout的请求按接口使用默认或媒体接口的超时时间。
+
+    Args:
+        limit (int): 连接池大小
+        timeout (int): 普通接口的超时时间(秒)
+        media_timeout (int): 上传下载媒体接口的超时时间(秒)
+    """
+
+    def __init__(self, limit: int = 50, timeout: int = 60, media_timeout: int = 300):
+        self.limit = limit
+        self.timeout = timeout
+        self.media_timeout = media_timeout
+        self._sessions = {}  # id(loop) -> (loop, ClientSession)
+        self._stats = {}  # 接口路径 -> [请求数, 错误数, 总耗时, 最大耗时]
+        self._lock = threading.Lock()
+
+    def configure(self, limit: int = None, timeout: int = None, media_timeout: int = None):
+        """修改连接池大小和超时时间，连接池大小对之后新建的会话生效"""
+        if limit:
+            self.limit = limit
+        if timeout:
+            self.timeout = timeout
+        if media_timeout:
+            self.media_timeout = media_timeout
+
+    def timeout_for(self, url: str) -> aiohttp.ClientTimeout:
+        path = urlsplit(str(url)).path
+        seconds = self.media_timeout if any(k in path for k in MEDIA_ENDPOINT_KEYWORDS) else self.timeout
+        return aiohttp.ClientTimeout(total=seconds)
+
+    def _record(self, endpoint: str, seconds: float, error: bool):
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = [0, 0, 0.0, 0.0]
+            stats[0] += 1
+            if error:
+                stats[1] += 1
+            stats[2] += seconds
+            stats[3] = max(stats[3], seconds)
+
+    async def _on_request_start(self, session, ctx, params):
+        ctx.start = time.perf_counter()
+
+    async def _on_request_end(self, session, ctx, params):
+        self._record(params.url.path, time.perf_counter() - ctx.start, params.response.status >= 400)
+
+    async def _on_request_exception(self, session, ctx, params):
+        self._record(params.url.path, time.perf_counter() - ctx.start, True)
+
+    def get(self) -> aiohttp.ClientSession:
+        """返回当前事件循环的共享会话，必须在协程中调用"""
+        loop = asyncio.get_running_loop()
+        item = self._sessions.get(id(loop))
+        if item is not None and item[0] is loop and not item[1].closed:
+            return item[1]
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_request_end.append(self._on_request_end)
+        trace.on_request_exception.append(self._on_request_exception)
+        connector = aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=300, keepalive_timeout=60)
+        session = aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+        self._sessions[id(loop)] = (loop, session)
+        return session
+
+    def session(self) -> "_SessionContext":
+        """用法与aiohttp.ClientSession()相同: async with api_session.session() as session，退出时不关闭共享会话"""
+        return _SessionContext(self)
+
+    async def close(self):
+        """关闭当前事件循环中的共享会话"""
+        loop = asyncio.get_running_loop()
+        item = self._sessions.pop(id(loop), None)
+        if item is not None and not item[1].closed:
+            await item[1].close()
+
+    def stats(self) -> dict:
+        """每个接口的 {requests, errors, avg_ms, max_ms}"""
+        with self._lock:
+            return {endpoint: {"requests": s[0], "errors": s[1], "avg_ms": round(s[2] / s[0] * 1000) if s[0] else 0,
+                               "max_ms": round(s[3] * 1000)}
+                    for endpoint, s in self._stats.items()}
+
+
+class _SessionProxy:
+    """共享会话的代理，请求未指定timeout时按接口设置超时，其他属性直接转发给ClientSession"""
+
+    def __init__(self, api_session: ApiSession, session: aiohttp.ClientSession):
+        self._api_session = api_session
+        self._session = session
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self._api_session.timeout_for(url)
+        return self._session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class _SessionContext:
+    def __init__(self, api_session: ApiSession):
+        self._api_session = api_session
+
+    async def __aenter__(self) -> _SessionProxy:
+        return _SessionProxy(self._api_session, self._api_session.get())
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
@@ -13,6 +13,8 @@ from bridge.bridge import Bridge
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common import const
+from common.metrics import metrics
+from common.reply_cache import get_reply_cache
 from config import conf, load_config, global_config
 from plugins import *
 
@@ -135,6 +137,14 @@ ADMIN_COMMANDS = {
         "alias": ["debug", "调试模式", "DEBUG"],
         "desc": "开启机器调试日志",
     },
+    "metrics": {
+        "alias": ["metrics", "性能统计"],
+        "desc": "查看消息处理各阶段耗时和队列状态，加参数reset清空统计",
+    },
+    "replycache": {
+        "alias": ["replycache", "回复缓存"],
+        "desc": "查看回复缓存命中情况，加参数flush清空缓存",
+    },
 }
 
 def generate_temporary_password(length=12):
@@ -364,8 +374,7 @@ class Godcmd(Plugin):
                         ok, result = True, "会话已重置"
                     else:
                         ok, result = False, "当前对话机器人不支持重置会话"
-                logger.debug("[Godcmd] command: %s by %s" % (cmd, user))
-                elif canonical_cmd == "modellist":
+                elif cmd == "modellist":
                     try:
                         models_file_path = os.path.join(os.path.dirname(__file__), "available_models.json")
                         if not os.path.exists(models_file_path):
@@ -387,7 +396,7 @@ class Godcmd(Plugin):
                     except Exception as e:
                         logger.error(f"[Godcmd] Error processing modellist: {e}")
                         ok, result = False, f"处理 #modellist 指令时发生内部错误: {str(e)[:100]}"
-                logger.debug("[Godcmd] command: %s by %s" % (canonical_cmd, user))
+                logger.debug("[Godcmd] command: %s by %s" % (cmd, user))
             elif any(cmd in info["alias"] for info in ADMIN_COMMANDS.values()):
                 if isadmin:
                     if isgroup:
@@ -419,6 +428,21 @@ class Godcmd(Plugin):
                             else:
                                 logger.setLevel(logging.DEBUG)
                                 ok, result = True, "DEBUG模式已开启"
+                        elif cmd == "metrics":
+                            if args and args[0] == "reset":
+                                metrics.reset()
+                                ok, result = True, "性能统计已清空"
+                            else:
+                                ok, result = True, metrics.format_text()
+                        elif cmd == "replycache":
+                            cache = get_reply_cache()
+                            if cache is None:
+                                ok, result = False, "回复缓存未开启，请在配置中设置reply_cache为true"
+                            elif args and args[0] == "flush":
+                                cache.clear()
+                                ok, result = True, "回复缓存已清空"
+                            else:
+                                ok, result = True, cache.format_text()
                         elif cmd == "plist":
                             plugins = PluginManager().list_plugins()
                             ok = True
@@ -12,6 +12,7 @@ import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common import http_client
 from plugins import *
 
 # 默认认为requests已安装，因为它是基本依赖
@@ -380,7 +381,7 @@ class JinaSum(Plugin):
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
             }
             try:
-                response = requests.get(jina_url, headers=headers, timeout=60)
+                response = http_client.get(jina_url, headers=headers, timeout=60)
                 response.raise_for_status()
                 target_url_content = response.text
 
@@ -1023,7 +1024,7 @@ class JinaSum(Plugin):
             # 调用API
             openai_chat_url = self._get_openai_chat_url()
             openai_headers = self._get_openai_headers()
-            response = requests.post(
+            response = http_client.post(
                 openai_chat_url, headers=openai_headers, json=openai_payload, timeout=60
             )
             response.raise_for_status()
@@ -7,6 +7,7 @@ import os
 import sys
 
 from common.log import logger
+from common.metrics import metrics
 from common.singleton import singleton
 from common.sorted_dict import SortedDict
 from config import conf, remove_plugin_config, write_plugin_config
@@ -134,6 +135,7 @@ class PluginManager:
         return new_plugins
 
     def refresh_order(self):
+        # 只在启用、禁用、修改优先级和重载时调用，emit_event直接遍历排好序的列表；优先级相同时保持注册顺序
         for event in self.listening_plugins.keys():
             self.listening_plugins[event].sort(key=lambda name: self.plugins[name].priority, reverse=True)
 
@@ -158,7 +160,8 @@ class PluginManager:
                 for event in instance.handlers:
                     if event not in self.listening_plugins:
                         self.listening_plugins[event] = []
-                    self.listening_plugins[event].append(name)
+                    if name not in self.listening_plugins[event]:
+                        self.listening_plugins[event].append(name)
         self.refresh_order()
         return failed_plugins
 
@@ -190,11 +193,13 @@ class PluginManager:
 
     def emit_event(self, e_context: EventContext, *args, **kwargs):
         if e_context.event in self.listening_plugins:
+            stage = "plugin." + e_context.event.name
             for name in self.listening_plugins[e_context.event]:
                 if self.plugins[name].enabled and e_context.action == EventAction.CONTINUE:
                     logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
                     instance = self.instances[name]
-                    instance.handlers[e_context.event](e_context, *args, **kwargs)
+                    with metrics.timer(stage, name):
+                        instance.handlers[e_context.event](e_context, *args, **kwargs)
                     if e_context.is_break():
                         e_context["breaked_by"] = name
                         logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
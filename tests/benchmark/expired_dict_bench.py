@@ -0,0 +1,108 @@
+# encoding:utf-8
+"""
+ExpiredDict微基准，对比旧实现(dict + datetime，读时重写、keys()逐个检查过期)和基于OrderedDict + time.monotonic的TTL-LRU
+
+场景模拟消息去重表: 每条新消息先判断是否存在再写入，同时穿插重复消息的查询和少量keys()调用
+
+用法(在项目根目录执行):
+    python -m tests.benchmark.expired_dict_bench --size 10000 50000 --ops 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from common.expired_dict import ExpiredDict  # noqa: E402
+
+
+class LegacyExpiredDict(dict):
+    """旧版ExpiredDict实现，仅用于对比"""
+
+    def __init__(self, expires_in_seconds):
+        super().__init__()
+        self.expires_in_seconds = expires_in_seconds if expires_in_seconds else 3600
+
+    def __getitem__(self, key):
+        value, expiry_time = super().__getitem__(key)
+        if datetime.now() > expiry_time:
+            del self[key]
+            raise KeyError("expired {}".format(key))
+        self.__setitem__(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
+        super().__setitem__(key, (value, expiry_time))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def keys(self):
+        keys = list(super().keys())
+        return [key for key in keys if key in self]
+
+
+def run_case(cls, size, ops, keys_every):
+    cache = cls(3600)
+    for i in range(size):
+        cache["m{}".format(i)] = True
+    rnd = random.Random(0)
+    start = time.perf_counter()
+    next_id = size
+    for i in range(ops):
+        if rnd.random() < 0.8:
+            key = "m{}".format(next_id)
+            next_id += 1
+        else:
+            key = "m{}".format(rnd.randrange(next_id))
+        if key not in cache:
+            cache[key] = True
+    lookup_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(keys_every):
+        cache.keys()
+    keys_elapsed = time.perf_counter() - start
+    return {"us_per_op": round(lookup_elapsed * 1e6 / ops, 3), "keys_ms": round(keys_elapsed * 1000 / max(keys_every, 1), 3)}
+
+
+def run(args):
+    results = []
+    for size in args.size:
+        legacy = run_case(LegacyExpiredDict, size, args.ops, args.keys_calls)
+        current = run_case(ExpiredDict, size, args.ops, args.keys_calls)
+        results.append({
+            "size": size,
+            "legacy_us_per_op": legacy["us_per_op"],
+            "current_us_per_op": current["us_per_op"],
+            "legacy_keys_ms": legacy["keys_ms"],
+            "current_keys_ms": current["keys_ms"],
+        })
+    return {"ops": args.ops, "results": results}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ExpiredDict微基准")
+    parser.add_argument("--size", type=int, nargs="+", default=[10000, 50000], help="预先写入的key数量")
+    parser.add_argument("--ops", type=int, default=100000, help="去重查询+写入的操作次数")
+    parser.add_argument("--keys-calls", type=int, default=5, help="keys()调用次数")
+    return parser
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(build_parser().parse_args()), ensure_ascii=False, indent=2))
@@ -0,0 +1,365 @@
+# encoding:utf-8
+"""
+消息流水线压测脚本，离线运行，不需要网络和真实的bot
+
+按配置的速率生成私聊和群聊消息，经过 ChatChannel._compose_context -> produce -> 插件事件 -> Bridge -> 桩bot -> 装饰 -> 桩send
+的完整流程，统计吞吐量、端到端延迟(p50/p95/p99)、队列深度随时间的变化和内存增长，结果写入json文件，便于不同版本之间对比
+
+用法(在项目根目录执行):
+    python -m tests.benchmark.pipeline_bench --rate 200 --duration 10 --sessions 50 --latency lognormal:200:0.5 --output bench.json
+    python -m tests.benchmark.pipeline_bench --async-pipeline --latency exp:300
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from bot.bot import Bot  # noqa: E402
+from bridge.bridge import Bridge  # noqa: E402
+from bridge.context import Context, ContextType  # noqa: E402
+from bridge.reply import Reply, ReplyType  # noqa: E402
+from channel.chat_channel import ChatChannel  # noqa: E402
+from channel.chat_message import ChatMessage  # noqa: E402
+from common.log import logger  # noqa: E402
+from common.metrics import metrics  # noqa: E402
+from config import conf  # noqa: E402
+
+BOT_NAME = "bench_bot"
+
+
+class LatencyModel(object):
+    """
+    桩bot的延迟分布，格式:
+    fixed:毫秒 | uniform:最小毫秒:最大毫秒 | exp:平均毫秒 | lognormal:中位数毫秒:sigma
+    """
+
+    def __init__(self, spec: str, seed=None):
+        self.spec = spec
+        self.rng = random.Random(seed)
+        parts = spec.split(":")
+        self.kind = parts[0]
+        self.args = [float(x) for x in parts[1:]]
+        if self.kind not in ["fixed", "uniform", "exp", "lognormal"]:
+            raise ValueError("unknown latency model: {}".format(spec))
+
+    def sample(self) -> float:
+        """返回一次调用的延迟(秒)"""
+        if self.kind == "fixed":
+            ms = self.args[0]
+        elif self.kind == "uniform":
+            ms = self.rng.uniform(self.args[0], self.args[1])
+        elif self.kind == "exp":
+            ms = self.rng.expovariate(1.0 / self.args[0]) if self.args[0] > 0 else 0
+        else:
+            import math
+            ms = self.rng.lognormvariate(math.log(self.args[0]), self.args[1])
+        return max(ms, 0) / 1000.0
+
+
+class StubBot(Bot):
+    """按延迟分布休眠后回复固定内容的桩bot，同时提供async_reply供异步流水线使用"""
+
+    def __init__(self, latency: LatencyModel, reply_size=200):
+        self.latency = latency
+        self.reply_text = "x" * reply_size
+        self.lock = threading.Lock()
+
+    def _delay(self):
+        with self.lock:
+            return self.latency.sample()
+
+    def reply(self, query, context: Context = None) -> Reply:
+        time.sleep(self._delay())
+        return Reply(ReplyType.TEXT, self.reply_text)
+
+    async def async_reply(self, query, context: Context = None) -> Reply:
+        await asyncio.sleep(self._delay())
+        return Reply(ReplyType.TEXT, self.reply_text)
+
+
+class BenchMessage(ChatMessage):
+    def __init__(self, msg_id, content, session_index, group_index=None):
+        super().__init__(None)
+        self.msg_id = msg_id
+        self.create_time = time.time()
+        self.ctype = ContextType.TEXT
+        self.content = content
+        self.to_user_id = BOT_NAME
+        self.to_user_nickname = BOT_NAME
+        if group_index is None:
+            self.from_user_id = "user{}".format(session_index)
+            self.from_user_nickname = self.from_user_id
+            self.other_user_id = self.from_user_id
+            self.other_user_nickname = self.from_user_id
+        else:
+            self.is_group = True
+            self.is_at = True
+            self.from_user_id = "group{}@chatroom".format(group_index)
+            self.other_user_id = self.from_user_id
+            self.other_user_nickname = "group{}".format(group_index)
+            self.actual_user_id = "member{}".format(session_index)
+            self.actual_user_nickname = self.actual_user_id
+            self.at_list = []
+
+
+class BenchChannel(ChatChannel):
+    """记录每条消息收到和回复时间的通道，send可以模拟发送耗时"""
+
+    channel_type = "bench"
+    NOT_SUPPORT_REPLYTYPE = []
+
+    def __init__(self, send_latency: LatencyModel = None, loop=None):
+        self.user_id = BOT_NAME
+        self.name = BOT_NAME
+        self.send_latency = send_latency
+        self.received = {}  # msg_id -> 产生时间
+        self.replied = {}  # msg_id -> 回复时间
+        self.record_lock = threading.Lock()
+        self.all_replied = threading.Event()
+        self.expected = None
+        self.loop = loop
+        super().__init__()
+
+    def _record_reply(self, context: Context):
+        now = time.perf_counter()
+        msg_id = context["msg"].msg_id
+        with self.record_lock:
+            self.replied.setdefault(msg_id, now)
+            if self.expected is not None and len(self.replied) >= self.expected:
+                self.all_replied.set()
+
+    def send(self, reply: Reply, context: Context):
+        if self.send_latency:
+            time.sleep(self.send_latency.sample())
+        self._record_reply(context)
+
+    async def async_send(self, reply: Reply, context: Context):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency.sample())
+        self._record_reply(context)
+
+
+def percentile(sorted_values, q):
+    """最近秩法计算分位数，sorted_values需已排序"""
+    if not sorted_values:
+        return None
+    index = max(int(round(q * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def current_rss_bytes():
+    """当前进程的常驻内存，读取/proc，其他系统返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def configure(args):
+    """设置压测所需的最小配置，不读取config.json"""
+    settings = {
+        "model": "bench",
+        "single_chat_prefix": [""],
+        "group_chat_prefix": ["@" + BOT_NAME],
+        "group_name_white_list": ["ALL_GROUP"],
+        "concurrency_in_session": args.concurrency_in_session,
+        "handler_pool_size": args.pool_size,
+        "async_pipeline": args.async_pipeline,
+        "max_queued_contexts": args.max_queued,
+    }
+    for key, value in settings.items():
+        conf()[key] = value
+
+
+def run(args) -> dict:
+    logger.setLevel(getattr(logging, args.log_level.upper(), logging.WARNING))
+    configure(args)
+    rng = random.Random(args.seed)
+    bot = StubBot(LatencyModel(args.latency, args.seed), args.reply_size)
+    Bridge().bots["chat"] = bot
+    send_latency = LatencyModel(args.send_latency, args.seed) if args.send_latency else None
+
+    loop = None
+    if args.async_pipeline:
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+    channel = BenchChannel(send_latency, loop)
+    dropped_before = channel.get_queue_stats()["dropped"]  # 队列统计是类属性，只统计本轮的增量
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    gc.collect()
+    rss_start = current_rss_bytes()
+    queue_samples = []
+    stop_sampling = threading.Event()
+    start = time.perf_counter()
+
+    def sampler():
+        while not stop_sampling.is_set():
+            stats = channel.get_queue_stats()
+            queue_samples.append({
+                "t": round(time.perf_counter() - start, 3),
+                "queued": stats["queued"],
+                "in_flight": stats["in_flight"],
+                "sessions": stats["sessions"],
+                "rss": current_rss_bytes(),
+            })
+            stop_sampling.wait(args.sample_interval)
+
+    sampler_thread = threading.Thread(target=sampler, daemon=True)
+    sampler_thread.start()
+
+    # 开环产生消息：按泊松过程到达，不等待回复，模拟真实群聊的突发流量
+    produced = 0
+    next_time = start
+    deadline = start + args.duration
+    while True:
+        next_time += 1.0 / args.rate if args.fixed_interval else rng.expovariate(args.rate)
+        if next_time >= deadline:
+            break
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        session_index = rng.randrange(args.sessions)
+        msg_id = str(produced)
+        with channel.record_lock:
+            channel.received[msg_id] = time.perf_counter()
+        if rng.random() < args.group_ratio:
+            group_index = session_index % max(args.groups, 1)
+            content = "@{} 问题{}".format(BOT_NAME, produced)
+            cmsg = BenchMessage(msg_id, content, session_index, group_index)
+            context = channel._compose_context(ContextType.TEXT, content, isgroup=True, msg=cmsg)
+        else:
+            content = "问题{}".format(produced)
+            cmsg = BenchMessage(msg_id, content, session_index)
+            context = channel._compose_context(ContextType.TEXT, content, isgroup=False, msg=cmsg)
+        produced += 1
+        if context:
+            channel.produce(context)
+
+    produce_end = time.perf_counter()
+    stats = channel.get_queue_stats()
+    with channel.record_lock:
+        channel.expected = produced - (stats["dropped"] - dropped_before)
+        if len(channel.replied) >= channel.expected:
+            channel.all_replied.set()
+    channel.all_replied.wait(args.drain_timeout)
+    end = time.perf_counter()
+    stop_sampling.set()
+    sampler_thread.join()
+
+    gc.collect()
+    rss_end = current_rss_bytes()
+    traced = None
+    if args.tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        traced = {"current_bytes": current, "peak_bytes": peak}
+        tracemalloc.stop()
+
+    with channel.record_lock:
+        latencies = sorted(round((channel.replied[k] - channel.received[k]) * 1000, 2) for k in channel.replied if k in channel.received)
+        last_reply = max(channel.replied.values(), default=end)
+    final_stats = channel.get_queue_stats()
+    channel.shutdown(drain_timeout=0)
+    if loop is not None:
+        loop.call_soon_threadsafe(loop.stop)
+
+    completed = len(latencies)
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": int(time.time()),
+        },
+        "params": vars(args),
+        "produced": produced,
+        "completed": completed,
+        "dropped": final_stats["dropped"] - dropped_before,
+        "produce_seconds": round(produce_end - start, 3),
+        "total_seconds": round(end - start, 3),
+        "throughput_per_second": round(completed / (last_reply - start), 2) if completed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+            "mean": round(sum(latencies) / completed, 2) if completed else None,
+        },
+        "queue": {
+            "max_queued": max((s["queued"] for s in queue_samples), default=0),
+            "max_in_flight": max((s["in_flight"] for s in queue_samples), default=0),
+            "samples": queue_samples,
+        },
+        "memory": {
+            "rss_start_bytes": rss_start,
+            "rss_end_bytes": rss_end,
+            "rss_growth_bytes": rss_end - rss_start if rss_start is not None and rss_end is not None else None,
+            "tracemalloc": traced,
+        },
+        "stages": metrics.snapshot()["stages"],
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ChatChannel消息流水线离线压测")
+    parser.add_argument("--rate", type=float, default=100, help="每秒产生的消息数")
+    parser.add_argument("--duration", type=float, default=10, help="产生消息的持续时间(秒)")
+    parser.add_argument("--sessions", type=int, default=50, help="发送消息的用户数")
+    parser.add_argument("--groups", type=int, default=5, help="群聊数量")
+    parser.add_argument("--group-ratio", type=float, default=0.7, help="群聊消息占比")
+    parser.add_argument("--latency", default="lognormal:200:0.5", help="桩bot延迟分布，见LatencyModel")
+    parser.add_argument("--send-latency", default="fixed:5", help="桩send延迟分布，为空表示不延迟")
+    parser.add_argument("--reply-size", type=int, default=200, help="回复内容长度")
+    parser.add_argument("--pool-size", type=int, default=8, help="handler_pool_size")
+    parser.add_argument("--concurrency-in-session", type=int, default=1, help="concurrency_in_session")
+    parser.add_argument("--max-queued", type=int, default=0, help="max_queued_contexts，0表示不限制")
+    parser.add_argument("--async-pipeline", action="store_true", help="开启async_pipeline")
+    parser.add_argument("--fixed-interval", action="store_true", help="按固定间隔产生消息，默认按泊松过程")
+    parser.add_argument("--sample-interval", type=float, default=0.1, help="队列深度采样间隔(秒)")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="停止产生消息后等待回复的最长时间(秒)")
+    parser.add_argument("--tracemalloc", action="store_true", help="使用tracemalloc统计内存分配(有额外开销)")
+    parser.add_argument("--log-level", default="WARNING", help="压测期间的日志级别，INFO级别的日志会明显影响结果")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="", help="结果json文件路径，为空时输出到标准输出")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    result = run(args)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print("throughput={}/s p50={}ms p95={}ms p99={}ms dropped={} -> {}".format(
+            result["throughput_per_second"], result["latency_ms"]["p50"], result["latency_ms"]["p95"],
+            result["latency_ms"]["p99"], result["dropped"], args.output))
+    else:
+        print(text)
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# encoding:utf-8
+"""
+ChatGPTSession token计数的微基准，对比每轮对话整体重算(旧实现)和按消息缓存增量计数的耗时
+
+模拟一轮对话: add_query -> discard_exceeding -> add_reply -> discard_exceeding，max_tokens设置为历史长度稳定在--history条左右
+安装了tiktoken时使用gpt-3.5-turbo的编码，否则退化为按字符计数的wenxin模型
+
+用法(在项目根目录执行):
+    python -m tests.benchmark.token_bench --history 50 100 200 --turns 50
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession, num_tokens_from_messages  # noqa: E402
+
+
+def default_model():
+    return "gpt-3.5-turbo" if importlib.util.find_spec("tiktoken") else "wenxin"
+
+
+class NaiveSession(ChatGPTSession):
+    """旧实现: 每丢弃一条消息都重新编码整个历史"""
+
+    def add_query(self, query):
+        self.messages.append({"role": "user", "content": query})
+
+    def add_reply(self, reply):
+        self.messages.append({"role": "assistant", "content": reply})
+
+    def calc_tokens(self):
+        return num_tokens_from_messages(self.messages, self.model)
+
+    def discard_exceeding(self, max_tokens, cur_tokens=None):
+        cur_tokens = self.calc_tokens()
+        while cur_tokens > max_tokens and len(self.messages) > 2:
+            self.messages.pop(1)
+            cur_tokens = self.calc_tokens()
+        return cur_tokens
+
+
+def make_text(i):
+    return "第{}轮对话，请帮我解释一下这个问题的原因 message number {} with some english words".format(i, i)
+
+
+def run_case(session_cls, model, history, turns):
+    session = session_cls("bench", system_prompt="You are a helpful assistant.", model=model)
+    for i in range(history // 2):
+        session.add_query(make_text(i))
+        session.add_reply(make_text(i))
+    max_tokens = session.calc_tokens()
+    start = time.perf_counter()
+    for i in range(turns):
+        session.add_query(make_text(i))
+        session.discard_exceeding(max_tokens)
+        session.add_reply(make_text(i))
+        session.discard_exceeding(max_tokens)
+    elapsed = time.perf_counter() - start
+    return {"per_turn_ms": round(elapsed * 1000 / turns, 4), "messages": len(session.messages)}
+
+
+def run(args):
+    model = args.model or default_model()
+    results = []
+    for history in args.history:
+        naive = run_case(NaiveSession, model, history, args.turns)
+        incremental = run_case(ChatGPTSession, model, history, args.turns)
+        results.append({
+            "history": history,
+            "naive_per_turn_ms": naive["per_turn_ms"],
+            "incremental_per_turn_ms": incremental["per_turn_ms"],
+            "speedup": round(naive["per_turn_ms"] / incremental["per_turn_ms"], 2) if incremental["per_turn_ms"] else None,
+        })
+    return {"model": model, "turns": args.turns, "results": results}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ChatGPTSession token计数微基准")
+    parser.add_argument("--history", type=int, nargs="+", default=[50, 100, 200], help="会话历史消息条数")
+    parser.add_argument("--turns", type=int, default=50, help="每组测量的对话轮数")
+    parser.add_argument("--model", default="", help="计数使用的模型，默认有tiktoken时为gpt-3.5-turbo，否则为wenxin")
+    return parser
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(build_parser().parse_args()), ensure_ascii=False, indent=2))
@@ -0,0 +1,180 @@
+import time
+import unittest
+
+from bridge.bot_router import BackendHealth, BotRouter
+from bridge.bridge import Bridge
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from config import conf
+
+
+class StubBot:
+    def __init__(self, name, delay=0, error=None, reply_type=ReplyType.TEXT, send_part=False):
+        self.name = name
+        self.send_part = send_part
+        self.delay = delay
+        self.error = error
+        self.reply_type = reply_type
+        self.calls = 0
+        self.contexts = []
+
+    def reply(self, query, context=None):
+        self.calls += 1
+        self.contexts.append(context)
+        if self.send_part:
+            # 像dify一样先通过通道发送一段，再返回剩余部分
+            context["reply_parts_sent"] = True
+            context["channel"].send(Reply(ReplyType.TEXT, "{}:part".format(self.name)), context)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return Reply(self.reply_type, "{}:{}".format(self.name, query))
+
+
+class SentChannel:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reply, context):
+        self.sent.append(reply.content)
+
+
+def text_context(content):
+    return Context(ContextType.TEXT, content, kwargs={"session_id": "s"})
+
+
+class TestBotRouter(unittest.TestCase):
+    def setUp(self):
+        self.keys = ["chat_backend_hedge", "chat_backend_hedge_min_ms", "chat_backend_timeout"]
+
+    def tearDown(self):
+        for key in self.keys:
+            conf().pop(key, None)
+
+    def make_router(self, **bots):
+        router = BotRouter(list(bots.keys()))
+        router.bots.update(bots)
+        return router
+
+    def test_failover_on_error(self):
+        """测试后端抛出异常或返回错误回复时切换到下一个后端"""
+        router = self.make_router(a=StubBot("a", error=RuntimeError("down")),
+                                  b=StubBot("b", reply_type=ReplyType.ERROR), c=StubBot("c"))
+        reply = router.reply("你好", text_context("你好"))
+        self.assertEqual(reply.content, "c:你好")
+        self.assertEqual([router.bots[t].calls for t in "abc"], [1, 1, 1])
+
+        router = self.make_router(a=StubBot("a", reply_type=ReplyType.ERROR))
+        self.assertEqual(router.reply("你好", text_context("你好")).type, ReplyType.ERROR)
+
+    def test_cooldown_ranking(self):
+        """测试连续失败的后端被摘除，冷却结束后恢复"""
+        router = self.make_router(a=StubBot("a"), b=StubBot("b"))
+        for _ in range(5):
+            router.health["a"].record(0.1, True, 2, 0.1)
+        router.health["a"].record(0.1, False, 2, 0.1)
+        self.assertEqual(router.ranked(), ["a", "b"])
+        router.health["a"].record(0.1, False, 2, 0.1)
+        self.assertFalse(router.health["a"].available())
+        self.assertEqual(router.ranked(), ["b", "a"])
+        self.assertEqual(router.reply("q", text_context("q")).content, "b:q")
+        self.assertEqual(router.bots["a"].calls, 0)
+        time.sleep(0.12)
+        self.assertEqual(router.ranked(), ["a", "b"])
+
+    def test_slow_backend_demoted(self):
+        """测试p95耗时明显高于其他后端时降低优先级"""
+        router = self.make_router(a=StubBot("a"), b=StubBot("b"))
+        for _ in range(10):
+            router.health["a"].record(1.0, True, 3, 30)
+            router.health["b"].record(0.1, True, 3, 30)
+        self.assertEqual(router.ranked(), ["b", "a"])
+
+    def test_timeout_failover(self):
+        """测试后端超时后切换到下一个后端"""
+        conf()["chat_backend_timeout"] = 0.1
+        router = self.make_router(a=StubBot("a", delay=0.5), b=StubBot("b"))
+        start = time.monotonic()
+        self.assertEqual(router.reply("q", text_context("q")).content, "b:q")
+        self.assertLess(time.monotonic() - start, 0.4)
+
+    def test_timeout_recorded_once(self):
+        """测试超时的请求只记录一次失败，线程结束后不再重复记录"""
+        conf()["chat_backend_timeout"] = 0.1
+        router = self.make_router(a=StubBot("a", delay=0.3), b=StubBot("b"))
+        self.assertEqual(router.reply("q", text_context("q")).content, "b:q")
+        time.sleep(0.3)
+        self.assertEqual(len(router.health["a"].samples), 1)
+        self.assertEqual(router.health["a"].error_rate(), 1.0)
+
+    def test_backends_get_own_context(self):
+        """测试每个后端拿到独立的context副本"""
+        a, b = StubBot("a", error=RuntimeError("down")), StubBot("b")
+        router = self.make_router(a=a, b=b)
+        context = text_context("q")
+        router.reply("q", context)
+        [context_a], [context_b] = a.contexts, b.contexts
+        self.assertIsNot(context_a, context_b)
+        self.assertIsNot(context_a.kwargs, context.kwargs)
+        self.assertEqual(context_b["session_id"], "s")
+
+    def test_only_winner_parts_sent(self):
+        """测试对冲时只发出被采用的后端自行发送的部分回复"""
+        conf()["chat_backend_hedge"] = True
+        conf()["chat_backend_hedge_min_ms"] = 50
+        router = self.make_router(a=StubBot("a", delay=0.3, send_part=True), b=StubBot("b", delay=0.01, send_part=True))
+        for _ in range(5):
+            router.health["a"].record(0.01, True, 3, 30)
+        channel = SentChannel()
+        context = text_context("q")
+        context["channel"] = channel
+        self.assertEqual(router.reply("q", context).content, "b:q")
+        self.assertEqual(channel.sent, ["b:part"])
+        self.assertTrue(context.get("reply_parts_sent"))
+        time.sleep(0.4)
+        self.assertEqual(channel.sent, ["b:part"])
+
+    def test_hedge(self):
+        """测试开启对冲后，请求超过p95仍未返回时同时请求下一个后端"""
+        conf()["chat_backend_hedge"] = True
+        conf()["chat_backend_hedge_min_ms"] = 50
+        router = self.make_router(a=StubBot("a", delay=0.5), b=StubBot("b"))
+        for _ in range(5):
+            router.health["a"].record(0.01, True, 3, 30)
+        start = time.monotonic()
+        self.assertEqual(router.reply("q", text_context("q")).content, "b:q")
+        self.assertLess(time.monotonic() - start, 0.4)
+
+    def test_health_p95(self):
+        """测试样本不足时不计算p95"""
+        health = BackendHealth()
+        for seconds in [0.1, 0.2, 0.3, 0.4]:
+            health.record(seconds, True, 3, 30)
+        self.assertIsNone(health.p95())
+        health.record(0.5, True, 3, 30)
+        self.assertEqual(health.p95(), 0.5)
+
+
+class TestBridgeRouting(unittest.TestCase):
+    def setUp(self):
+        conf()["model"] = "gpt-4o-mini"
+        conf()["chat_backends"] = ["a", "b"]
+        Bridge().reset_bot()
+
+    def tearDown(self):
+        conf().pop("chat_backends", None)
+        Bridge().reset_bot()
+        conf().pop("model", None)
+
+    def test_bridge_uses_router(self):
+        """测试配置多个后端时Bridge通过路由获取回复"""
+        bridge = Bridge()
+        self.assertIsNotNone(bridge.router)
+        bridge.router.bots.update(a=StubBot("a", error=RuntimeError("down")), b=StubBot("b"))
+        self.assertIs(bridge.get_bot("chat"), bridge.router.bots["a"])
+        self.assertEqual(bridge.fetch_reply_content("q", text_context("q")).content, "b:q")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from bridge.bridge import Bridge
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from channel.chat_channel import ChatChannel
+from config import conf
+
+
+class RecordingChannel(ChatChannel):
+    def __init__(self, delay=0.0):
+        self.handled = []
+        self.delay = delay
+        self.done = threading.Event()
+        self.expected = 0
+        super().__init__()
+
+    def _handle(self, context: Context):
+        if self.delay:
+            time.sleep(self.delay)
+        self.handled.append((context["session_id"], context.content))
+        if len(self.handled) >= self.expected:
+            self.done.set()
+
+
+def make_context(session_id, content):
+    return Context(ContextType.TEXT, content, kwargs={"session_id": session_id, "receiver": session_id})
+
+
+class TestChatChannelScheduler(unittest.TestCase):
+    def setUp(self):
+        conf()["concurrency_in_session"] = 1
+        self.channel = None
+
+    def tearDown(self):
+        if self.channel:
+            self.channel.shutdown()
+        conf().pop("concurrency_in_session", None)
+
+    def test_keeps_order_within_session(self):
+        """测试同一会话内消息按顺序处理"""
+        self.channel = RecordingChannel(delay=0.005)
+        self.channel.expected = 30
+        for i in range(10):
+            for sid in ["a", "b", "c"]:
+                self.channel.produce(make_context(sid, str(i)))
+        self.assertTrue(self.channel.done.wait(5))
+        for sid in ["a", "b", "c"]:
+            contents = [c for s, c in self.channel.handled if s == sid]
+            self.assertEqual(contents, [str(i) for i in range(10)])
+
+    def test_admin_command_first(self):
+        """测试管理命令优先处理"""
+        self.channel = RecordingChannel(delay=0.05)
+        self.channel.expected = 3
+        self.channel.produce(make_context("a", "first"))
+        time.sleep(0.01)
+        self.channel.produce(make_context("a", "second"))
+        self.channel.produce(make_context("a", "#help"))
+        self.assertTrue(self.channel.done.wait(5))
+        self.assertEqual([c for _, c in self.channel.handled], ["first", "#help", "second"])
+
+    def test_idle_sessions_are_released(self):
+        """测试处理完成的会话被清理"""
+        self.channel = RecordingChannel()
+        self.channel.expected = 5
+        for i in range(5):
+            self.channel.produce(make_context(f"s{i}", "hi"))
+        self.assertTrue(self.channel.done.wait(5))
+        deadline = time.time() + 2
+        while time.time() < deadline and any(f"s{i}" in ChatChannel.sessions for i in range(5)):
+            time.sleep(0.01)
+        self.assertFalse(any(f"s{i}" in ChatChannel.sessions for i in range(5)))
+
+
+class TestChatChannelShutdown(unittest.TestCase):
+    def setUp(self):
+        conf()["handler_pool_size"] = 1
+
+    def tearDown(self):
+        conf().pop("handler_pool_size", None)
+
+    def test_drain_queued_sessions(self):
+        """测试关闭时处理中的消息达到上限，多个会话排队的消息仍全部处理完成"""
+        channel = RecordingChannel(delay=0.05)
+        channel.expected = 3
+        for sid in ["a", "b", "c"]:
+            channel.produce(make_context(sid, "hi"))
+        start = time.time()
+        channel.shutdown(drain_timeout=5)
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(sorted(s for s, _ in channel.handled), ["a", "b", "c"])
+
+
+class BlockingChannel(RecordingChannel):
+    def __init__(self):
+        self.release = threading.Event()
+        super().__init__()
+
+    def _handle(self, context: Context):
+        self.release.wait(5)
+        super()._handle(context)
+
+
+class TestChatChannelAdmission(unittest.TestCase):
+    def setUp(self):
+        conf()["concurrency_in_session"] = 1
+        conf()["max_queued_contexts_in_session"] = 2
+        self.channel = BlockingChannel()
+
+    def tearDown(self):
+        self.channel.release.set()
+        self.channel.shutdown()
+        for key in ["concurrency_in_session", "max_queued_contexts_in_session", "queue_overflow_policy"]:
+            conf().pop(key, None)
+
+    def _produce_burst(self):
+        self.channel.expected = 3
+        self.channel.produce(make_context("flood", "0"))
+        time.sleep(0.05)  # 等待第一条消息进入处理中
+        for i in range(1, 5):
+            self.channel.produce(make_context("flood", str(i)))
+        self.assertEqual(self.channel.get_queue_stats()["max_session_depth"], 2)
+        self.channel.release.set()
+        self.assertTrue(self.channel.done.wait(5))
+        return [c for _, c in self.channel.handled]
+
+    def test_drop_oldest(self):
+        """测试队列满时丢弃最早的消息"""
+        conf()["queue_overflow_policy"] = "drop_oldest"
+        self.assertEqual(self._produce_burst(), ["0", "3", "4"])
+
+    def test_drop_newest(self):
+        """测试队列满时丢弃新消息"""
+        conf()["queue_overflow_policy"] = "drop_newest"
+        self.assertEqual(self._produce_burst(), ["0", "1", "2"])
+
+    def test_drop_oldest_keeps_admin_command(self):
+        """测试队列满时不丢弃排在队首的管理命令"""
+        conf()["queue_overflow_policy"] = "drop_oldest"
+        self.channel.expected = 3
+        self.channel.produce(make_context("flood", "0"))
+        time.sleep(0.05)
+        for content in ["#help", "1", "2"]:
+            self.channel.produce(make_context("flood", content))
+        self.channel.release.set()
+        self.assertTrue(self.channel.done.wait(5))
+        self.assertEqual([c for _, c in self.channel.handled], ["0", "#help", "2"])
+
+
+class TestChatChannelCoalesce(unittest.TestCase):
+    def setUp(self):
+        conf()["concurrency_in_session"] = 1
+        conf()["coalesce_window_ms"] = 100
+        self.channel = RecordingChannel()
+
+    def tearDown(self):
+        self.channel.shutdown()
+        for key in ["concurrency_in_session", "coalesce_window_ms"]:
+            conf().pop(key, None)
+
+    def test_burst_is_merged(self):
+        """测试窗口内连续发送的文本消息合并为一条"""
+        self.channel.expected = 2
+        coalesced = self.channel.get_queue_stats()["coalesced"]
+        for content in ["在吗", "问个问题", "怎么部署"]:
+            self.channel.produce(make_context("burst", content))
+            time.sleep(0.01)
+        self.channel.produce(make_context("other", "hi"))
+        self.assertTrue(self.channel.done.wait(5))
+        self.assertIn(("burst", "在吗\n问个问题\n怎么部署"), self.channel.handled)
+        self.assertIn(("other", "hi"), self.channel.handled)
+        self.assertEqual(self.channel.get_queue_stats()["coalesced"] - coalesced, 2)
+
+    def test_admin_command_not_delayed(self):
+        """测试管理命令不进入合并窗口"""
+        self.channel.expected = 1
+        start = time.time()
+        self.channel.produce(make_context("admin", "#help"))
+        self.assertTrue(self.channel.done.wait(5))
+        self.assertLess(time.time() - start, 0.09)
+
+
+class AsyncStubBot:
+    async def async_reply(self, query, context=None):
+        await asyncio.sleep(0.01)
+        return Reply(ReplyType.TEXT, "echo:" + query)
+
+
+class LoopChannel(ChatChannel):
+    def __init__(self):
+        self.sent = []
+        self.done = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        super().__init__()
+
+    async def async_send(self, reply, context):
+        self.sent.append((reply.content, asyncio.get_running_loop() is self.loop))
+        self.done.set()
+
+
+class TestChatChannelAsyncPipeline(unittest.TestCase):
+    def setUp(self):
+        conf()["async_pipeline"] = True
+        conf()["model"] = "gpt-4o-mini"
+        Bridge().bots["chat"] = AsyncStubBot()
+        self.channel = LoopChannel()
+
+    def tearDown(self):
+        self.channel.shutdown()
+        self.channel.loop.call_soon_threadsafe(self.channel.loop.stop)
+        Bridge().bots.pop("chat", None)
+        conf().pop("async_pipeline", None)
+        conf().pop("model", None)
+
+    def test_reply_sent_on_channel_loop(self):
+        """测试异步流水线在通道事件循环上调用bot和发送回复"""
+        self.channel.produce(make_context("async", "hello"))
+        self.assertTrue(self.channel.done.wait(5))
+        self.assertEqual(self.channel.sent, [("echo:hello", True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
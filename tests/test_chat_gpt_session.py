@@ -0,0 +1,39 @@
+import unittest
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession, num_tokens_from_messages
+
+
+class TestChatGPTSessionTokens(unittest.TestCase):
+    def setUp(self):
+        # 测试环境不一定安装tiktoken，使用按字符计数的模型
+        self.session = ChatGPTSession("s", system_prompt="system", model="wenxin")
+        for i in range(10):
+            self.session.add_query("query-{}".format(i))
+            self.session.add_reply("reply-{}".format(i))
+
+    def test_calc_tokens_matches_full_count(self):
+        """测试缓存计数与整体重算结果一致"""
+        self.assertEqual(self.session.calc_tokens(), num_tokens_from_messages(self.session.messages, "wenxin"))
+
+    def test_discard_exceeding_keeps_total_consistent(self):
+        """测试丢弃消息后返回的token数与剩余消息一致"""
+        total = self.session.discard_exceeding(60)
+        self.assertLessEqual(total, 60)
+        self.assertEqual(total, num_tokens_from_messages(self.session.messages, "wenxin"))
+        self.assertEqual(self.session.messages[0]["role"], "system")
+
+    def test_cache_reset_on_model_change(self):
+        """测试切换模型后重新计数"""
+        self.session.calc_tokens()
+        self.session.messages[1]["content"] = "x"
+        self.session.model = "xunfei"
+        self.assertEqual(self.session.calc_tokens(), num_tokens_from_messages(self.session.messages, "xunfei"))
+
+    def test_cache_reset_on_content_change(self):
+        """测试消息内容被原地修改后重新计数"""
+        self.session.calc_tokens()
+        self.session.messages[1]["content"] = "a much longer query than before"
+        self.assertEqual(self.session.calc_tokens(), num_tokens_from_messages(self.session.messages, "wenxin"))
+
+if __name__ == '__main__':
+    unittest.main()
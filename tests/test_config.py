@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import config
+from config import Config, add_config_listener, conf, load_config, start_config_watcher
+
+
+class TestConfigSnapshot(unittest.TestCase):
+    def test_snapshot_is_frozen_and_cached(self):
+        """测试快照只读，未配置的项返回默认值，配置未变化时复用同一个快照"""
+        c = Config({"model": "gpt-4o", "group_chat_prefix": ["@bot"]})
+        snapshot = c.snapshot()
+        self.assertIs(c.snapshot(), snapshot)
+        self.assertEqual(snapshot.model, "gpt-4o")
+        self.assertEqual(snapshot.group_chat_prefix, ("@bot",))
+        self.assertIs(snapshot.group_at_off, False)
+        self.assertEqual(snapshot.coalesce_max_wait_ms, 3000)
+        self.assertEqual(snapshot.get("single_chat_reply_prefix", ""), "")
+        with self.assertRaises(AttributeError):
+            snapshot.not_a_setting
+        with self.assertRaises(TypeError):
+            snapshot.model = "x"
+        c["model"] = "claude-3-5-sonnet"
+        self.assertEqual(c.snapshot().model, "claude-3-5-sonnet")
+        self.assertEqual(snapshot.model, "gpt-4o")
+
+
+class TestConfigReload(unittest.TestCase):
+    def setUp(self):
+        self.old_config = config.config
+        self.old_listeners = list(config._config_listeners)
+        self.old_cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmpdir.name)
+        self._write({"model": "gpt-4o"})
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        self.tmpdir.cleanup()
+        config.config = self.old_config
+        config._config_listeners[:] = self.old_listeners
+
+    def _write(self, data):
+        with open("config.json", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def test_reload_swaps_and_notifies(self):
+        """测试重新加载后整体替换配置并通知监听者"""
+        load_config()
+        first = conf()
+        calls = []
+        add_config_listener(lambda old, new: calls.append((old.get("model"), new.get("model"))))
+        self._write({"model": "deepseek-chat"})
+        load_config()
+        self.assertIsNot(conf(), first)
+        self.assertEqual(first.get("model"), "gpt-4o")
+        self.assertEqual(calls, [("gpt-4o", "deepseek-chat")])
+
+    def test_watcher_keeps_old_config_on_broken_file(self):
+        """测试监听到文件修改后自动加载，json不完整时保留旧配置"""
+        load_config()
+        stop_watching = start_config_watcher(interval=0.05)
+        self.addCleanup(stop_watching.set)
+        with open("config.json", "w", encoding="utf-8") as f:
+            f.write("{\"model\": ")
+        os.utime("config.json", (time.time() + 1, time.time() + 1))
+        time.sleep(0.2)
+        self.assertEqual(conf().get("model"), "gpt-4o")
+        self._write({"model": "deepseek-chat"})
+        os.utime("config.json", (time.time() + 2, time.time() + 2))
+        deadline = time.time() + 2
+        while time.time() < deadline and conf().get("model") != "deepseek-chat":
+            time.sleep(0.02)
+        self.assertEqual(conf().get("model"), "deepseek-chat")
+
+
+if __name__ == '__main__':
+    unittest.main()
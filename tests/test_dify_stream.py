@@ -0,0 +1,107 @@
+import json
+import unittest
+from unittest import mock
+
+from bridge.context import Context, ContextType
+from bridge.reply import ReplyType
+
+try:
+    from bot.dify.dify_bot import DifyBot
+    from bot.dify.dify_session import DifySession
+except ImportError:  # 未安装requests
+    DifyBot = None
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, events):
+        self.events = events
+
+    def iter_lines(self):
+        for event in self.events:
+            yield ("data: " + json.dumps(event, ensure_ascii=False)).encode("utf-8")
+            yield b""
+
+
+def message(answer):
+    return {"event": "message", "answer": answer, "conversation_id": "c1"}
+
+
+def message_file(url="/files/a.png"):
+    return {"event": "message_file", "type": "image", "url": url, "conversation_id": "c1"}
+
+
+END = {"event": "message_end", "conversation_id": "c1", "metadata": {"usage": {}}}
+
+
+class SentChannel:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reply, context):
+        self.sent.append((reply.type, reply.content))
+
+
+@unittest.skipIf(DifyBot is None, "requests is not installed")
+class TestDifyStreamSegments(unittest.TestCase):
+    def setUp(self):
+        self.bot = DifyBot()
+
+    def segments(self, events):
+        session = DifySession("s", "u")
+        return list(self.bot._iter_stream_segments(FakeResponse(events), session))
+
+    def test_find_segment_end(self):
+        """测试段落以空行或//n结束，代码块内的空行不算"""
+        self.assertEqual(DifyBot._find_segment_end("a\n\nb"), (1, "\n\n"))
+        self.assertEqual(DifyBot._find_segment_end("a//nb"), (1, "//n"))
+        self.assertEqual(DifyBot._find_segment_end("a"), (-1, ""))
+        code = "```\nx\n\ny\n```"
+        self.assertEqual(DifyBot._find_segment_end(code), (-1, ""))
+        self.assertEqual(DifyBot._find_segment_end(code + "\n\nz"), (len(code), "\n\n"))
+
+    def test_segments_and_last(self):
+        """测试按分隔符分段，跨两个事件的分隔符也能识别，剩余文本为最后一段"""
+        segments = self.segments([message("第一段\n"), message("\n第二段//"), message("n第三段"), END])
+        self.assertEqual(segments, [("text", "第一段", False), ("text", "第二段", False), ("text", "第三段", True)])
+
+    def test_code_block_kept_together(self):
+        """测试代码块内的空行不分段"""
+        code = "```\nx\n\ny\n```"
+        self.assertEqual(self.segments([message(code + "\n\n结尾"), END]),
+                         [("text", code, False), ("text", "结尾", True)])
+
+    def test_trailing_separator(self):
+        """测试以分隔符结尾时最后一段仍标记为最后一段"""
+        self.assertEqual(self.segments([message("一\n\n二\n\n"), END]), [("text", "一", False), ("text", "二", True)])
+        self.assertEqual(self.segments([message("一//n"), END]), [("text", "一", True)])
+
+    def test_file_as_last_event(self):
+        """测试文件是最后一个事件时作为最后一段返回"""
+        segments = self.segments([message("看图"), message_file(), END])
+        self.assertEqual([(kind, last) for kind, _, last in segments], [("text", False), ("message_file", True)])
+        self.assertEqual(segments[0][1], "看图")
+
+    def test_message_replace(self):
+        """测试内容被替换时丢弃尚未发送的部分"""
+        segments = self.segments([message("一\n\n敏感"), {"event": "message_replace", "answer": "已替换", "conversation_id": "c1"}, END])
+        self.assertEqual(segments, [("text", "一", False), ("text", "已替换", True)])
+
+    def test_streaming_returns_last_file(self):
+        """测试流式回复以文件结束时文件作为返回的回复，之前的段落通过通道发送"""
+        channel = SentChannel()
+        context = Context(ContextType.TEXT, "q", kwargs={"channel": channel, "isgroup": False, "session_id": "s"})
+        response = FakeResponse([message("看图\n\n"), message_file(), END])
+        with mock.patch("bot.dify.dify_bot.ChatClient") as client:
+            client.return_value.create_chat_message.return_value = response
+            reply, error = self.bot._handle_streaming("q", DifySession("s", "u"), context)
+        self.assertIsNone(error)
+        self.assertEqual(reply.type, ReplyType.IMAGE_URL)
+        self.assertTrue(reply.content.endswith("/files/a.png"))
+        self.assertEqual(channel.sent, [(ReplyType.TEXT, "看图")])
+        self.assertTrue(context.get("reply_parts_sent"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import time
+import unittest
+
+from common.expired_dict import ExpiredDict
+
+
+class TestExpiredDict(unittest.TestCase):
+    def test_expire_and_refresh_on_read(self):
+        """测试过期清理以及读取时刷新过期时间"""
+        cache = ExpiredDict(0.05)
+        cache["a"] = 1
+        cache["b"] = 2
+        time.sleep(0.03)
+        self.assertEqual(cache["a"], 1)
+        time.sleep(0.03)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIsNone(cache.get("b"))
+        with self.assertRaises(KeyError):
+            cache["b"]
+        time.sleep(0.06)
+        self.assertEqual(cache.keys(), [])
+        self.assertEqual(len(cache), 0)
+
+    def test_maxsize_evicts_least_recently_used(self):
+        """测试超过容量时淘汰最久未使用的key"""
+        cache = ExpiredDict(60, maxsize=3)
+        for key in ["a", "b", "c"]:
+            cache[key] = key
+        cache.get("a")
+        cache["d"] = "d"
+        self.assertEqual(cache.keys(), ["c", "a", "d"])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_no_refresh_on_read(self):
+        """测试refresh_on_read为False时读取不延长过期时间"""
+        cache = ExpiredDict(0.05, refresh_on_read=False)
+        cache["a"] = 1
+        time.sleep(0.03)
+        self.assertEqual(cache["a"], 1)
+        time.sleep(0.03)
+        self.assertNotIn("a", cache)
+
+    def test_dict_interface(self):
+        """测试与原有调用方式兼容"""
+        cache = ExpiredDict(60)
+        cache["k"] = None
+        self.assertIn("k", cache)
+        self.assertEqual(cache.items(), [("k", None)])
+        self.assertEqual(list(cache), ["k"])
+        del cache["k"]
+        self.assertNotIn("k", cache)
+        self.assertEqual(cache.pop("k", "x"), "x")
+        stats = cache.stats()
+        self.assertGreater(stats["hits"], 0)
+        self.assertGreater(stats["misses"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from common.fair_queue import DeficitRoundRobin
+
+
+class TestDeficitRoundRobin(unittest.TestCase):
+    def test_weighted_share(self):
+        """测试按权重分配出队机会"""
+        drr = DeficitRoundRobin({"private": 2, "group": 1})
+        for i in range(20):
+            drr.push(f"g{i}", "group")
+        for i in range(4):
+            drr.push(f"p{i}", "private")
+        first_six = [drr.pop() for _ in range(6)]
+        self.assertEqual(sum(1 for k in first_six if k.startswith("p")), 4)
+
+    def test_round_robin_within_class(self):
+        """测试同类别内按入队顺序轮询"""
+        drr = DeficitRoundRobin()
+        for key in ["a", "b", "c"]:
+            drr.push(key, "group")
+        drr.push("a", "group")  # 已在队列中，不改变位置
+        self.assertEqual([drr.pop() for _ in range(3)], ["a", "b", "c"])
+        self.assertFalse(drr)
+        with self.assertRaises(KeyError):
+            drr.pop()
+
+    def test_fractional_weight(self):
+        """测试小于1的权重需要累积多轮才能出队"""
+        drr = DeficitRoundRobin({"low": 0.5, "high": 1})
+        for i in range(4):
+            drr.push(f"l{i}", "low")
+            drr.push(f"h{i}", "high")
+        order = [drr.pop() for _ in range(6)]
+        self.assertEqual(sum(1 for k in order if k.startswith("l")), 2)
+
+    def test_reclassify(self):
+        """测试类别变化时移动到新类别"""
+        drr = DeficitRoundRobin({"admin": 8, "group": 1})
+        drr.push("a", "group")
+        drr.push("b", "group")
+        drr.push("b", "admin")
+        self.assertEqual(len(drr), 2)
+        self.assertEqual(drr.pop(), "a")
+        self.assertEqual(drr.pop(), "b")
+
+
+if __name__ == '__main__':
+    unittest.main()
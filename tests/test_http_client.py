@@ -0,0 +1,82 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import conf
+
+try:
+    from common import http_client
+except ImportError:  # 未安装requests
+    http_client = None
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 保持长连接
+    failures = 0  # 之后的请求先返回多少次503
+    hits = 0
+
+    def _respond(self):
+        type(self).hits += 1
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        status = 200
+        if type(self).failures > 0:
+            type(self).failures -= 1
+            status = 503
+        body = b"ok"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", "sid=secret; Path=/")
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(http_client is None, "requests is not installed")
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        FlakyHandler.failures = 0
+        FlakyHandler.hits = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/".format(self.server.server_address[1])
+        conf()["http_retries"] = 2
+        conf()["http_pool_size"] = 4
+        http_client.close_sessions()
+
+    def tearDown(self):
+        http_client.close_sessions()
+        self.server.shutdown()
+        self.server.server_close()
+        for key in ["http_retries", "http_pool_size"]:
+            conf().pop(key, None)
+
+    def test_retry_idempotent_only(self):
+        """测试GET遇到503时重试，POST不重试"""
+        FlakyHandler.failures = 1
+        self.assertEqual(http_client.get(self.url).status_code, 200)
+        self.assertEqual(FlakyHandler.hits, 2)
+        FlakyHandler.failures = 1
+        self.assertEqual(http_client.post(self.url, json={"q": 1}).status_code, 503)
+        self.assertEqual(FlakyHandler.hits, 3)
+
+    def test_pool_reuse_without_cookies(self):
+        """测试同一host复用Session和连接，且不保存响应中的cookie"""
+        session = http_client.get_session(self.url)
+        self.assertIs(http_client.get_session(self.url + "path"), session)
+        self.assertIsNot(http_client.get_session("http://example.com/"), session)
+        self.assertEqual(session.adapter._pool_maxsize, 4)
+        for _ in range(5):
+            self.assertEqual(http_client.get(self.url).text, "ok")
+        self.assertEqual(session.connection_count(), 1)
+        self.assertEqual(len(session.cookies), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from bridge.context import Context, ContextType
+from channel.chat_channel import ChatChannel
+from channel.chat_message import ChatMessage
+from common.message_journal import MessageJournal
+from config import conf
+
+
+def make_context(session_id, content):
+    cmsg = ChatMessage(None)
+    cmsg.msg_id = "1001"
+    cmsg.from_user_id = session_id
+    cmsg.ctype = ContextType.TEXT
+    return Context(ContextType.TEXT, content, kwargs={"session_id": session_id, "receiver": session_id,
+                                                      "isgroup": False, "msg": cmsg, "origin_ctype": ContextType.TEXT})
+
+
+class TestMessageJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.journal = MessageJournal(os.path.join(self.tmpdir.name, "journal.db"))
+
+    def tearDown(self):
+        self.journal.close()
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        """测试context写入后可以完整重建"""
+        self.journal.append(make_context("u1", "你好"))
+        [(_, context)] = self.journal.pending(60)
+        self.assertEqual(context.type, ContextType.TEXT)
+        self.assertEqual(context.content, "你好")
+        self.assertEqual(context["origin_ctype"], ContextType.TEXT)
+        self.assertEqual(context["msg"].from_user_id, "u1")
+        self.assertEqual(context["msg"].ctype, ContextType.TEXT)
+
+    def test_ack_and_expire(self):
+        """测试确认后的记录和过期记录不会被重放"""
+        first = self.journal.append(make_context("u1", "a"))
+        self.journal.append(make_context("u1", "b"))
+        self.journal.ack([first])
+        self.assertEqual([c.content for _, c in self.journal.pending(60)], ["b"])
+        time.sleep(0.02)
+        self.assertEqual(self.journal.pending(0.01), [])
+        self.assertEqual(len(self.journal), 0)
+
+    def test_batched_write(self):
+        """测试写入在flush时批量提交，提交前已确认的记录不写入数据库"""
+        journal = MessageJournal(os.path.join(self.tmpdir.name, "batch.db"), flush_interval=0)
+        first = journal.append(make_context("u1", "a"))
+        second = journal.append(make_context("u1", "b"))
+        self.assertEqual(journal.conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0], 0)
+        journal.ack([first])
+        journal.flush()
+        self.assertEqual([row[0] for row in journal.conn.execute("SELECT id FROM journal")], [second])
+        journal.close()
+
+    def test_msg_fields_whitelist(self):
+        """测试只保存白名单中的消息字段，媒体消息保存文件路径"""
+        context = make_context("u1", "")
+        context["msg"].image_path = "/tmp/img.png"
+        context["msg"].helper = object()
+        self.journal.append(context)
+        [(_, replayed)] = self.journal.pending(60)
+        self.assertEqual(replayed["msg"].image_path, "/tmp/img.png")
+        self.assertFalse(hasattr(replayed["msg"], "helper"))
+
+
+class RecordingChannel(ChatChannel):
+    def __init__(self):
+        self.handled = []
+        self.done = threading.Event()
+        super().__init__()
+
+    def _handle(self, context: Context):
+        self.handled.append(context.content)
+        self.done.set()
+
+
+class TestChatChannelJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        conf()["message_journal"] = True
+        conf()["message_journal_path"] = os.path.join(self.tmpdir.name, "journal.db")
+        self.channel = RecordingChannel()
+
+    def tearDown(self):
+        self.channel.shutdown()
+        self.channel.journal.close()
+        for key in ["message_journal", "message_journal_path"]:
+            conf().pop(key, None)
+        self.tmpdir.cleanup()
+
+    def test_acked_after_handle(self):
+        """测试处理完成后日志被确认"""
+        self.channel.produce(make_context("u1", "hello"))
+        self.assertTrue(self.channel.done.wait(5))
+        deadline = time.time() + 2
+        while time.time() < deadline and len(self.channel.journal):
+            time.sleep(0.01)
+        self.assertEqual(len(self.channel.journal), 0)
+
+    def test_replay_pending(self):
+        """测试启动时重放未确认的消息"""
+        self.channel.journal.append(make_context("u2", "left over"))
+        self.assertEqual(self.channel.replay_journal(), 1)
+        self.assertTrue(self.channel.done.wait(5))
+        self.assertEqual(self.channel.handled, ["left over"])
+
+
+if __name__ == '__main__':
+    unittest.main()
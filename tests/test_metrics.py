@@ -0,0 +1,57 @@
+import asyncio
+import json
+import unittest
+import urllib.request
+
+from common.metrics import LatencyHistogram, Metrics, start_metrics_server
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_quantiles(self):
+        """测试分位数按桶上界估算"""
+        histogram = LatencyHistogram()
+        for _ in range(90):
+            histogram.observe(3)
+        for _ in range(10):
+            histogram.observe(800)
+        self.assertEqual(histogram.quantile(0.5), 5)
+        self.assertEqual(histogram.quantile(0.95), 800)
+        self.assertEqual(histogram.snapshot()["count"], 100)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_timed_sync_and_async(self):
+        """测试装饰器同时支持普通函数和协程函数"""
+        metrics = Metrics()
+
+        @metrics.timed("sync")
+        def work():
+            return 1
+
+        @metrics.timed("async")
+        async def async_work():
+            return 2
+
+        self.assertEqual(work(), 1)
+        self.assertEqual(asyncio.run(async_work()), 2)
+        with metrics.timer("bot", "dify"):
+            pass
+        stages = metrics.snapshot()["stages"]
+        self.assertEqual(set(stages), {"sync", "async", "bot[dify]"})
+
+    def test_http_endpoint(self):
+        """测试指标接口返回json"""
+        server = start_metrics_server("127.0.0.1", 0)
+        try:
+            url = "http://127.0.0.1:{}/metrics".format(server.server_address[1])
+            with urllib.request.urlopen(url, timeout=5) as resp:
+                data = json.loads(resp.read().decode("utf-8"))
+            self.assertIn("stages", data)
+            self.assertIn("gauges", data)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
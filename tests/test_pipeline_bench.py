@@ -0,0 +1,32 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "benchmark"))
+
+import pipeline_bench  # noqa: E402
+from bridge.bridge import Bridge  # noqa: E402
+from config import conf  # noqa: E402
+
+
+class TestPipelineBench(unittest.TestCase):
+    def tearDown(self):
+        for key in ["model", "single_chat_prefix", "group_chat_prefix", "group_name_white_list", "concurrency_in_session",
+                    "handler_pool_size", "async_pipeline", "max_queued_contexts"]:
+            conf().pop(key, None)
+        pipeline_bench.logger.setLevel("INFO")
+        Bridge().bots.pop("chat", None)
+
+    def test_short_run(self):
+        """测试压测脚本可以离线跑完一轮并输出统计结果"""
+        args = pipeline_bench.build_parser().parse_args(
+            ["--rate", "200", "--duration", "0.3", "--latency", "fixed:1", "--send-latency", "", "--drain-timeout", "5"])
+        result = pipeline_bench.run(args)
+        self.assertGreater(result["produced"], 0)
+        self.assertEqual(result["completed"], result["produced"])
+        self.assertIsNotNone(result["latency_ms"]["p99"])
+        self.assertIn("compose", result["stages"])
+
+
+if __name__ == '__main__':
+    unittest.main()
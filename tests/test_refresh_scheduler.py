@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from common.refresh_scheduler import PRIORITY_HIGH, PRIORITY_LOW, RefreshScheduler
+
+
+class TestRefreshScheduler(unittest.TestCase):
+    def test_singleflight(self):
+        """测试同一个key排队或执行中时不会重复提交"""
+        calls = []
+
+        async def refresh():
+            calls.append("g")
+            await asyncio.sleep(0.01)
+
+        async def main():
+            scheduler = RefreshScheduler(concurrency=2, rate=0)
+            await scheduler.start()
+            self.assertTrue(scheduler.submit("g", refresh))
+            self.assertFalse(scheduler.submit("g", refresh))
+            await scheduler.join()
+            self.assertTrue(scheduler.submit("g", refresh))
+            await scheduler.join()
+            stats = scheduler.stats()
+            await scheduler.stop()
+            return stats
+
+        stats = asyncio.run(main())
+        self.assertEqual(calls, ["g", "g"])
+        self.assertEqual(stats["deduped"], 1)
+        self.assertEqual(stats["completed"], 2)
+
+    def test_priority_and_backlog(self):
+        """测试启动前提交的任务在启动后按优先级执行，单个任务出错不影响其他任务"""
+        order = []
+
+        def task(name, fail=False):
+            async def run():
+                if fail:
+                    raise RuntimeError("boom")
+                order.append(name)
+            return run
+
+        async def main():
+            scheduler = RefreshScheduler(concurrency=1, rate=0)
+            scheduler.submit("low", task("low"), PRIORITY_LOW)
+            scheduler.submit("bad", task("bad", fail=True), PRIORITY_HIGH)
+            scheduler.submit("high", task("high"), PRIORITY_HIGH)
+            await scheduler.start()
+            await scheduler.join()
+            stats = scheduler.stats()
+            await scheduler.stop()
+            return stats
+
+        stats = asyncio.run(main())
+        self.assertEqual(order, ["high", "low"])
+        self.assertEqual(stats["failed"], 1)
+
+    def test_rate_limit_and_thread_submit(self):
+        """测试其他线程提交的任务被执行，且任务开始间隔受rate限制"""
+        starts = []
+
+        async def refresh():
+            starts.append(time.monotonic())
+
+        async def main():
+            scheduler = RefreshScheduler(concurrency=3, rate=20)
+            await scheduler.start()
+            threads = [threading.Thread(target=scheduler.submit, args=("k{}".format(i), refresh)) for i in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            await asyncio.sleep(0)
+            await scheduler.join()
+            await scheduler.stop()
+
+        asyncio.run(main())
+        self.assertEqual(len(starts), 3)
+        self.assertGreaterEqual(starts[-1] - starts[0], 0.09)
+
+    def test_stop_drops_queued(self):
+        """测试停止后排队中的任务被丢弃，同一个key可以重新提交"""
+        calls = []
+
+        async def refresh():
+            calls.append("g")
+
+        async def main():
+            scheduler = RefreshScheduler(concurrency=1, rate=0)
+            scheduler.submit("g", refresh)
+            await scheduler.stop()
+            self.assertEqual(scheduler.stats()["inflight"], 0)
+            await scheduler.start()
+            self.assertTrue(scheduler.submit("g", refresh))
+            await scheduler.join()
+            await scheduler.stop()
+
+        asyncio.run(main())
+        self.assertEqual(calls, ["g"])
+
+
+if __name__ == "__main__":
+    unittest.main()
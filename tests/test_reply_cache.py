@@ -0,0 +1,144 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from bridge.bridge import Bridge
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from channel.chat_message import ChatMessage
+from common.reply_cache import ReplyCache, normalize_query
+from config import conf
+
+
+class CountingBot:
+    def __init__(self):
+        self.calls = 0
+
+    def reply(self, query, context=None):
+        self.calls += 1
+        return Reply(ReplyType.TEXT, "answer:" + query)
+
+
+class AsyncCountingBot(CountingBot):
+    async def async_reply(self, query, context=None):
+        return self.reply(query, context)
+
+
+class PartialBot(CountingBot):
+    """像dify流式回复一样，先通过通道发送第一段，只返回最后一段"""
+
+    def reply(self, query, context=None):
+        self.calls += 1
+        context["reply_parts_sent"] = True
+        context["channel"].send(Reply(ReplyType.TEXT, "part1"), context)
+        return Reply(ReplyType.TEXT, "part2")
+
+
+class SentChannel:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reply, context):
+        self.sent.append(reply.content)
+
+
+def group_context(content, group_name="FAQ群"):
+    msg = ChatMessage(None)
+    msg.other_user_nickname = group_name
+    return Context(ContextType.TEXT, content, kwargs={"isgroup": True, "msg": msg, "session_id": "s"})
+
+
+class TestReplyCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_normalize_query(self):
+        """测试问题规范化忽略大小写、空白和标点"""
+        self.assertEqual(normalize_query(" 怎么 部署Docker？"), normalize_query("怎么部署docker"))
+
+    def test_ttl_and_hits(self):
+        """测试缓存过期和命中统计"""
+        cache = ReplyCache(0.05, 10)
+        cache.put("k", "问题", Reply(ReplyType.TEXT, "回答"))
+        reply = cache.get("k")
+        self.assertEqual(reply.content, "回答")
+        reply.content = "被装饰修改"
+        self.assertEqual(cache.get("k").content, "回答")
+        self.assertEqual(cache.top(), [("问题", 2)])
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_persistence(self):
+        """测试缓存保存到文件后重新加载"""
+        path = os.path.join(self.tmpdir, "reply_cache.json")
+        cache = ReplyCache(60, 10, path)
+        cache.put("k", "问题", Reply(ReplyType.TEXT, "回答"))
+        cache.put("skip", "问题", Reply(ReplyType.IMAGE_URL, "http://x"))
+        cache.save()
+        cache = ReplyCache(60, 10, path)
+        self.assertEqual(cache.get("k").content, "回答")
+        self.assertIsNone(cache.get("skip"))
+
+
+class TestBridgeReplyCache(unittest.TestCase):
+    def setUp(self):
+        conf()["reply_cache"] = True
+        conf()["reply_cache_groups"] = ["FAQ群"]
+        conf()["model"] = "gpt-4o-mini"
+        self.bot = CountingBot()
+        Bridge().bots["chat"] = self.bot
+
+    def tearDown(self):
+        from common import reply_cache
+        if reply_cache._cache:
+            reply_cache._cache.clear()
+        for key in ["reply_cache", "reply_cache_groups", "model"]:
+            conf().pop(key, None)
+        Bridge().bots.pop("chat", None)
+
+    def test_whitelisted_group_hits_cache(self):
+        """测试白名单群中相同问题只请求一次bot"""
+        first = Bridge().fetch_reply_content("如何部署?", group_context("如何部署?"))
+        second = Bridge().fetch_reply_content("如何部署", group_context("如何部署"))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.bot.calls, 1)
+
+    def test_other_group_not_cached(self):
+        """测试不在白名单中的群不使用缓存"""
+        Bridge().fetch_reply_content("如何部署", group_context("如何部署", "闲聊群"))
+        Bridge().fetch_reply_content("如何部署", group_context("如何部署", "闲聊群"))
+        self.assertEqual(self.bot.calls, 2)
+
+    def test_partial_reply_not_cached(self):
+        """测试bot已自行发送部分回复时不缓存返回的最后一段"""
+        bot = PartialBot()
+        Bridge().bots["chat"] = bot
+        channel = SentChannel()
+        for _ in range(2):
+            context = group_context("如何部署")
+            context["channel"] = channel
+            self.assertEqual(Bridge().fetch_reply_content("如何部署", context).content, "part2")
+        self.assertEqual(bot.calls, 2)
+        self.assertEqual(channel.sent, ["part1", "part1"])
+
+    def test_async_fetch_uses_cache(self):
+        """测试异步获取回复同样经过缓存，并调用bot的async_reply"""
+        bot = AsyncCountingBot()
+        Bridge().bots["chat"] = bot
+        first = asyncio.run(Bridge().async_fetch_reply_content("如何部署", group_context("如何部署")))
+        second = asyncio.run(Bridge().async_fetch_reply_content("如何部署", group_context("如何部署")))
+        third = Bridge().fetch_reply_content("如何部署", group_context("如何部署"))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first.content, third.content)
+        self.assertEqual(bot.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
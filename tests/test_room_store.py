@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from common.room_store import RoomStore
+
+
+def member(wxid, nick="", display="", flag=0):
+    return {"UserName": wxid, "NickName": nick, "DisplayName": display, "ChatroomMemberFlag": flag}
+
+
+class TestRoomStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "rooms.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_member_index(self):
+        """测试按(群ID, wxid)查询成员，替换成员列表后旧成员被移除"""
+        store = RoomStore(self.path, flush_interval=0)
+        store.set_members("g@chatroom", [member("a", "阿A", "群昵称A", flag=2049), member("b", "阿B")])
+        self.assertEqual(store.member_name("g@chatroom", "a"), "群昵称A")
+        self.assertEqual(store.member_name("g@chatroom", "b"), "阿B")
+        self.assertEqual(store.get("g@chatroom")["chatRoomOwner"], "a")
+        self.assertEqual(store.group_name("g@chatroom"), "g@chatroom")
+
+        store.update_room("g@chatroom", nickName="测试群")
+        self.assertEqual(store.member_name("g@chatroom", "b"), "阿B")
+        store.set_members("g@chatroom", [member("c", "阿C")])
+        self.assertIsNone(store.member("g@chatroom", "a"))
+        self.assertEqual(store.group_name("g@chatroom"), "测试群")
+        store.close()
+
+    def test_is_fresh(self):
+        """测试缓存有效期和成员列表检查"""
+        store = RoomStore(self.path, flush_interval=0)
+        self.assertFalse(store.is_fresh("g", 60))
+        store.update_room("g", nickName="群")
+        self.assertTrue(store.is_fresh("g", 60))
+        self.assertFalse(store.is_fresh("g", 60, need_members=True))
+        store.update_room("g", last_update=int(time.time()) - 120)
+        self.assertFalse(store.is_fresh("g", 60))
+        store.close()
+
+    def test_write_behind(self):
+        """测试修改在flush时批量写入，重新打开后加载"""
+        store = RoomStore(self.path, flush_interval=0)
+        store.update_room("g1", nickName="群1")
+        store.set_members("g2", [member("a", "阿A")])
+        self.assertEqual(store.stats()["dirty"], 2)
+        self.assertEqual(store.flush(), 2)
+        self.assertEqual(store.flush(), 0)
+        store.close()
+
+        store = RoomStore(self.path, flush_interval=0)
+        self.assertEqual(store.group_name("g1"), "群1")
+        self.assertEqual(store.member_name("g2", "a"), "阿A")
+        store.close()
+
+    def test_import_legacy_json(self):
+        """测试首次启动时从旧版json文件迁移"""
+        legacy = os.path.join(self.tmpdir, "rooms.json")
+        with open(legacy, "w", encoding="utf-8") as f:
+            json.dump({"g": {"chatroomId": "g", "nickName": "旧群", "members": [member("a", "阿A")], "last_update": 1}}, f)
+        store = RoomStore(self.path, flush_interval=0, legacy_json=legacy)
+        self.assertEqual(store.group_name("g"), "旧群")
+        self.assertEqual(store.member_name("g", "a"), "阿A")
+        self.assertEqual(store.stats()["writes"], 1)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
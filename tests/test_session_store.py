@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession
+from bot.session_manager import SessionManager
+from common.session_store import MemorySessionStore, SqliteSessionStore
+from config import conf
+
+
+def make_session(session_id, turns=3):
+    session = ChatGPTSession(session_id, system_prompt="system", model="wenxin")
+    for i in range(turns):
+        session.add_query("query-{}".format(i))
+        session.add_reply("reply-{}".format(i))
+    return session
+
+
+class TestMemorySessionStore(unittest.TestCase):
+    def test_lru_eviction_by_bytes(self):
+        """测试超过内存上限时淘汰最久未使用的会话"""
+        store = MemorySessionStore(max_bytes=20000)
+        for i in range(1000):
+            store["u{}".format(i)] = make_session("u{}".format(i))
+            store.get("u0")  # 保持u0为最近使用
+        self.assertLessEqual(store.total_bytes, 20000)
+        self.assertIn("u0", store)
+        self.assertIn("u999", store)
+        self.assertNotIn("u1", store)
+        self.assertGreater(store.stats()["evictions"], 0)
+
+    def test_flat_memory_with_many_users(self):
+        """测试大量用户时内存占用保持在上限内"""
+        store = MemorySessionStore(max_bytes=1024 * 1024)
+        for i in range(100000):
+            store[i] = make_session(i, turns=1)
+        self.assertLessEqual(store.total_bytes, 1024 * 1024)
+        self.assertLess(len(store), 100000)
+
+    def test_size_cached_until_put(self):
+        """测试读取时不重新估算大小，put后更新"""
+        store = MemorySessionStore()
+        store["a"] = make_session("a")
+        size = store.total_bytes
+        store["a"].add_query("x" * 1000)
+        self.assertEqual(store.total_bytes, size)
+        store.put("a", store["a"])
+        self.assertGreater(store.total_bytes, size + 1000)
+
+
+class TestSqliteSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "sessions.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_sessions_survive_restart(self):
+        """测试会话写回数据库后重新打开仍能读取上下文"""
+        store = SqliteSessionStore(self.path, "ns", flush_interval=0)
+        store["a"] = make_session("a")
+        store["a"].add_query("after-set")
+        store.close()
+
+        store = SqliteSessionStore(self.path, "ns", flush_interval=0)
+        session = store["a"]
+        self.assertEqual(session.messages[-1]["content"], "after-set")
+        self.assertEqual(session.calc_tokens(), make_session("a").calc_tokens() + len("after-set"))
+        self.assertNotIn("a", SqliteSessionStore(self.path, "other", flush_interval=0))
+        store.close()
+
+    def test_evicted_sessions_are_loaded_lazily(self):
+        """测试从内存淘汰的会话在访问时从数据库加载"""
+        store = SqliteSessionStore(self.path, "ns", max_bytes=5000, flush_interval=0)
+        for i in range(50):
+            store["u{}".format(i)] = make_session("u{}".format(i))
+        self.assertLess(store.stats()["sessions"], 50)
+        store.flush()
+        self.assertEqual(len(store), 50)
+        self.assertEqual(store["u0"].messages[1]["content"], "query-0")
+        self.assertGreater(store.stats()["loads"], 0)
+        del store["u0"]
+        self.assertNotIn("u0", store)
+        store.close()
+
+    def test_reads_do_not_mark_dirty(self):
+        """测试只读取的会话不会写回，keys返回原始key"""
+        store = SqliteSessionStore(self.path, "ns", flush_interval=0)
+        store[1] = make_session(1)
+        store["b"] = make_session("b")
+        self.assertEqual(store.flush(), 2)
+        self.assertIn(1, store)
+        store.get(1)
+        self.assertEqual(store.flush(), 0)
+        store.put(1, store[1])
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(sorted(store.keys(), key=str), [1, "b"])
+        store.close()
+
+
+class TestSessionManagerStore(unittest.TestCase):
+    def tearDown(self):
+        for key in ["session_store", "session_store_path", "session_store_flush_interval"]:
+            conf().pop(key, None)
+
+    def test_session_manager_with_sqlite(self):
+        """测试SessionManager使用sqlite存储时重建后保留上下文"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+        conf()["session_store"] = "sqlite"
+        conf()["session_store_path"] = os.path.join(tmpdir, "sessions.db")
+        conf()["session_store_flush_interval"] = 0
+        manager = SessionManager(ChatGPTSession, model="wenxin")
+        manager.session_query("hello", "user")
+        manager.session_reply("hi", "user")
+        manager.sessions.close()
+
+        manager = SessionManager(ChatGPTSession, model="wenxin")
+        contents = [m["content"] for m in manager.build_session("user").messages]
+        self.assertEqual(contents[-2:], ["hello", "hi"])
+        manager.sessions.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import random
+import unittest
+
+from common.sorted_dict import SortedDict
+
+
+class Plugin:
+    def __init__(self, priority):
+        self.priority = priority
+
+
+class TestSortedDict(unittest.TestCase):
+    def test_order_matches_full_sort(self):
+        """测试随机增删改后顺序与整体排序一致"""
+        rnd = random.Random(1)
+        d = SortedDict(lambda k, v: v, reverse=True)
+        expected = {}
+        for _ in range(2000):
+            key = "k{}".format(rnd.randrange(100))
+            if key in expected and rnd.random() < 0.3:
+                del d[key]
+                del expected[key]
+            else:
+                d[key] = expected[key] = rnd.randrange(20)
+            if rnd.random() < 0.1:
+                self.assertEqual(d.keys(), [k for _, k in sorted(((v, k) for k, v in expected.items()), reverse=True)])
+        self.assertEqual(d.keys(), [k for _, k in sorted(((v, k) for k, v in expected.items()), reverse=True)])
+
+    def test_update_heap_after_inplace_change(self):
+        """测试value原地修改后通过_update_heap更新顺序"""
+        d = SortedDict(lambda k, v: v.priority, reverse=True)
+        for name, priority in [("A", 1), ("B", 5), ("C", 3)]:
+            d[name] = Plugin(priority)
+        self.assertEqual(d.keys(), ["B", "C", "A"])
+        d["A"].priority = 10
+        d._update_heap("A")
+        self.assertEqual(list(d), ["A", "B", "C"])
+        self.assertEqual([k for k, _ in d.items()], ["A", "B", "C"])
+
+    def test_ordered_view_is_cached(self):
+        """测试没有修改时有序视图不会重新生成"""
+        d = SortedDict(lambda k, v: v, {"a": 2, "b": 1})
+        view = d.keys()
+        d["a"] = 2
+        self.assertIs(d.keys(), view)
+        d._update_heap("b")
+        self.assertIs(d.keys(), view)
+        d["c"] = 0
+        self.assertEqual(d.keys(), ["c", "b", "a"])
+
+
+if __name__ == '__main__':
+    unittest.main()
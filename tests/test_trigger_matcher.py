@@ -0,0 +1,49 @@
+import random
+import unittest
+
+from channel.chat_channel import check_contain, check_prefix
+from common.trigger_matcher import AhoCorasick, PrefixMatcher, get_trigger_matcher, strip_mention
+from config import conf
+
+
+class TestTriggerMatcher(unittest.TestCase):
+    def test_same_result_as_linear_scan(self):
+        """测试字典树和自动机的匹配结果与逐个扫描一致"""
+        rng = random.Random(7)
+        alphabet = "ab@#c"
+        for _ in range(300):
+            words = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 3))) for _ in range(rng.randint(0, 5))]
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+            self.assertEqual(PrefixMatcher(words).match(text), check_prefix(text, words), (words, text))
+            self.assertEqual(AhoCorasick(words).contains(text), bool(check_contain(text, words)), (words, text))
+
+    def test_overlapping_keywords(self):
+        """测试关键词相互包含时能通过失败指针匹配"""
+        automaton = AhoCorasick(["she", "he", "hers"])
+        self.assertEqual(automaton.search("ushers"), "she")
+        self.assertIsNone(automaton.search("shx"))
+
+    def test_skip_empty_prefix(self):
+        """测试忽略空前缀"""
+        matcher = PrefixMatcher(["", "bot", "b"])
+        self.assertEqual(matcher.match("bot hi"), "")
+        self.assertEqual(matcher.match("bot hi", skip_empty=True), "bot")
+
+    def test_strip_mention(self):
+        """测试移除@昵称"""
+        self.assertEqual(strip_mention("@小助手 你好", "小助手"), "你好")
+        self.assertEqual(strip_mention("@a.b 你好", "a.b"), "你好")
+
+    def test_rebuilt_on_config_change(self):
+        """测试配置修改后重新构建"""
+        conf()["group_chat_prefix"] = ["@bot"]
+        try:
+            self.assertEqual(get_trigger_matcher().group_chat_prefix.match("@bot hi"), "@bot")
+            conf()["group_chat_prefix"] = ["ai"]
+            self.assertIsNone(get_trigger_matcher().group_chat_prefix.match("@bot hi"))
+        finally:
+            conf().pop("group_chat_prefix", None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import itertools
+import time
+import unittest
+
+from config import conf
+
+try:
+    from aiohttp.test_utils import TestClient, TestServer
+    from channel.wx849.wx849_channel import WX849Channel
+except ImportError:  # 未安装aiohttp或wx849的依赖
+    WX849Channel = None
+
+_msg_ids = itertools.count(1)
+
+
+def private_message(sender="wxid_a", content="hi"):
+    return {"MsgId": next(_msg_ids), "FromUserName": sender, "ToUserName": "wxid_bot", "Content": content,
+            "MsgType": 1, "CreateTime": int(time.time())}
+
+
+class RawMessageBot:
+    """模拟WechatAPIClient._process_message，把AddMsgs中的原始消息转换为get_new_message的格式"""
+
+    def _process_message(self, msg):
+        return {"msgid": msg["MsgId"], "fromUserName": msg["FromUserName"]["string"],
+                "toUserName": msg["ToUserName"]["string"], "content": msg["Content"]["string"],
+                "type": msg["MsgType"], "timestamp": msg["CreateTime"]}
+
+
+@unittest.skipIf(WX849Channel is None, "aiohttp or wx849 dependencies are not installed")
+class TestWX849Callback(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        conf()["wx849_callback_key"] = "secret"
+        self.channel = WX849Channel()
+        self.handled = []
+
+        async def handle_single(cmsg):
+            self.handled.append(cmsg.content)
+
+        self.channel.handle_single = handle_single
+        self.channel.bot = RawMessageBot()
+        self.client = TestClient(TestServer(self.channel._create_callback_app()))
+        await self.client.start_server()
+        self.path = conf().get("wx849_callback_path", "/wx849/callback")
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        del self.channel.handle_single
+        self.channel.bot = None
+        conf().pop("wx849_callback_key", None)
+
+    async def post(self, payload=None, key="secret", data=None):
+        headers = {"X-Callback-Key": key} if key is not None else {}
+        if data is not None:
+            return await self.client.post(self.path, data=data, headers=headers)
+        return await self.client.post(self.path, json=payload, headers=headers)
+
+    async def test_invalid_key(self):
+        """测试缺少或错误的key返回403"""
+        for key in [None, "wrong"]:
+            resp = await self.post([private_message()], key=key)
+            self.assertEqual(resp.status, 403)
+        self.assertEqual(self.handled, [])
+
+    async def test_key_in_query(self):
+        """测试key也可以通过查询参数传递"""
+        resp = await self.client.post(self.path + "?key=secret", json=[private_message(content="q")])
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(self.handled, ["q"])
+
+    async def test_invalid_json(self):
+        """测试无法解析的请求体返回400"""
+        resp = await self.post(data="not json")
+        self.assertEqual(resp.status, 400)
+
+    async def test_payload_shapes(self):
+        """测试消息列表、{"messages": [...]}和{"Data": {"AddMsgs": [...]}}三种格式"""
+        raw = {"MsgId": next(_msg_ids), "FromUserName": {"string": "wxid_c"}, "ToUserName": {"string": "wxid_bot"},
+               "Content": {"string": "raw"}, "MsgType": 1, "CreateTime": int(time.time())}
+        for payload in [[private_message(content="list")], {"messages": [private_message(content="dict")]},
+                        {"Data": {"AddMsgs": [raw]}}]:
+            resp = await self.post(payload)
+            self.assertEqual(resp.status, 200)
+            self.assertEqual((await resp.json())["count"], 1)
+        self.assertEqual(self.handled, ["list", "dict", "raw"])
+
+    async def test_duplicate_push_ignored(self):
+        """测试推送的消息经过_dispatch_messages过滤，重复推送的消息只处理一次"""
+        msg = private_message(content="once")
+        for _ in range(2):
+            resp = await self.post([msg])
+            self.assertEqual(resp.status, 200)
+        self.assertEqual(self.handled, ["once"])
+
+
+if __name__ == '__main__':
+    unittest.main()
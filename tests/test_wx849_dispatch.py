@@ -0,0 +1,63 @@
+import asyncio
+import itertools
+import time
+import unittest
+
+from config import conf
+
+try:
+    from channel.wx849.wx849_channel import WX849Channel
+except ImportError:  # 未安装wx849的依赖
+    WX849Channel = None
+
+_msg_ids = itertools.count(100000)
+
+
+def group_message(room_id, content):
+    return {"msgid": next(_msg_ids), "roomId": room_id, "fromUserName": room_id, "toUserName": "wxid_bot",
+            "senderId": "wxid_a", "content": content, "type": 1, "timestamp": int(time.time())}
+
+
+@unittest.skipIf(WX849Channel is None, "wx849 dependencies are not installed")
+class TestWX849Dispatch(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        conf()["wx849_dispatch_concurrency"] = 2
+        self.channel = WX849Channel()
+        self.channel.dispatch_semaphore = None  # 信号量属于创建它的事件循环，每个测试重新创建
+        self.events = []  # (事件, 群, 内容, 时间)
+        self.active = 0
+        self.max_active = 0
+
+        async def handle_group(cmsg):
+            room_id = cmsg.msg["roomId"]
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.events.append(("start", room_id, cmsg.content, time.monotonic()))
+            await asyncio.sleep(0.05)
+            self.events.append(("end", room_id, cmsg.content, time.monotonic()))
+            self.active -= 1
+
+        self.channel.handle_group = handle_group
+
+    async def asyncTearDown(self):
+        del self.channel.handle_group
+        self.channel.dispatch_semaphore = None
+        conf().pop("wx849_dispatch_concurrency", None)
+
+    async def test_order_and_concurrency(self):
+        """测试同一会话按顺序处理，其他会话不被阻塞，同时处理的会话数不超过wx849_dispatch_concurrency"""
+        messages = [group_message("g1@chatroom", str(i)) for i in range(3)]
+        messages.insert(1, group_message("g2@chatroom", "a"))
+        messages.append(group_message("g3@chatroom", "b"))
+        await self.channel._dispatch_messages(messages)
+
+        g1 = [(event, content) for event, room_id, content, _ in self.events if room_id == "g1@chatroom"]
+        self.assertEqual(g1, [("start", "0"), ("end", "0"), ("start", "1"), ("end", "1"), ("start", "2"), ("end", "2")])
+        self.assertEqual(self.max_active, 2)
+        end_times = {(room_id, content): at for event, room_id, content, at in self.events if event == "end"}
+        self.assertLess(end_times[("g2@chatroom", "a")], end_times[("g1@chatroom", "2")])
+        self.assertLess(end_times[("g3@chatroom", "b")], end_times[("g1@chatroom", "2")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    from lib.wx849.WechatAPI.http_session import ApiSession
+except ImportError:  # 未安装aiohttp或wx849的依赖
+    ApiSession = None
+
+
+async def ok(request):
+    return web.json_response({"Success": True})
+
+
+async def fail(request):
+    return web.json_response({"Success": False}, status=500)
+
+
+async def slow(request):
+    await asyncio.sleep(0.5)
+    return web.json_response({"Success": True})
+
+
+@unittest.skipIf(ApiSession is None, "aiohttp or wx849 dependencies are not installed")
+class TestApiSession(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        app = web.Application()
+        app.router.add_post("/api/Msg/Sync", ok)
+        app.router.add_post("/api/Msg/Fail", fail)
+        app.router.add_post("/api/Msg/Slow", slow)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.api = ApiSession(timeout=0.1, media_timeout=5)
+
+    async def asyncTearDown(self):
+        await self.api.close()
+        await self.server.close()
+
+    async def test_session_reused_per_loop(self):
+        """测试同一事件循环复用会话，关闭后重新创建，不同事件循环使用各自的会话"""
+        first = self.api.get()
+        self.assertIs(self.api.get(), first)
+        async with self.api.session() as session:
+            self.assertIs(session._session, first)
+        self.assertFalse(first.closed)  # 退出上下文时不关闭共享会话
+
+        await self.api.close()
+        self.assertTrue(first.closed)
+        self.assertIsNot(self.api.get(), first)
+
+        async def other_loop_session():
+            session = self.api.get()
+            await self.api.close()
+            return session
+
+        other = await asyncio.get_running_loop().run_in_executor(None, asyncio.run, other_loop_session())
+        self.assertIsNot(other, self.api.get())
+
+    def test_media_timeout(self):
+        """测试上传下载媒体的接口使用媒体超时时间，其他接口使用普通超时时间"""
+        self.assertEqual(self.api.timeout_for("http://127.0.0.1/api/Msg/Sync").total, 0.1)
+        for path in ["/api/Tools/DownloadImg", "/api/Msg/UploadImg", "/api/Msg/SendVideo", "/api/Tools/CdnDownloadImage"]:
+            self.assertEqual(self.api.timeout_for("http://127.0.0.1" + path).total, 5)
+        self.api.configure(timeout=2)
+        self.assertEqual(self.api.timeout_for("http://127.0.0.1/api/Msg/Sync").total, 2)
+
+    async def test_endpoint_stats(self):
+        """测试按接口统计请求数和错误数，未指定timeout的请求使用按接口的超时时间"""
+        async with self.api.session() as session:
+            for _ in range(2):
+                response = await session.post(self.server.make_url("/api/Msg/Sync"), json={})
+                self.assertTrue((await response.json())["Success"])
+            response = await session.post(self.server.make_url("/api/Msg/Fail"), json={})
+            await response.read()
+            with self.assertRaises(asyncio.TimeoutError):
+                await session.post(self.server.make_url("/api/Msg/Slow"), json={})
+        stats = self.api.stats()
+        self.assertEqual((stats["/api/Msg/Sync"]["requests"], stats["/api/Msg/Sync"]["errors"]), (2, 0))
+        self.assertEqual((stats["/api/Msg/Fail"]["requests"], stats["/api/Msg/Fail"]["errors"]), (1, 1))
+        self.assertEqual((stats["/api/Msg/Slow"]["requests"], stats["/api/Msg/Slow"]["errors"]), (1, 1))
+        self.assertLess(stats["/api/Msg/Slow"]["max_ms"], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
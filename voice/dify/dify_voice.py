@@ -1,7 +1,7 @@
 import os
-import requests
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common import http_client
 from config import conf
 from voice.voice import Voice
 from voice.audio_convert import any_to_mp3
@@ -25,7 +25,7 @@ class DifyVoice(Voice):
             headers = {
                 'Authorization': 'Bearer ' + conf().get("dify_api_key")
             }
-            response = requests.post(
+            response = http_client.post(
                 f'{conf().get("dify_api_base")}/audio-to-text',
                 headers=headers,
                 files=files
@@ -52,7 +52,7 @@ class DifyVoice(Voice):
                 'Authorization': 'Bearer ' + conf().get("dify_api_key")
             }
             #TODO: raise and log response
-            response = requests.post(
+            response = http_client.post(
                 f'{conf().get("dify_api_base")}/text-to-audio',
                 headers=headers,
                 json=data
@@ -7,9 +7,9 @@ import openai
 
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common import http_client
 from config import conf
 from voice.voice import Voice
-import requests
 from common import const
 import datetime, random
 
@@ -34,7 +34,7 @@ class OpenaiVoice(Voice):
             data = {
                 "model": "whisper-1",
             }
-            response = requests.post(url, headers=headers, files=files, data=data)
+            response = http_client.post(url, headers=headers, files=files, data=data)
             response_data = response.json()
             text = response_data['text']
             reply = Reply(ReplyType.TEXT, text)
@@ -58,7 +58,7 @@ class OpenaiVoice(Voice):
                 'input': text,
                 'voice': conf().get("tts_voice_id") or "alloy"
             }
-            response = requests.post(url, headers=headers, json=data)
+            response = http_client.post(url, headers=headers, json=data)
             file_name = "tmp/" + datetime.datetime.now().strftime('%Y%m%d%H%M%S') + str(random.randint(0, 1000)) + ".mp3"
             logger.debug(f"[OPENAI] text_to_Voice file_name={file_name}, input={text}")
             with open(file_name, 'wb') as f: